@@ -0,0 +1,87 @@
+"""
+表格驱动批量采集 API 路由
+"""
+from fastapi import APIRouter
+
+from app.models.schemas import BulkCrawlRequest, BulkJobResponse
+from app.services.apikey_validator import validate_api_key
+from app.services.bulk_crawl import bulk_crawl_manager
+from app.services.cookie_check import cookie_checker
+from app.services.xhs_collector import parse_feishu_table_url
+
+
+router = APIRouter(prefix="/bulk")
+
+
+@router.post("/jobs", response_model=BulkJobResponse)
+async def create_bulk_job(request: BulkCrawlRequest) -> BulkJobResponse:
+    """
+    创建批量采集任务
+
+    - 验证 API Key
+    - 分页读取源表，逐行采集博主主页或关键词
+    - 结果写入结果表，采集状态批量回写到源表
+    - 立即返回任务 ID，通过 GET /bulk/jobs/{jobId} 查询进度
+    """
+    cookie_verdict = cookie_checker.known_invalid(request.platform, request.cookie)
+    if cookie_verdict:
+        return BulkJobResponse(
+            success=False,
+            code=401,
+            message="Cookie 已失效，请重新获取",
+            error=cookie_verdict.message
+        )
+
+    try:
+        source = parse_feishu_table_url(request.sourceTableUrl)
+        target = parse_feishu_table_url(request.biaogelianjie)
+    except ValueError as e:
+        return BulkJobResponse(
+            success=False,
+            code=400,
+            message="飞书表格链接格式错误",
+            error=str(e)
+        )
+
+    validation_result = await validate_api_key(request.apiKey)
+
+    if not validation_result.success:
+        return BulkJobResponse(
+            success=False,
+            code=validation_result.code,
+            message=validation_result.message,
+            error=validation_result.error
+        )
+    request.maxNotes = validation_result.limit("maxNotes", request.maxNotes)
+
+    job = bulk_crawl_manager.submit(request, source, target, validation_result.limits)
+    return BulkJobResponse(
+        success=True,
+        code=0,
+        message="批量采集任务已创建",
+        jobId=job.job_id,
+        job=job.to_dict()
+    )
+
+
+@router.get("/jobs")
+async def list_bulk_jobs():
+    """批量采集任务列表（最新在前）"""
+    return {"jobs": [job.to_dict() for job in bulk_crawl_manager.list()]}
+
+
+@router.get("/jobs/{job_id}", response_model=BulkJobResponse)
+async def get_bulk_job(job_id: str) -> BulkJobResponse:
+    """查询批量采集任务进度"""
+    job = bulk_crawl_manager.get(job_id)
+    if not job:
+        return BulkJobResponse(success=False, code=404, message="任务不存在", jobId=job_id)
+    return BulkJobResponse(success=True, code=0, message=job.status, jobId=job_id, job=job.to_dict())
+
+
+@router.post("/jobs/{job_id}/cancel", response_model=BulkJobResponse)
+async def cancel_bulk_job(job_id: str) -> BulkJobResponse:
+    """取消批量采集任务（已调度的行会被中断）"""
+    if not bulk_crawl_manager.cancel(job_id):
+        return BulkJobResponse(success=False, code=404, message="任务不存在或已结束", jobId=job_id)
+    return BulkJobResponse(success=True, code=0, message="任务已取消", jobId=job_id)
@@ -1,6 +1,8 @@
 """
 采集 API 路由
 """
+from typing import Optional
+
 from fastapi import APIRouter
 
 from app.core.config import settings
@@ -11,18 +13,35 @@ from app.models.schemas import (
     ProfileInfoCollectRequest,
     KeywordCollectRequest,
 )
-from app.services.apikey_validator import validate_api_key
+from app.services.apikey_validator import SpeculativeValidation
+from app.services.cookie_check import cookie_checker
+from app.services.cookie_rate import CookieInvalidError
 from app.services.xhs_collector import XhsCollector, parse_feishu_table_url
+from app.services.fair_scheduler import fair_scheduler
+from app.services.note_filter import missing_note_fields
 from app.services.feishu_writer import write_to_feishu
+from app.services.feishu_write_queue import write_queue
+from app.services.request_deadline import RequestDeadline
+from app.services.sinks import GatedSink, build_sink, sink_message
 
 
 router = APIRouter()
 
 
-async def _write_records_if_needed(app_token: str, table_id: str, records, write_enabled: bool) -> tuple:
+async def _write_records_if_needed(
+    app_token: str,
+    table_id: str,
+    records,
+    write_enabled: bool,
+    write_behind: Optional[bool] = None,
+    deadline: Optional[RequestDeadline] = None
+) -> tuple:
     write_success = None
     write_count = 0
+    write_queued = 0
     message_suffix = ""
+    if write_behind is None:
+        write_behind = settings.FEISHU_WRITE_BEHIND
 
     if write_enabled and records:
         try:
@@ -30,20 +49,69 @@ async def _write_records_if_needed(app_token: str, table_id: str, records, write
                 record.dict() if hasattr(record, "dict") else record
                 for record in records
             ]
-            write_result = await write_to_feishu(app_token, table_id, records_dict)
+            if deadline and deadline.limited and deadline.write_remaining() < 1.0:
+                # 时间预算内已来不及同步写入，改为后台写入
+                write_behind = True
+            if write_behind:
+                write_queued = await write_queue.enqueue(app_token, table_id, records_dict)
+                write_success = True
+                return write_success, write_count, f"，已加入飞书写入队列 {write_queued} 条", write_queued
+
+            if deadline:
+                write_result = await deadline.run(write_to_feishu(app_token, table_id, records_dict))
+            else:
+                write_result = await write_to_feishu(app_token, table_id, records_dict)
 
             write_success = write_result.get("success", False)
             write_count = write_result.get("totalSuccess", 0)
+            # 时间预算内来不及写入的批次已转入写入队列
+            write_queued = write_result.get("totalQueued", 0)
 
             if write_success:
                 message_suffix = f"，已写入飞书 {write_count} 条"
+                if write_queued:
+                    message_suffix += f"，{write_queued} 条已加入飞书写入队列"
             else:
                 message_suffix = f"，写入飞书失败: {write_result.get('message', '未知错误')}"
         except Exception as e:
             write_success = False
             message_suffix = f"，写入飞书异常: {str(e)}"
 
-    return write_success, write_count, message_suffix
+    return write_success, write_count, message_suffix, write_queued
+
+
+def _validation_failed(validation_result) -> CollectResponse:
+    return CollectResponse(
+        success=False,
+        code=validation_result.code,
+        message=validation_result.message,
+        error=validation_result.error
+    )
+
+
+def _known_bad_cookie(cookie: str) -> Optional[CollectResponse]:
+    """Cookie 已知失效（缓存的检查结论）时直接拒绝"""
+    verdict = cookie_checker.known_invalid("xhs", cookie)
+    if not verdict:
+        return None
+    return CollectResponse(
+        success=False,
+        code=401,
+        message="Cookie 已失效，请重新获取",
+        error=f"{verdict.message}（缓存的 Cookie 检查结论，更换 Cookie 后重试）"
+    )
+
+
+def _record_collector(sink) -> tuple:
+    """逐条保存已采集的记录（时间预算用完时作为部分结果返回），同时转发给输出目标"""
+    collected = []
+
+    async def on_record(record):
+        collected.append(record)
+        if sink:
+            await sink.write(record)
+
+    return collected, on_record
 
 
 @router.post("/collect", response_model=CollectResponse)
@@ -52,24 +120,15 @@ async def collect_notes(request: CollectRequest) -> CollectResponse:
     采集小红书博主笔记
     
     - 验证 API Key
-    - 请求博主主页
-    - 提取笔记列表
+    - 请求博主主页，首页笔记取自主页数据，后续页通过笔记列表 API 获取
     - 循环采集笔记详情
     - 返回飞书表格记录格式的数据
     """
+    cookie_rejection = _known_bad_cookie(request.cookie)
+    if cookie_rejection:
+        return cookie_rejection
     
-    # 1. 验证 API Key
-    validation_result = await validate_api_key(request.apiKey)
-    
-    if not validation_result.success:
-        return CollectResponse(
-            success=False,
-            code=validation_result.code,
-            message=validation_result.message,
-            error=validation_result.error
-        )
-    
-    # 2. 解析飞书表格链接
+    # 1. 解析飞书表格链接（本地校验先于 API Key 验证）
     try:
         app_token, table_id = parse_feishu_table_url(request.biaogelianjie)
     except ValueError as e:
@@ -80,16 +139,50 @@ async def collect_notes(request: CollectRequest) -> CollectResponse:
             error=str(e)
         )
     
-    # 3. 创建采集器
+    # 2. 创建采集器
     user_agent = request.userAgent or settings.DEFAULT_USER_AGENT
     collector = XhsCollector(cookie=request.cookie, user_agent=user_agent)
     
-    # 4. 执行采集
+    # 3. 创建输出
     try:
-        records, success_count, fail_count, failed_note_ids = await collector.collect_all_notes(
-            profile_url=request.bozhulianjie,
-            max_notes=request.maxNotes
+        sink = build_sink(request.sinks, "xhs-profile", request.writeBehind) if request.sinks else None
+    except ValueError as e:
+        return CollectResponse(
+            success=False,
+            code=400,
+            message="输出配置错误",
+            appToken=app_token,
+            tableId=table_id,
+            error=str(e)
         )
+
+    # 4. 验证 API Key 与采集并发进行，输出与写入等待验证通过
+    validation = SpeculativeValidation(request.apiKey)
+    sink = GatedSink(sink, validation.wait) if sink else None
+    max_notes = await validation.limit("maxNotes", request.maxNotes)
+    deadline = RequestDeadline(request.deadlineMs)
+    collected, on_record = _record_collector(sink)
+
+    try:
+        try:
+            validation_result, result = await validation.run(deadline.guard(fair_scheduler.run(
+                request.apiKey,
+                collector.collect_all_notes(
+                    profile_url=request.bozhulianjie,
+                    max_notes=max_notes,
+                    mode=request.mode,
+                    note_filter=request.filters,
+                    on_record=on_record
+                ),
+                cost=max_notes,
+                limits=await validation.limits()
+            ), fallback=lambda: (list(collected), len(collected), 0, [])))
+        finally:
+            sink_results = await sink.close() if sink else []
+
+        if not validation_result.success:
+            return _validation_failed(validation_result)
+        records, success_count, fail_count, failed_note_ids = result
         
         # 5. 构建响应
         if success_count == 0 and fail_count > 0:
@@ -107,15 +200,27 @@ async def collect_notes(request: CollectRequest) -> CollectResponse:
         message = f"成功采集 {success_count} 条笔记"
         if fail_count > 0:
             message += f"，{fail_count} 条失败"
+        if collector.filtered_count:
+            message += f"，{collector.filtered_count} 条详情不符合筛选条件"
+
+        missing_fields = []
+        if request.mode == "list":
+            message += "（列表模式）"
+            missing_fields = missing_note_fields(records)
         
         # 6. 如果需要写入飞书表格
-        write_success, write_count, write_message = await _write_records_if_needed(
+        write_success, write_count, write_message, write_queued = await _write_records_if_needed(
             app_token,
             table_id,
             records,
-            request.writeToFeishu
+            request.writeToFeishu,
+            request.writeBehind,
+            deadline
         )
+        if deadline.partial:
+            message += "（时间预算用完，返回部分结果）"
         message += write_message
+        message += sink_message(sink_results)
         
         return CollectResponse(
             success=True,
@@ -126,7 +231,12 @@ async def collect_notes(request: CollectRequest) -> CollectResponse:
             records=records,
             totalCount=success_count,
             writeSuccess=write_success,
-            writeCount=write_count
+            writeCount=write_count,
+            writeQueued=write_queued,
+            sinkResults=sink_results,
+            missingFields=missing_fields,
+            partial=deadline.partial,
+            filtered=collector.filtered_count
         )
         
     except Exception as e:
@@ -134,6 +244,9 @@ async def collect_notes(request: CollectRequest) -> CollectResponse:
         
         # 识别常见错误
         if "Cookie" in error_msg or "__INITIAL_STATE__" in error_msg:
+            if isinstance(e, CookieInvalidError):
+                # 只缓存上游明确返回的失效结论，验证页等临时错误不锁定 Cookie
+                cookie_checker.mark_invalid("xhs", request.cookie, error_msg)
             return CollectResponse(
                 success=False,
                 code=401,
@@ -163,15 +276,9 @@ async def collect_single_note(request: SingleNoteCollectRequest) -> CollectRespo
     - 请求笔记详情
     - 返回飞书表格记录格式的数据
     """
-    validation_result = await validate_api_key(request.apiKey)
-
-    if not validation_result.success:
-        return CollectResponse(
-            success=False,
-            code=validation_result.code,
-            message=validation_result.message,
-            error=validation_result.error
-        )
+    cookie_rejection = _known_bad_cookie(request.cookie)
+    if cookie_rejection:
+        return cookie_rejection
 
     try:
         app_token, table_id = parse_feishu_table_url(request.biaogelianjie)
@@ -186,19 +293,29 @@ async def collect_single_note(request: SingleNoteCollectRequest) -> CollectRespo
     user_agent = request.userAgent or settings.DEFAULT_USER_AGENT
     collector = XhsCollector(cookie=request.cookie, user_agent=user_agent)
 
-    try:
+    async def fetch_note():
         note_info = await collector.build_note_info_from_url(request.bijilianjie)
-        feed_data = await collector.fetch_note_detail(note_info)
-        record = collector.process_note_detail(feed_data, note_info)
+        return await collector.collect_note_record(note_info)
+
+    # 验证 API Key 与笔记请求并发进行，写入等待验证通过
+    validation = SpeculativeValidation(request.apiKey)
+
+    try:
+        validation_result, record = await validation.run(
+            fair_scheduler.run(request.apiKey, fetch_note(), limits=await validation.limits())
+        )
+        if not validation_result.success:
+            return _validation_failed(validation_result)
 
         records = [record]
         message = "成功采集 1 条笔记"
 
-        write_success, write_count, write_message = await _write_records_if_needed(
+        write_success, write_count, write_message, write_queued = await _write_records_if_needed(
             app_token,
             table_id,
             records,
-            request.writeToFeishu
+            request.writeToFeishu,
+            request.writeBehind
         )
         message += write_message
 
@@ -211,7 +328,8 @@ async def collect_single_note(request: SingleNoteCollectRequest) -> CollectRespo
             records=records,
             totalCount=1,
             writeSuccess=write_success,
-            writeCount=write_count
+            writeCount=write_count,
+            writeQueued=write_queued
         )
     except ValueError as e:
         return CollectResponse(
@@ -226,6 +344,9 @@ async def collect_single_note(request: SingleNoteCollectRequest) -> CollectRespo
         error_msg = str(e)
 
         if "Cookie" in error_msg or "__INITIAL_STATE__" in error_msg:
+            if isinstance(e, CookieInvalidError):
+                # 只缓存上游明确返回的失效结论，验证页等临时错误不锁定 Cookie
+                cookie_checker.mark_invalid("xhs", request.cookie, error_msg)
             return CollectResponse(
                 success=False,
                 code=401,
@@ -251,19 +372,13 @@ async def collect_profile_info(request: ProfileInfoCollectRequest) -> CollectRes
     采集小红书博主信息
 
     - 验证 API Key
-    - 请求博主主页
+    - 请求博主主页（与主页笔记采集共用主页快照）
     - 提取博主信息
     - 返回飞书表格记录格式的数据
     """
-    validation_result = await validate_api_key(request.apiKey)
-
-    if not validation_result.success:
-        return CollectResponse(
-            success=False,
-            code=validation_result.code,
-            message=validation_result.message,
-            error=validation_result.error
-        )
+    cookie_rejection = _known_bad_cookie(request.cookie)
+    if cookie_rejection:
+        return cookie_rejection
 
     try:
         app_token, table_id = parse_feishu_table_url(request.biaogelianjie)
@@ -278,18 +393,25 @@ async def collect_profile_info(request: ProfileInfoCollectRequest) -> CollectRes
     user_agent = request.userAgent or settings.DEFAULT_USER_AGENT
     collector = XhsCollector(cookie=request.cookie, user_agent=user_agent)
 
+    # 验证 API Key 与主页请求并发进行，写入等待验证通过
+    validation = SpeculativeValidation(request.apiKey)
+
     try:
-        html_content, clean_url = await collector.fetch_homepage_html(request.bozhulianjie)
-        record = collector.extract_user_profile(html_content, clean_url)
+        validation_result, record = await validation.run(
+            fair_scheduler.run(request.apiKey, collector.collect_creator_profile(request.bozhulianjie), limits=await validation.limits())
+        )
+        if not validation_result.success:
+            return _validation_failed(validation_result)
 
         records = [record]
         message = "成功采集 1 条博主信息"
 
-        write_success, write_count, write_message = await _write_records_if_needed(
+        write_success, write_count, write_message, write_queued = await _write_records_if_needed(
             app_token,
             table_id,
             records,
-            request.writeToFeishu
+            request.writeToFeishu,
+            request.writeBehind
         )
         message += write_message
 
@@ -302,7 +424,8 @@ async def collect_profile_info(request: ProfileInfoCollectRequest) -> CollectRes
             records=records,
             totalCount=1,
             writeSuccess=write_success,
-            writeCount=write_count
+            writeCount=write_count,
+            writeQueued=write_queued
         )
     except ValueError as e:
         return CollectResponse(
@@ -317,6 +440,9 @@ async def collect_profile_info(request: ProfileInfoCollectRequest) -> CollectRes
         error_msg = str(e)
 
         if "Cookie" in error_msg or "__INITIAL_STATE__" in error_msg:
+            if isinstance(e, CookieInvalidError):
+                # 只缓存上游明确返回的失效结论，验证页等临时错误不锁定 Cookie
+                cookie_checker.mark_invalid("xhs", request.cookie, error_msg)
             return CollectResponse(
                 success=False,
                 code=401,
@@ -346,15 +472,9 @@ async def collect_keyword_notes(request: KeywordCollectRequest) -> CollectRespon
     - 循环采集笔记详情
     - 返回飞书表格记录格式的数据
     """
-    validation_result = await validate_api_key(request.apiKey)
-
-    if not validation_result.success:
-        return CollectResponse(
-            success=False,
-            code=validation_result.code,
-            message=validation_result.message,
-            error=validation_result.error
-        )
+    cookie_rejection = _known_bad_cookie(request.cookie)
+    if cookie_rejection:
+        return cookie_rejection
 
     keyword = request.keyword.strip()
     if not keyword:
@@ -388,13 +508,47 @@ async def collect_keyword_notes(request: KeywordCollectRequest) -> CollectRespon
     collector = XhsCollector(cookie=request.cookie, user_agent=user_agent)
 
     try:
-        records, success_count, fail_count, failed_note_ids = await collector.collect_notes_by_keyword(
-            keyword=keyword,
-            max_notes=request.maxNotes,
-            sort=request.sort,
-            note_type=request.noteType
+        sink = build_sink(request.sinks, "xhs-keyword", request.writeBehind) if request.sinks else None
+    except ValueError as e:
+        return CollectResponse(
+            success=False,
+            code=400,
+            message="输出配置错误",
+            appToken=app_token,
+            tableId=table_id,
+            error=str(e)
         )
 
+    # 验证 API Key 与采集并发进行，输出与写入等待验证通过
+    validation = SpeculativeValidation(request.apiKey)
+    sink = GatedSink(sink, validation.wait) if sink else None
+    max_notes = await validation.limit("maxNotes", request.maxNotes)
+    deadline = RequestDeadline(request.deadlineMs)
+    collected, on_record = _record_collector(sink)
+
+    try:
+        try:
+            validation_result, result = await validation.run(deadline.guard(fair_scheduler.run(
+                request.apiKey,
+                collector.collect_notes_by_keyword(
+                    keyword=keyword,
+                    max_notes=max_notes,
+                    sort=request.sort,
+                    note_type=request.noteType,
+                    mode=request.mode,
+                    note_filter=request.filters,
+                    on_record=on_record
+                ),
+                cost=max_notes,
+                limits=await validation.limits()
+            ), fallback=lambda: (list(collected), len(collected), 0, [])))
+        finally:
+            sink_results = await sink.close() if sink else []
+
+        if not validation_result.success:
+            return _validation_failed(validation_result)
+        records, success_count, fail_count, failed_note_ids = result
+
         if success_count == 0 and fail_count > 0:
             return CollectResponse(
                 success=False,
@@ -410,14 +564,26 @@ async def collect_keyword_notes(request: KeywordCollectRequest) -> CollectRespon
         message = f"关键词「{keyword}」成功采集 {success_count} 条笔记"
         if fail_count > 0:
             message += f"，{fail_count} 条失败"
+        if collector.filtered_count:
+            message += f"，{collector.filtered_count} 条详情不符合筛选条件"
+
+        missing_fields = []
+        if request.mode == "list":
+            message += "（列表模式）"
+            missing_fields = missing_note_fields(records)
 
-        write_success, write_count, write_message = await _write_records_if_needed(
+        write_success, write_count, write_message, write_queued = await _write_records_if_needed(
             app_token,
             table_id,
             records,
-            request.writeToFeishu
+            request.writeToFeishu,
+            request.writeBehind,
+            deadline
         )
+        if deadline.partial:
+            message += "（时间预算用完，返回部分结果）"
         message += write_message
+        message += sink_message(sink_results)
 
         return CollectResponse(
             success=True,
@@ -428,12 +594,20 @@ async def collect_keyword_notes(request: KeywordCollectRequest) -> CollectRespon
             records=records,
             totalCount=success_count,
             writeSuccess=write_success,
-            writeCount=write_count
+            writeCount=write_count,
+            writeQueued=write_queued,
+            sinkResults=sink_results,
+            missingFields=missing_fields,
+            partial=deadline.partial,
+            filtered=collector.filtered_count
         )
     except Exception as e:
         error_msg = str(e)
 
         if "Cookie" in error_msg or "__INITIAL_STATE__" in error_msg:
+            if isinstance(e, CookieInvalidError):
+                # 只缓存上游明确返回的失效结论，验证页等临时错误不锁定 Cookie
+                cookie_checker.mark_invalid("xhs", request.cookie, error_msg)
             return CollectResponse(
                 success=False,
                 code=401,
@@ -0,0 +1,58 @@
+"""
+Cookie 检查 API 路由
+"""
+from fastapi import APIRouter
+
+from app.models.schemas import CookieCheckRequest, CookieCheckResponse
+from app.services.apikey_validator import validate_api_key
+from app.services.cookie_check import cookie_checker
+
+
+router = APIRouter(prefix="/cookie")
+
+
+@router.post("/check", response_model=CookieCheckResponse)
+async def check_cookie(request: CookieCheckRequest) -> CookieCheckResponse:
+    """
+    检查 Cookie 是否有效
+
+    - 验证 API Key
+    - 每个平台发起一次轻量签名请求检查登录状态
+    - 结论按 Cookie 缓存，缓存期内采集接口直接拒绝已失效的 Cookie
+    """
+    validation_result = await validate_api_key(request.apiKey)
+
+    if not validation_result.success:
+        return CookieCheckResponse(
+            success=False,
+            code=validation_result.code,
+            message=validation_result.message,
+            error=validation_result.error
+        )
+
+    try:
+        verdict, cached = await cookie_checker.check(
+            request.platform,
+            request.cookie,
+            user_agent=request.userAgent,
+            ms_token=request.msToken,
+            force=request.force
+        )
+    except Exception as e:
+        return CookieCheckResponse(
+            success=False,
+            code=500,
+            message="检查 Cookie 失败",
+            platform=request.platform,
+            error=str(e)
+        )
+
+    return CookieCheckResponse(
+        success=True,
+        code=0,
+        message=verdict.message,
+        platform=request.platform,
+        valid=verdict.valid,
+        cached=cached,
+        checkedAt=int(verdict.checked_at)
+    )
@@ -1,6 +1,8 @@
 """
 Douyin collect API routes.
 """
+from typing import Optional
+
 from fastapi import APIRouter
 
 from app.core.config import settings
@@ -11,19 +13,35 @@ from app.models.schemas import (
     DouyinProfileInfoCollectRequest,
     DouyinSingleVideoCollectRequest,
 )
-from app.services.apikey_validator import validate_api_key
+from app.services.apikey_validator import SpeculativeValidation
+from app.services.cookie_check import cookie_checker
 from app.services.douyin_collector import DouyinCollector
+from app.services.fair_scheduler import fair_scheduler
 from app.services.feishu_writer import write_to_feishu
+from app.services.feishu_write_queue import write_queue
+from app.services.note_filter import missing_note_fields
+from app.services.request_deadline import RequestDeadline
+from app.services.sinks import GatedSink, build_sink, sink_message
 from app.services.xhs_collector import parse_feishu_table_url
 
 
 router = APIRouter(prefix="/douyin")
 
 
-async def _write_records_if_needed(app_token: str, table_id: str, records, write_enabled: bool) -> tuple:
+async def _write_records_if_needed(
+    app_token: str,
+    table_id: str,
+    records,
+    write_enabled: bool,
+    write_behind: Optional[bool] = None,
+    deadline: Optional[RequestDeadline] = None
+) -> tuple:
     write_success = None
     write_count = 0
+    write_queued = 0
     message_suffix = ""
+    if write_behind is None:
+        write_behind = settings.FEISHU_WRITE_BEHIND
 
     if write_enabled and records:
         try:
@@ -31,20 +49,69 @@ async def _write_records_if_needed(app_token: str, table_id: str, records, write
                 record.dict() if hasattr(record, "dict") else record
                 for record in records
             ]
-            write_result = await write_to_feishu(app_token, table_id, records_dict)
+            if deadline and deadline.limited and deadline.write_remaining() < 1.0:
+                # 时间预算内已来不及同步写入，改为后台写入
+                write_behind = True
+            if write_behind:
+                write_queued = await write_queue.enqueue(app_token, table_id, records_dict)
+                write_success = True
+                return write_success, write_count, f"，已加入飞书写入队列 {write_queued} 条", write_queued
+
+            if deadline:
+                write_result = await deadline.run(write_to_feishu(app_token, table_id, records_dict))
+            else:
+                write_result = await write_to_feishu(app_token, table_id, records_dict)
 
             write_success = write_result.get("success", False)
             write_count = write_result.get("totalSuccess", 0)
+            # 时间预算内来不及写入的批次已转入写入队列
+            write_queued = write_result.get("totalQueued", 0)
 
             if write_success:
                 message_suffix = f"，已写入飞书 {write_count} 条"
+                if write_queued:
+                    message_suffix += f"，{write_queued} 条已加入飞书写入队列"
             else:
                 message_suffix = f"，写入飞书失败: {write_result.get('message', '未知错误')}"
         except Exception as e:
             write_success = False
             message_suffix = f"，写入飞书异常: {str(e)}"
 
-    return write_success, write_count, message_suffix
+    return write_success, write_count, message_suffix, write_queued
+
+
+def _validation_failed(validation_result) -> CollectResponse:
+    return CollectResponse(
+        success=False,
+        code=validation_result.code,
+        message=validation_result.message,
+        error=validation_result.error,
+    )
+
+
+def _known_bad_cookie(cookie: str) -> Optional[CollectResponse]:
+    """Cookie 已知失效（缓存的检查结论）时直接拒绝"""
+    verdict = cookie_checker.known_invalid("douyin", cookie)
+    if not verdict:
+        return None
+    return CollectResponse(
+        success=False,
+        code=401,
+        message="Cookie 已失效，请重新获取",
+        error=f"{verdict.message}（缓存的 Cookie 检查结论，更换 Cookie 后重试）",
+    )
+
+
+def _record_collector(sink) -> tuple:
+    """逐条保存已采集的记录（时间预算用完时作为部分结果返回），同时转发给输出目标"""
+    collected = []
+
+    async def on_record(record):
+        collected.append(record)
+        if sink:
+            await sink.write(record)
+
+    return collected, on_record
 
 
 @router.post("/collect", response_model=CollectResponse)
@@ -52,14 +119,9 @@ async def collect_creator_videos(request: DouyinCollectRequest) -> CollectRespon
     """
     采集抖音博主主页视频
     """
-    validation_result = await validate_api_key(request.apiKey)
-    if not validation_result.success:
-        return CollectResponse(
-            success=False,
-            code=validation_result.code,
-            message=validation_result.message,
-            error=validation_result.error,
-        )
+    cookie_rejection = _known_bad_cookie(request.cookie)
+    if cookie_rejection:
+        return cookie_rejection
 
     try:
         app_token, table_id = parse_feishu_table_url(request.biaogelianjie)
@@ -78,11 +140,45 @@ async def collect_creator_videos(request: DouyinCollectRequest) -> CollectRespon
     )
 
     try:
-        records, success_count, fail_count, failed_ids = await collector.collect_creator_videos(
-            profile_url=request.bozhulianjie,
-            max_notes=request.maxNotes,
+        sink = build_sink(request.sinks, "douyin-profile", request.writeBehind) if request.sinks else None
+    except ValueError as e:
+        return CollectResponse(
+            success=False,
+            code=400,
+            message="输出配置错误",
+            appToken=app_token,
+            tableId=table_id,
+            error=str(e),
         )
 
+    # 验证 API Key 与采集并发进行，输出与写入等待验证通过
+    validation = SpeculativeValidation(request.apiKey)
+    sink = GatedSink(sink, validation.wait) if sink else None
+    max_notes = await validation.limit("maxNotes", request.maxNotes)
+    deadline = RequestDeadline(request.deadlineMs)
+    collected, on_record = _record_collector(sink)
+
+    try:
+        try:
+            validation_result, result = await validation.run(deadline.guard(fair_scheduler.run(
+                request.apiKey,
+                collector.collect_creator_videos(
+                    profile_url=request.bozhulianjie,
+                    max_notes=max_notes,
+                    mode=request.mode,
+                    note_filter=request.filters,
+                    on_record=on_record,
+                ),
+                cost=max_notes,
+                limits=await validation.limits(),
+            ), fallback=lambda: (list(collected), len(collected), 0, [])))
+        finally:
+            sink_results = await sink.close() if sink else []
+
+        if not validation_result.success:
+            return _validation_failed(validation_result)
+        records, success_count, fail_count, failed_ids = result
+
         if success_count == 0 and fail_count > 0:
             return CollectResponse(
                 success=False,
@@ -99,13 +195,23 @@ async def collect_creator_videos(request: DouyinCollectRequest) -> CollectRespon
         if fail_count > 0:
             message += f"，{fail_count} 条失败"
 
-        write_success, write_count, write_message = await _write_records_if_needed(
+        missing_fields = []
+        if request.mode == "list":
+            message += "（列表模式）"
+            missing_fields = missing_note_fields(records)
+
+        write_success, write_count, write_message, write_queued = await _write_records_if_needed(
             app_token,
             table_id,
             records,
             request.writeToFeishu,
+            request.writeBehind,
+            deadline,
         )
+        if deadline.partial:
+            message += "（时间预算用完，返回部分结果）"
         message += write_message
+        message += sink_message(sink_results)
 
         return CollectResponse(
             success=True,
@@ -117,6 +223,10 @@ async def collect_creator_videos(request: DouyinCollectRequest) -> CollectRespon
             totalCount=success_count,
             writeSuccess=write_success,
             writeCount=write_count,
+            writeQueued=write_queued,
+            sinkResults=sink_results,
+            missingFields=missing_fields,
+            partial=deadline.partial,
         )
     except ValueError as e:
         return CollectResponse(
@@ -154,14 +264,9 @@ async def collect_single_video(request: DouyinSingleVideoCollectRequest) -> Coll
     """
     采集抖音单条视频
     """
-    validation_result = await validate_api_key(request.apiKey)
-    if not validation_result.success:
-        return CollectResponse(
-            success=False,
-            code=validation_result.code,
-            message=validation_result.message,
-            error=validation_result.error,
-        )
+    cookie_rejection = _known_bad_cookie(request.cookie)
+    if cookie_rejection:
+        return cookie_rejection
 
     try:
         app_token, table_id = parse_feishu_table_url(request.biaogelianjie)
@@ -179,16 +284,24 @@ async def collect_single_video(request: DouyinSingleVideoCollectRequest) -> Coll
         ms_token=request.msToken,
     )
 
+    # 验证 API Key 与视频请求并发进行，写入等待验证通过
+    validation = SpeculativeValidation(request.apiKey)
+
     try:
-        record = await collector.collect_single_video(request.bijilianjie)
+        validation_result, record = await validation.run(
+            fair_scheduler.run(request.apiKey, collector.collect_single_video(request.bijilianjie), limits=await validation.limits())
+        )
+        if not validation_result.success:
+            return _validation_failed(validation_result)
         records = [record]
         message = "成功采集 1 条视频"
 
-        write_success, write_count, write_message = await _write_records_if_needed(
+        write_success, write_count, write_message, write_queued = await _write_records_if_needed(
             app_token,
             table_id,
             records,
             request.writeToFeishu,
+            request.writeBehind,
         )
         message += write_message
 
@@ -202,6 +315,7 @@ async def collect_single_video(request: DouyinSingleVideoCollectRequest) -> Coll
             totalCount=1,
             writeSuccess=write_success,
             writeCount=write_count,
+            writeQueued=write_queued,
         )
     except ValueError as e:
         return CollectResponse(
@@ -239,14 +353,9 @@ async def collect_profile_info(request: DouyinProfileInfoCollectRequest) -> Coll
     """
     采集抖音博主信息
     """
-    validation_result = await validate_api_key(request.apiKey)
-    if not validation_result.success:
-        return CollectResponse(
-            success=False,
-            code=validation_result.code,
-            message=validation_result.message,
-            error=validation_result.error,
-        )
+    cookie_rejection = _known_bad_cookie(request.cookie)
+    if cookie_rejection:
+        return cookie_rejection
 
     try:
         app_token, table_id = parse_feishu_table_url(request.biaogelianjie)
@@ -264,16 +373,24 @@ async def collect_profile_info(request: DouyinProfileInfoCollectRequest) -> Coll
         ms_token=request.msToken,
     )
 
+    # 验证 API Key 与主页请求并发进行，写入等待验证通过
+    validation = SpeculativeValidation(request.apiKey)
+
     try:
-        record = await collector.collect_creator_profile(request.bozhulianjie)
+        validation_result, record = await validation.run(
+            fair_scheduler.run(request.apiKey, collector.collect_creator_profile(request.bozhulianjie), limits=await validation.limits())
+        )
+        if not validation_result.success:
+            return _validation_failed(validation_result)
         records = [record]
         message = "成功采集 1 条博主信息"
 
-        write_success, write_count, write_message = await _write_records_if_needed(
+        write_success, write_count, write_message, write_queued = await _write_records_if_needed(
             app_token,
             table_id,
             records,
             request.writeToFeishu,
+            request.writeBehind,
         )
         message += write_message
 
@@ -287,6 +404,7 @@ async def collect_profile_info(request: DouyinProfileInfoCollectRequest) -> Coll
             totalCount=1,
             writeSuccess=write_success,
             writeCount=write_count,
+            writeQueued=write_queued,
         )
     except ValueError as e:
         return CollectResponse(
@@ -324,14 +442,9 @@ async def collect_keyword_videos(request: DouyinKeywordCollectRequest) -> Collec
     """
     根据关键词采集抖音视频
     """
-    validation_result = await validate_api_key(request.apiKey)
-    if not validation_result.success:
-        return CollectResponse(
-            success=False,
-            code=validation_result.code,
-            message=validation_result.message,
-            error=validation_result.error,
-        )
+    cookie_rejection = _known_bad_cookie(request.cookie)
+    if cookie_rejection:
+        return cookie_rejection
 
     keyword = request.keyword.strip()
     if not keyword:
@@ -368,12 +481,46 @@ async def collect_keyword_videos(request: DouyinKeywordCollectRequest) -> Collec
     )
 
     try:
-        records, success_count, fail_count, failed_ids = await collector.collect_videos_by_keyword(
-            keyword=keyword,
-            max_notes=request.maxNotes,
-            sort=request.sort,
+        sink = build_sink(request.sinks, "douyin-keyword", request.writeBehind) if request.sinks else None
+    except ValueError as e:
+        return CollectResponse(
+            success=False,
+            code=400,
+            message="输出配置错误",
+            appToken=app_token,
+            tableId=table_id,
+            error=str(e),
         )
 
+    # 验证 API Key 与采集并发进行，输出与写入等待验证通过
+    validation = SpeculativeValidation(request.apiKey)
+    sink = GatedSink(sink, validation.wait) if sink else None
+    max_notes = await validation.limit("maxNotes", request.maxNotes)
+    deadline = RequestDeadline(request.deadlineMs)
+    collected, on_record = _record_collector(sink)
+
+    try:
+        try:
+            validation_result, result = await validation.run(deadline.guard(fair_scheduler.run(
+                request.apiKey,
+                collector.collect_videos_by_keyword(
+                    keyword=keyword,
+                    max_notes=max_notes,
+                    sort=request.sort,
+                    mode=request.mode,
+                    note_filter=request.filters,
+                    on_record=on_record,
+                ),
+                cost=max_notes,
+                limits=await validation.limits(),
+            ), fallback=lambda: (list(collected), len(collected), 0, [])))
+        finally:
+            sink_results = await sink.close() if sink else []
+
+        if not validation_result.success:
+            return _validation_failed(validation_result)
+        records, success_count, fail_count, failed_ids = result
+
         if success_count == 0 and fail_count > 0:
             return CollectResponse(
                 success=False,
@@ -390,13 +537,23 @@ async def collect_keyword_videos(request: DouyinKeywordCollectRequest) -> Collec
         if fail_count > 0:
             message += f"，{fail_count} 条失败"
 
-        write_success, write_count, write_message = await _write_records_if_needed(
+        missing_fields = []
+        if request.mode == "list":
+            message += "（列表模式）"
+            missing_fields = missing_note_fields(records)
+
+        write_success, write_count, write_message, write_queued = await _write_records_if_needed(
             app_token,
             table_id,
             records,
             request.writeToFeishu,
+            request.writeBehind,
+            deadline,
         )
+        if deadline.partial:
+            message += "（时间预算用完，返回部分结果）"
         message += write_message
+        message += sink_message(sink_results)
 
         return CollectResponse(
             success=True,
@@ -408,6 +565,10 @@ async def collect_keyword_videos(request: DouyinKeywordCollectRequest) -> Collec
             totalCount=success_count,
             writeSuccess=write_success,
             writeCount=write_count,
+            writeQueued=write_queued,
+            sinkResults=sink_results,
+            missingFields=missing_fields,
+            partial=deadline.partial,
         )
     except Exception as e:
         error_msg = str(e)
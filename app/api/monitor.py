@@ -0,0 +1,118 @@
+"""
+运行状态监控 API 路由
+"""
+from fastapi import APIRouter
+
+from app.services.apikey_validator import _validator as apikey_validator
+from app.services.cookie_check import cookie_checker
+from app.services.cookie_rate import cookie_rate_controller
+from app.services.fair_scheduler import fair_scheduler
+from app.services.feishu_attachment import attachment_uploader
+from app.services.feishu_auth import tenant_auth
+from app.services.feishu_schema_cache import schema_cache
+from app.services.feishu_select_options import option_registry
+from app.services.feishu_write_queue import write_queue
+from app.services.feishu_write_scheduler import write_scheduler
+from app.services.identity_scheduler import identity_scheduler
+from app.services.priority_lanes import slo_tracker
+from app.services.request_coalescer import request_coalescer
+from app.services.retry_engine import retry_engine
+from app.services.source_router import source_router
+
+
+router = APIRouter(prefix="/monitor")
+
+
+@router.get("/source-router")
+async def get_source_router_stats():
+    """数据源路由统计（各操作下签名 API / 页面 HTML 的成功率与耗时）"""
+    return {
+        "hedge": source_router.hedge,
+        "sources": source_router.snapshot(),
+    }
+
+
+@router.get("/feishu-schema-cache")
+async def get_feishu_schema_cache_stats():
+    """飞书表格字段结构缓存统计"""
+    return schema_cache.stats()
+
+
+@router.get("/feishu-write-scheduler")
+async def get_feishu_write_scheduler_stats():
+    """飞书写入调度统计（请求数、重试、限频次数）"""
+    return write_scheduler.stats()
+
+
+@router.get("/feishu-write-queue")
+async def get_feishu_write_queue_status():
+    """飞书写入队列状态（各目标表的待写入 / 写入中 / 死信条数）"""
+    return await write_queue.status()
+
+
+@router.get("/feishu-attachments")
+async def get_feishu_attachment_stats():
+    """飞书附件上传统计（上传数、链接 / 内容哈希缓存命中数）"""
+    return attachment_uploader.stats()
+
+
+@router.get("/feishu-select-options")
+async def get_feishu_select_option_stats():
+    """飞书单选 / 多选字段选项登记统计"""
+    return option_registry.stats()
+
+
+@router.get("/feishu-auth")
+async def get_feishu_auth_status():
+    """飞书访问凭证状态（未配置应用凭证时使用授权码）"""
+    if not tenant_auth:
+        return {"mode": "personal_base_token"}
+    return {"mode": "tenant_access_token", **tenant_auth.stats()}
+
+
+@router.get("/apikey-cache")
+async def get_apikey_cache_stats():
+    """API Key 验证缓存命中情况与使用次数回写状态"""
+    return apikey_validator.stats()
+
+
+@router.get("/fair-scheduler")
+async def get_fair_scheduler_stats():
+    """按 API Key 的排队、并发与排队等待时间"""
+    return fair_scheduler.stats()
+
+
+@router.get("/cookie-rate")
+async def get_cookie_rate_stats():
+    """各账号（Cookie）的速度倍数、熔断状态、错误率与风控信号统计"""
+    return cookie_rate_controller.stats()
+
+
+@router.get("/identity-scheduler")
+async def get_identity_scheduler_stats():
+    """各账号（Cookie）正在进行 / 排队的上游请求数、当前请求间隔与预计等待时间"""
+    return identity_scheduler.stats()
+
+
+@router.get("/latency-slo")
+async def get_latency_slo_stats():
+    """交互式 / 批量采集接口的耗时分位数与 SLO 达成率"""
+    return slo_tracker.stats()
+
+
+@router.get("/retry-engine")
+async def get_retry_engine_stats():
+    """详情请求按错误类型的失败次数、重试次数与延后重试结果"""
+    return retry_engine.stats()
+
+
+@router.get("/request-coalescer")
+async def get_request_coalescer_stats():
+    """各接口的请求数、实际上游请求数与合并次数"""
+    return request_coalescer.stats()
+
+
+@router.get("/cookie-check")
+async def get_cookie_check_stats():
+    """Cookie 检查次数、缓存命中与直接拒绝次数"""
+    return cookie_checker.stats()
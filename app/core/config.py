@@ -2,7 +2,7 @@
 应用配置
 """
 import os
-from typing import Optional
+from typing import Dict, Optional
 from pydantic_settings import BaseSettings
 
 
@@ -24,6 +24,16 @@ class Settings(BaseSettings):
     # API Key 管理表格配置
     FEISHU_APIKEY_APP_TOKEN: str = ""
     FEISHU_APIKEY_TABLE_ID: str = ""
+    APIKEY_CACHE_TTL: int = 60  # 验证通过结论缓存时间（秒），冻结等状态变更在此时间内生效
+    APIKEY_NEGATIVE_CACHE_TTL: int = 30  # 验证拒绝结论缓存时间（秒）
+    APIKEY_USAGE_FLUSH_INTERVAL: float = 10.0  # 使用次数批量回写间隔（秒）
+
+    # 签名 API Key（本地验证，配置密钥后启用）
+    APIKEY_SIGNING_ALG: str = "hs256"  # 签名算法：hs256 / ed25519
+    APIKEY_SIGNING_SECRET: str = ""  # hs256 签名密钥
+    APIKEY_SIGNING_PUBLIC_KEY: str = ""  # ed25519 公钥（32 字节 base64url，需安装 cryptography）
+    APIKEY_REVOCATION_SYNC_INTERVAL: float = 60.0  # 从管理表同步吊销列表的间隔（秒）
+    APIKEY_REVOCATION_MAX_STALENESS: float = 300.0  # 超过该时间未同步成功时拒绝签名 Key（秒）
 
     # 关键词采集默认写入表格链接
     DEFAULT_FEISHU_TABLE_URL: str = (
@@ -33,7 +43,54 @@ class Settings(BaseSettings):
     
     # 飞书多维表格 API 基础地址（授权码方式使用专用域名）
     FEISHU_API_BASE: str = "https://base-api.feishu.cn/open-apis"
+
+    # 飞书应用凭证（可选，配置后改用 tenant_access_token 访问飞书，优先于授权码）
+    FEISHU_APP_ID: str = ""
+    FEISHU_APP_SECRET: str = ""
+    FEISHU_OPEN_API_BASE: str = "https://open.feishu.cn/open-apis"
+    FEISHU_TOKEN_REFRESH_AHEAD: int = 300  # 过期前多少秒开始后台刷新
+
+    # 飞书表格字段结构缓存有效期（秒）
+    FEISHU_SCHEMA_CACHE_TTL: int = 300
+
+    # 飞书写入调度配置
+    FEISHU_WRITE_RATE: float = 5.0  # 每个多维表格应用每秒请求数
+    FEISHU_WRITE_BURST: float = 5.0  # 令牌桶容量
+    FEISHU_WRITE_CONCURRENCY: int = 3  # 全局并行批次数
+    FEISHU_WRITE_MAX_RETRIES: int = 4  # 限频 / 5xx / 网络错误最大重试次数
+    FEISHU_BATCH_MAX_BYTES: int = 4 * 1024 * 1024  # 单批次请求体上限（字节）
+
+    # 飞书写入队列（write-behind）配置
+    FEISHU_WRITE_BEHIND: bool = False  # 请求未指定 writeBehind 时的默认值
+    FEISHU_WRITE_QUEUE_PATH: str = "data/feishu_write_queue.db"  # 队列 SQLite 文件
+    FEISHU_WRITE_QUEUE_FLUSH_INTERVAL: float = 2.0  # 合并等待时间（秒）
+    FEISHU_WRITE_QUEUE_MAX_ATTEMPTS: int = 5  # 超过后转入死信
+
+    # 飞书附件上传配置（附件类型字段写入图片 / 封面）
+    FEISHU_ATTACHMENT_UPLOAD: bool = True  # 是否将附件字段中的链接上传为素材
+    FEISHU_ATTACHMENT_CONCURRENCY: int = 4  # 并发下载 / 上传数
+    FEISHU_ATTACHMENT_MAX_BYTES: int = 20 * 1024 * 1024  # 单个文件上限（素材接口限制 20MB）
+    FEISHU_ATTACHMENT_CACHE_PATH: str = "data/feishu_media_cache.db"  # 内容哈希 -> file_token 缓存
+
+    # 单选 / 多选字段选项配置
+    FEISHU_SELECT_OPTION_MAX: int = 1000  # 每个字段最多自动维护的选项数
+    FEISHU_SELECT_OPTION_LIMITS: Dict[str, int] = {}  # 按字段名单独设置上限，如 {"笔记标签": 2000}
+    FEISHU_SELECT_OPTION_OVERFLOW: str = "drop"  # 超出上限的新值: drop 丢弃 / keep 按原值写入
     
+    # 采集结果输出配置（JSONL / CSV / Parquet）
+    SINK_OUTPUT_DIR: str = "output"  # 输出文件目录
+    SINK_FLUSH_SIZE: int = 100  # 文件输出每批刷写条数
+    SINK_PARQUET_ROW_GROUP: int = 1000  # Parquet 行组大小
+
+    # 表格驱动批量采集配置
+    BULK_CRAWL_CONCURRENCY: int = 2  # 所有批量任务同时采集的行数
+    BULK_CRAWL_PAGE_SIZE: int = 100  # 源表每页读取条数
+
+    # 按 API Key 公平调度配置
+    FAIR_SCHEDULER_CONCURRENCY: int = 8  # 全局同时进行的采集请求数
+    FAIR_KEY_CONCURRENCY: int = 2  # 单个 API Key 默认并发上限
+    FAIR_KEY_RATE_PER_MINUTE: float = 60.0  # 单个 API Key 默认每分钟请求数（0 为不限制）
+
     # 采集配置
     DEFAULT_MAX_NOTES: int = 20
     DEFAULT_USER_AGENT: str = (
@@ -47,7 +104,57 @@ class Settings(BaseSettings):
     DELAY_BETWEEN_NOTES_EARLY: tuple = (3.0, 5.0)  # 前5条笔记延迟
     DELAY_BETWEEN_NOTES_MIDDLE: tuple = (4.0, 6.0)  # 6-10条笔记延迟
     DELAY_BETWEEN_NOTES_LATE: tuple = (5.0, 8.0)  # 11+条笔记延迟
-    
+
+    # 按 Cookie 自适应限速（延迟 = 上述配置 / 速度倍数）
+    COOKIE_RATE_MIN_SPEED: float = 0.25  # 最低速度倍数（延迟最多放大 4 倍）
+    COOKIE_RATE_MAX_SPEED: float = 2.0  # 最高速度倍数（延迟最多缩短一半）
+    COOKIE_RATE_INCREASE: float = 0.05  # 每次正常请求的速度增量
+    COOKIE_RATE_DECREASE: float = 0.5  # 出现错误 / 风控信号时速度乘以该系数
+    COOKIE_RATE_SLOW_LATENCY: float = 5.0  # 耗时超过该值（秒）的请求不加速
+    COOKIE_BREAKER_THRESHOLD: int = 3  # 连续风控信号达到该次数时熔断
+    COOKIE_BREAKER_COOLDOWN: float = 300.0  # 熔断冷却时间（秒）
+    COOKIE_BREAKER_PROBE_TIMEOUT: float = 60.0  # 探测请求超过该时间仍无结果时放行新的探测请求（秒）
+    COOKIE_STATE_IDLE_TTL: float = 1800.0  # 账号限速 / 调度状态闲置超过该时间（秒）后清除
+    COOKIE_STATE_MAX_IDENTITIES: int = 10000  # 最多保留的账号状态数（超出时清除最久未使用的）
+
+    # 按账号调度上游请求（同一 Cookie 的所有并发任务共享）
+    IDENTITY_REQUEST_INTERVAL: float = 0.5  # 同一账号相邻请求的最小间隔（秒，按限速控制器的延迟系数缩放）
+    IDENTITY_CONCURRENCY: int = 2  # 同一账号同时进行的请求数
+    IDENTITY_SCHEDULER_SHARED_PATH: str = ""  # 多 worker 共享请求间隔的 SQLite 文件（为空则仅进程内调度）
+
+    # 请求优先级（单条笔记 / 单个视频 / 博主信息为交互式，优先于博主主页、关键词与批量采集）
+    PRIORITY_BULK_MAX_YIELD: float = 10.0  # 批量采集在笔记之间为交互式请求让出账号的最长时间（秒）
+    SLO_INTERACTIVE_SECONDS: float = 2.0  # 交互式接口耗时目标
+    SLO_BULK_SECONDS: float = 300.0  # 批量采集接口耗时目标
+
+    # 合并同时进行的相同上游请求（同一笔记 / 博主主页 / 视频只请求一次）
+    REQUEST_COALESCING_ENABLED: bool = True
+
+    # 笔记 / 视频详情失败重试
+    RETRY_MAX_ATTEMPTS: int = 3  # 单条详情最多请求次数（含首次）
+    RETRY_BACKOFF_BASE: float = 1.0  # 超时 / 5xx 退避基数（秒，每次翻倍）
+    RETRY_BACKOFF_MAX: float = 8.0  # 单次退避上限（秒）
+    RETRY_DEFERRED_DELAY: tuple = (5.0, 8.0)  # 任务末尾统一重试前的延迟（秒）
+
+    # 请求时间预算（deadlineMs）末尾为写入飞书预留的时间（秒，最多占预算的四分之一）
+    DEADLINE_WRITE_RESERVE: float = 3.0
+
+    # Cookie 检查结论缓存（秒）
+    COOKIE_CHECK_VALID_TTL: float = 300.0  # 有效结论缓存时间
+    COOKIE_CHECK_INVALID_TTL: float = 600.0  # 失效结论缓存时间（期间采集接口直接拒绝该 Cookie）
+
+    # xsec_token 缓存配置
+    XSEC_TOKEN_CACHE_SIZE: int = 5000  # 最多缓存的笔记数
+    XSEC_TOKEN_CACHE_TTL: int = 3600  # 缓存有效期（秒）
+
+    # 博主主页快照缓存有效期（秒），主页笔记采集与博主信息采集共用一次主页请求
+    CREATOR_SNAPSHOT_TTL: int = 120
+
+    # 数据源路由配置（签名 API / 页面 HTML）
+    SOURCE_ROUTER_WINDOW: int = 50  # 每个数据源保留的最近样本数
+    SOURCE_ROUTER_HEDGE: bool = False  # 是否开启对冲请求
+    SOURCE_ROUTER_HEDGE_DELAY: float = 3.0  # 无耗时统计时的对冲等待时间（秒）
+
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
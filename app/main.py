@@ -7,6 +7,14 @@ from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
 from app.api.collect import router as collect_router
 from app.api.douyin_collect import router as douyin_router
+from app.api.monitor import router as monitor_router
+from app.api.bulk import router as bulk_router
+from app.api.cookie import router as cookie_router
+from app.services.apikey_validator import _validator as apikey_validator
+from app.services.feishu_auth import tenant_auth
+from app.services.feishu_write_queue import write_queue
+from app.services.priority_lanes import PriorityLaneMiddleware
+from app.services.signed_apikey import revocation_list, signed_key_verifier
 
 # 创建 FastAPI 应用
 app = FastAPI(
@@ -24,9 +32,61 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 按接口设置请求优先级（交互式 / 批量）并统计耗时
+app.add_middleware(PriorityLaneMiddleware)
+
 # 注册路由
 app.include_router(collect_router, prefix="/api/v1", tags=["采集"])
 app.include_router(douyin_router, prefix="/api/v1", tags=["抖音采集"])
+app.include_router(bulk_router, prefix="/api/v1", tags=["批量采集"])
+app.include_router(cookie_router, prefix="/api/v1", tags=["Cookie 检查"])
+app.include_router(monitor_router, prefix="/api/v1", tags=["监控"])
+
+
+@app.on_event("startup")
+async def start_write_queue():
+    """启动飞书写入队列刷写任务（恢复上次未写入的记录）"""
+    if settings.FEISHU_WRITE_BEHIND or write_queue.has_backlog():
+        write_queue.start()
+
+
+@app.on_event("startup")
+async def start_feishu_auth():
+    """配置了飞书应用凭证时预取 tenant_access_token 并定时提前刷新"""
+    if tenant_auth:
+        tenant_auth.start()
+
+
+@app.on_event("startup")
+async def start_revocation_sync():
+    """启用签名 API Key 时定时从管理表同步吊销列表"""
+    if signed_key_verifier.configured and settings.FEISHU_APIKEY_TABLE_ID:
+        revocation_list.start()
+
+
+@app.on_event("shutdown")
+async def stop_write_queue():
+    """停止飞书写入队列刷写任务"""
+    await write_queue.stop()
+
+
+@app.on_event("shutdown")
+async def stop_revocation_sync():
+    """停止吊销列表同步"""
+    await revocation_list.stop()
+
+
+@app.on_event("shutdown")
+async def flush_apikey_usage():
+    """写出内存中尚未回写的 API Key 使用次数"""
+    await apikey_validator.usage.stop()
+
+
+@app.on_event("shutdown")
+async def stop_feishu_auth():
+    """停止 tenant_access_token 后台刷新"""
+    if tenant_auth:
+        await tenant_auth.stop()
 
 
 @app.get("/")
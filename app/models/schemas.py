@@ -1,12 +1,61 @@
 """
 请求和响应数据模型
 """
-from typing import Any, Dict, List, Optional
-from pydantic import BaseModel, Field
+import re
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from pydantic import BaseModel, Field, field_validator
 
 from app.core.config import settings
 
 
+# 笔记记录的标准字段（与飞书笔记表字段一致）
+NOTE_RECORD_FIELDS = [
+    "图片链接",
+    "笔记封面图链接",
+    "笔记标题",
+    "笔记内容",
+    "笔记类型",
+    "笔记链接",
+    "笔记标签",
+    "账号名称",
+    "主页链接",
+    "头像链接",
+    "分享数",
+    "点赞数",
+    "收藏数",
+    "评论数",
+    "视频链接",
+    "发布时间",
+]
+
+
+class NoteFilter(BaseModel):
+    """笔记筛选条件（在列表阶段执行，只对命中的笔记请求详情）"""
+    noteType: Optional[str] = Field(default=None, pattern="^(normal|video)$", description="笔记类型: normal图文/video视频")
+    minLikes: Optional[int] = Field(default=None, ge=0, description="最低点赞数")
+    publishedWithinDays: Optional[int] = Field(default=None, ge=1, description="仅保留最近 N 天发布的笔记")
+    titlePattern: Optional[str] = Field(default=None, description="标题正则表达式")
+    rankBy: Optional[str] = Field(default=None, pattern="^(likes|time)$", description="按 likes点赞数/time发布时间 取前 maxNotes 条")
+    scanLimit: int = Field(default=100, ge=1, le=500, description="最多扫描的列表条目数")
+
+    @field_validator("titlePattern")
+    @classmethod
+    def _check_title_pattern(cls, value: Optional[str]) -> Optional[str]:
+        if value:
+            try:
+                re.compile(value)
+            except re.error as e:
+                raise ValueError(f"标题正则表达式无效: {e}")
+        return value
+
+
+class SinkSpec(BaseModel):
+    """采集结果输出目标"""
+    type: str = Field(..., pattern="^(jsonl|csv|parquet|feishu)$", description="输出类型: jsonl/csv/parquet/feishu")
+    path: Optional[str] = Field(default=None, description="输出文件名（写入服务输出目录，不含路径）")
+    tableUrl: Optional[str] = Field(default=None, description="飞书表格链接（feishu 输出必填）")
+
+
 class CollectRequest(BaseModel):
     """采集请求"""
     apiKey: str = Field(..., description="API Key")
@@ -14,8 +63,17 @@ class CollectRequest(BaseModel):
     bozhulianjie: str = Field(..., description="博主主页链接")
     biaogelianjie: str = Field(..., description="飞书表格链接")
     maxNotes: int = Field(default=20, ge=1, le=50, description="最大采集数量")
+    mode: str = Field(
+        default="detail",
+        pattern="^(detail|list)$",
+        description="采集模式: detail逐条请求详情/list仅使用列表数据"
+    )
+    filters: Optional[NoteFilter] = Field(default=None, description="笔记筛选与排序条件")
+    sinks: List[SinkSpec] = Field(default_factory=list, description="额外输出目标（逐条输出，可同时输出到多个目标）")
+    deadlineMs: Optional[int] = Field(default=None, ge=1000, description="请求时间预算（毫秒），到期前返回并写入已采集的记录（partial 为 true）")
     userAgent: Optional[str] = Field(default=None, description="浏览器 User-Agent")
     writeToFeishu: bool = Field(default=True, description="是否直接写入飞书表格")
+    writeBehind: Optional[bool] = Field(default=None, description="是否先写入本地队列、由后台合并写入飞书（默认使用服务配置）")
 
 
 class SingleNoteCollectRequest(BaseModel):
@@ -26,6 +84,7 @@ class SingleNoteCollectRequest(BaseModel):
     biaogelianjie: str = Field(..., description="飞书表格链接")
     userAgent: Optional[str] = Field(default=None, description="浏览器 User-Agent")
     writeToFeishu: bool = Field(default=True, description="是否直接写入飞书表格")
+    writeBehind: Optional[bool] = Field(default=None, description="是否先写入本地队列、由后台合并写入飞书（默认使用服务配置）")
 
 
 class ProfileInfoCollectRequest(BaseModel):
@@ -36,6 +95,7 @@ class ProfileInfoCollectRequest(BaseModel):
     biaogelianjie: str = Field(..., description="飞书表格链接")
     userAgent: Optional[str] = Field(default=None, description="浏览器 User-Agent")
     writeToFeishu: bool = Field(default=True, description="是否直接写入飞书表格")
+    writeBehind: Optional[bool] = Field(default=None, description="是否先写入本地队列、由后台合并写入飞书（默认使用服务配置）")
 
 
 class KeywordCollectRequest(BaseModel):
@@ -50,8 +110,17 @@ class KeywordCollectRequest(BaseModel):
     maxNotes: int = Field(default=20, ge=1, le=50, description="最大采集数量")
     sort: str = Field(default="general", description="排序方式: general/hot_desc/time_desc")
     noteType: int = Field(default=0, ge=0, le=2, description="笔记类型: 0全部/1图文/2视频")
+    mode: str = Field(
+        default="detail",
+        pattern="^(detail|list)$",
+        description="采集模式: detail逐条请求详情/list仅使用列表数据"
+    )
+    filters: Optional[NoteFilter] = Field(default=None, description="笔记筛选与排序条件")
+    sinks: List[SinkSpec] = Field(default_factory=list, description="额外输出目标（逐条输出，可同时输出到多个目标）")
+    deadlineMs: Optional[int] = Field(default=None, ge=1000, description="请求时间预算（毫秒），到期前返回并写入已采集的记录（partial 为 true）")
     userAgent: Optional[str] = Field(default=None, description="浏览器 User-Agent")
     writeToFeishu: bool = Field(default=True, description="是否直接写入飞书表格")
+    writeBehind: Optional[bool] = Field(default=None, description="是否先写入本地队列、由后台合并写入飞书（默认使用服务配置）")
 
 
 class DouyinBaseRequest(BaseModel):
@@ -61,6 +130,7 @@ class DouyinBaseRequest(BaseModel):
     userAgent: Optional[str] = Field(default=None, description="浏览器 User-Agent")
     msToken: Optional[str] = Field(default=None, description="抖音 msToken（可选）")
     writeToFeishu: bool = Field(default=True, description="是否直接写入飞书表格")
+    writeBehind: Optional[bool] = Field(default=None, description="是否先写入本地队列、由后台合并写入飞书（默认使用服务配置）")
 
 
 class DouyinCollectRequest(DouyinBaseRequest):
@@ -68,6 +138,14 @@ class DouyinCollectRequest(DouyinBaseRequest):
     bozhulianjie: str = Field(..., description="博主主页链接")
     biaogelianjie: str = Field(..., description="飞书表格链接")
     maxNotes: int = Field(default=20, ge=1, le=50, description="最大采集数量")
+    mode: str = Field(
+        default="detail",
+        pattern="^(detail|list)$",
+        description="采集模式: detail逐条请求详情/list仅使用列表数据",
+    )
+    filters: Optional[NoteFilter] = Field(default=None, description="笔记筛选与排序条件")
+    sinks: List[SinkSpec] = Field(default_factory=list, description="额外输出目标（逐条输出，可同时输出到多个目标）")
+    deadlineMs: Optional[int] = Field(default=None, ge=1000, description="请求时间预算（毫秒），到期前返回并写入已采集的记录（partial 为 true）")
 
 
 class DouyinSingleVideoCollectRequest(DouyinBaseRequest):
@@ -91,6 +169,72 @@ class DouyinKeywordCollectRequest(DouyinBaseRequest):
     )
     maxNotes: int = Field(default=20, ge=1, le=50, description="最大采集数量")
     sort: str = Field(default="general", description="排序方式: general/most_like/latest")
+    mode: str = Field(
+        default="detail",
+        pattern="^(detail|list)$",
+        description="采集模式: detail逐条请求详情/list仅使用列表数据",
+    )
+    filters: Optional[NoteFilter] = Field(default=None, description="笔记筛选与排序条件")
+    sinks: List[SinkSpec] = Field(default_factory=list, description="额外输出目标（逐条输出，可同时输出到多个目标）")
+    deadlineMs: Optional[int] = Field(default=None, ge=1000, description="请求时间预算（毫秒），到期前返回并写入已采集的记录（partial 为 true）")
+
+
+class BulkCrawlRequest(BaseModel):
+    """表格驱动的批量采集请求"""
+    apiKey: str = Field(..., description="API Key")
+    cookie: str = Field(..., description="小红书 / 抖音 Cookie")
+    platform: str = Field(default="xhs", pattern="^(xhs|douyin)$", description="平台: xhs小红书/douyin抖音")
+    sourceTableUrl: str = Field(..., description="源表链接（每行一个博主链接或关键词）")
+    biaogelianjie: str = Field(..., description="结果写入的飞书表格链接")
+    linkField: str = Field(default="博主链接", description="源表中博主链接字段名")
+    keywordField: str = Field(default="关键词", description="源表中关键词字段名（无博主链接时使用）")
+    statusField: str = Field(default="采集状态", description="回写采集状态的字段名")
+    resultField: str = Field(default="采集结果", description="回写采集结果说明的字段名")
+    skipCompleted: bool = Field(default=True, description="跳过状态为「已完成」的行")
+    maxRows: Optional[int] = Field(default=None, ge=1, description="最多处理的行数")
+    maxNotes: int = Field(default=20, ge=1, le=50, description="每行最大采集数量")
+    sort: str = Field(default="general", description="关键词排序方式（同各平台关键词采集接口）")
+    mode: str = Field(
+        default="detail",
+        pattern="^(detail|list)$",
+        description="采集模式: detail逐条请求详情/list仅使用列表数据"
+    )
+    filters: Optional[NoteFilter] = Field(default=None, description="笔记筛选与排序条件")
+    userAgent: Optional[str] = Field(default=None, description="浏览器 User-Agent")
+    msToken: Optional[str] = Field(default=None, description="抖音 msToken（可选）")
+    writeBehind: Optional[bool] = Field(default=None, description="是否先写入本地队列、由后台合并写入飞书（默认使用服务配置）")
+
+
+class BulkJobResponse(BaseModel):
+    """批量采集任务响应"""
+    success: bool = Field(..., description="是否成功")
+    code: int = Field(..., description="状态码")
+    message: str = Field(..., description="消息")
+    jobId: Optional[str] = Field(default=None, description="任务 ID")
+    job: Optional[Dict[str, Any]] = Field(default=None, description="任务状态")
+    error: Optional[str] = Field(default=None, description="错误详情")
+
+
+class CookieCheckRequest(BaseModel):
+    """Cookie 检查请求"""
+    apiKey: str = Field(..., description="API Key")
+    cookie: str = Field(..., description="待检查的 Cookie")
+    platform: str = Field(default="xhs", pattern="^(xhs|douyin)$", description="平台: xhs小红书/douyin抖音")
+    userAgent: Optional[str] = Field(default=None, description="浏览器 User-Agent")
+    msToken: Optional[str] = Field(default=None, description="抖音 msToken（可选）")
+    force: bool = Field(default=False, description="忽略缓存重新检查")
+
+
+class CookieCheckResponse(BaseModel):
+    """Cookie 检查响应"""
+    success: bool = Field(..., description="请求是否成功")
+    code: int = Field(..., description="状态码")
+    message: str = Field(..., description="消息")
+    platform: Optional[str] = Field(default=None, description="平台")
+    valid: Optional[bool] = Field(default=None, description="Cookie 是否有效")
+    cached: bool = Field(default=False, description="结论是否来自缓存")
+    checkedAt: Optional[int] = Field(default=None, description="检查时间（秒级时间戳）")
+    error: Optional[str] = Field(default=None, description="错误详情")
 
 
 class NoteRecord(BaseModel):
@@ -98,6 +242,10 @@ class NoteRecord(BaseModel):
     fields: Dict[str, Any]
 
 
+# 逐条接收采集记录的回调（用于增量输出）
+RecordCallback = Callable[[NoteRecord], Awaitable[None]]
+
+
 class CollectResponse(BaseModel):
     """采集响应"""
     success: bool = Field(..., description="是否成功")
@@ -109,6 +257,11 @@ class CollectResponse(BaseModel):
     totalCount: int = Field(default=0, description="采集的笔记数量")
     writeSuccess: Optional[bool] = Field(default=None, description="写入飞书是否成功")
     writeCount: int = Field(default=0, description="成功写入飞书的记录数")
+    writeQueued: int = Field(default=0, description="已加入飞书写入队列的记录数")
+    missingFields: List[str] = Field(default_factory=list, description="列表模式下未能获取的字段")
+    sinkResults: List[Dict[str, Any]] = Field(default_factory=list, description="各输出目标的写入结果")
+    partial: bool = Field(default=False, description="是否因时间预算用完只返回了部分结果")
+    filtered: int = Field(default=0, description="列表中缺失筛选字段、详情返回后不符合筛选条件而丢弃的笔记数")
     error: Optional[str] = Field(default=None, description="错误详情")
 
 
@@ -122,6 +275,22 @@ class NoteInfo(BaseModel):
     userId: str = ""
     userAvatar: str = ""
     userHomePage: str = ""
+    coverUrl: str = ""
+    likedCount: Optional[int] = None
+    collectedCount: Optional[int] = None
+    commentCount: Optional[int] = None
+    shareCount: Optional[int] = None
+    publishTime: Optional[int] = None
+
+
+class CreatorSnapshot(BaseModel):
+    """博主主页快照（一次主页请求同时得到博主信息与首页笔记）"""
+    userId: str = ""
+    profile: Optional[NoteRecord] = None
+    profileError: str = ""
+    notes: List[NoteInfo] = Field(default_factory=list)
+    cursor: str = ""
+    hasMore: bool = False
 
 
 class APIKeyValidationResult(BaseModel):
@@ -130,3 +299,10 @@ class APIKeyValidationResult(BaseModel):
     code: int
     message: str
     error: Optional[str] = None
+    keyId: Optional[str] = None  # 签名 Key 的 Key ID
+    limits: Dict[str, Any] = Field(default_factory=dict)  # 签名 Key 内嵌的套餐限制
+
+    def limit(self, name: str, requested: int) -> int:
+        """按套餐限制收紧请求参数（如 maxNotes）"""
+        cap = self.limits.get(name)
+        return min(requested, int(cap)) if cap else requested
@@ -2,13 +2,17 @@
 API Key 验证模块
 通过飞书多维表格验证 API Key 的有效性
 """
+import asyncio
 import time
-from typing import Optional, Dict, Any
+from collections import OrderedDict
+from typing import Any, Awaitable, Dict, List, Optional, Tuple
 
 import httpx
 
 from app.core.config import settings
 from app.models.schemas import APIKeyValidationResult
+from app.services.feishu_auth import apikey_auth
+from app.services.signed_apikey import is_signed_key, revocation_list, signed_key_verifier
 
 
 # 飞书表格字段名（注意：字段名有空格）
@@ -17,6 +21,8 @@ FIELD_STATUS = "api key状态"
 FIELD_ACTIVATED_AT = "激活时间"
 FIELD_LAST_USED_AT = "最后验证时间"
 FIELD_USAGE_COUNT = "验证次数"
+FIELD_CONCURRENCY = "并发上限"  # 可选，按 Key 配置调度并发上限
+FIELD_RATE_PER_MINUTE = "每分钟请求数"  # 可选，按 Key 配置每分钟请求数
 
 # 状态值
 STATUS_UNACTIVATED = "未激活"
@@ -24,27 +30,31 @@ STATUS_ACTIVE = "已激活"
 STATUS_EXPIRED = "已过期"
 STATUS_FROZEN = "已冻结"
 
+# 验证结论缓存的最大 Key 数
+API_KEY_CACHE_SIZE = 10000
+
 
 class APIKeyValidator:
-    """API Key 验证器（使用 PersonalBaseToken 授权码方式）"""
+    """API Key 验证器（使用授权码或应用凭证）"""
     
     def __init__(self):
-        self.api_base = settings.FEISHU_API_BASE
-        self.personal_base_token = settings.FEISHU_PERSONAL_BASE_TOKEN
+        self.auth = apikey_auth
+        self.api_base = self.auth.api_base
         self.app_token = settings.FEISHU_APIKEY_APP_TOKEN
         self.table_id = settings.FEISHU_APIKEY_TABLE_ID
+        self.usage = UsageTracker(self.app_token, self.table_id, settings.APIKEY_USAGE_FLUSH_INTERVAL)
+        self._cache: "OrderedDict[str, CachedVerdict]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._stats = {"hits": 0, "misses": 0, "coalesced": 0}
     
-    def _get_auth_headers(self) -> dict:
-        """获取授权请求头（使用 PersonalBaseToken）"""
-        return {
-            "Authorization": f"Bearer {self.personal_base_token}",
-            "Content-Type": "application/json; charset=utf-8",
-        }
+    async def _get_auth_headers(self) -> dict:
+        """获取授权请求头"""
+        return await self.auth.get_headers()
     
     async def _search_api_key_record(self, api_key: str) -> Optional[Dict[str, Any]]:
         """查询 API Key 记录"""
         url = f"{self.api_base}/bitable/v1/apps/{self.app_token}/tables/{self.table_id}/records/search"
-        headers = self._get_auth_headers()
+        headers = await self._get_auth_headers()
         body = {
             "filter": {
                 "conjunction": "and",
@@ -67,19 +77,6 @@ class APIKeyValidator:
         items = data.get("data", {}).get("items", [])
         return items[0] if items else None
     
-    async def _update_api_key_record(self, record_id: str, fields: Dict[str, Any]) -> None:
-        """更新 API Key 记录"""
-        url = f"{self.api_base}/bitable/v1/apps/{self.app_token}/tables/{self.table_id}/records/{record_id}"
-        headers = self._get_auth_headers()
-        body = {"fields": fields}
-        
-        async with httpx.AsyncClient() as client:
-            response = await client.put(url, headers=headers, json=body)
-            data = response.json()
-        
-        if data.get("code") != 0:
-            raise Exception(f"更新 API Key 失败: {data.get('msg')}")
-    
     def _extract_text(self, value: Any) -> str:
         """提取文本值"""
         if value is None:
@@ -115,6 +112,9 @@ class APIKeyValidator:
         """
         验证 API Key
 
+        验证结论按 Key 缓存（通过 / 拒绝分别使用不同有效期），并发的相同 Key 只查询一次；
+        使用次数在内存中累计，由后台定时批量回写
+
         Args:
             api_key: 待验证的 API Key
 
@@ -138,82 +138,358 @@ class APIKeyValidator:
                 message="API Key 验证通过 (测试模式: 跳过飞书验证)"
             )
 
+        # 签名 Key：本地校验签名，不查询飞书
+        if is_signed_key(api_key) and signed_key_verifier.configured:
+            return await self._validate_signed(api_key)
+
         # 检查配置
-        if not self.personal_base_token or not self.app_token or not self.table_id:
+        if not self.auth.configured or not self.app_token or not self.table_id:
             return APIKeyValidationResult(
                 success=False,
                 code=500,
                 message="服务配置错误",
-                error="缺少飞书配置（PERSONAL_BASE_TOKEN/APP_TOKEN/TABLE_ID）"
+                error="缺少飞书配置（PERSONAL_BASE_TOKEN 或 APP_ID/APP_SECRET、APP_TOKEN/TABLE_ID）"
             )
-        
+
+        verdict = self._cache.get(api_key)
+        if verdict and not verdict.expired:
+            self._stats["hits"] += 1
+        else:
+            verdict = await self._lookup_once(api_key)
+
+        if verdict.result.success and verdict.record_id:
+            self.usage.record(verdict.record_id, activate=verdict.status in (STATUS_UNACTIVATED, ""))
+            # 激活随使用次数一起回写，缓存中视为已激活
+            verdict.status = STATUS_ACTIVE
+
+        return verdict.result
+
+    async def _validate_signed(self, api_key: str) -> APIKeyValidationResult:
+        """验证签名 Key（签名、过期时间与吊销列表均在本地检查，吊销列表失效时先同步）"""
+        claims = signed_key_verifier.verify(api_key)
+        if not claims:
+            return APIKeyValidationResult(
+                success=False,
+                code=401,
+                message="API Key 无效",
+                error="API Key 签名校验失败"
+            )
+
+        if claims.expired:
+            return APIKeyValidationResult(
+                success=False,
+                code=403,
+                message="API Key 已过期",
+                error="API Key 已过期",
+                keyId=claims.key_id
+            )
+
+        if not await revocation_list.ensure_fresh():
+            # 无法确认 Key 是否已被吊销，拒绝而不是放行
+            return APIKeyValidationResult(
+                success=False,
+                code=503,
+                message="API Key 验证暂时不可用",
+                error="无法同步 API Key 管理表，请稍后重试",
+                keyId=claims.key_id
+            )
+
+        if not revocation_list.is_known(claims.key_id):
+            return APIKeyValidationResult(
+                success=False,
+                code=401,
+                message="API Key 不存在",
+                error="签名 Key 需在管理表中登记后才能使用",
+                keyId=claims.key_id
+            )
+
+        if revocation_list.is_revoked(claims.key_id):
+            return APIKeyValidationResult(
+                success=False,
+                code=403,
+                message="API Key 已被冻结",
+                error="API Key 已被冻结",
+                keyId=claims.key_id
+            )
+
+        # 累计使用次数到管理表中对应的记录
+        record_id = revocation_list.record_ids[claims.key_id]
+        self.usage.observe(record_id, revocation_list.usage_counts.get(claims.key_id, 0))
+        self.usage.record(record_id)
+
+        return APIKeyValidationResult(
+            success=True,
+            code=0,
+            message="API Key 验证通过",
+            keyId=claims.key_id,
+            limits=claims.limits
+        )
+
+    async def _lookup_once(self, api_key: str) -> "CachedVerdict":
+        """查询飞书并缓存结论（同一 Key 的并发查询合并为一次）"""
+        inflight = self._inflight.get(api_key)
+        if inflight:
+            self._stats["coalesced"] += 1
+        else:
+            self._stats["misses"] += 1
+            # 查询在独立任务中进行，发起方被取消时其余等待方仍能拿到结论
+            inflight = self._inflight[api_key] = asyncio.ensure_future(self._lookup(api_key))
+            inflight.add_done_callback(lambda _: self._inflight.pop(api_key, None))
+        return await asyncio.shield(inflight)
+
+    async def _lookup(self, api_key: str) -> "CachedVerdict":
+        """查询飞书表格得出验证结论"""
         try:
             record = await self._search_api_key_record(api_key)
-            
-            if not record:
-                return APIKeyValidationResult(
+        except Exception as exc:
+            # 查询失败不缓存，下次请求重新查询
+            return CachedVerdict(
+                APIKeyValidationResult(
+                    success=False,
+                    code=500,
+                    message="API Key 验证失败",
+                    error=f"API Key 验证失败: {exc}"
+                ),
+                ttl=0
+            )
+
+        if not record:
+            return self._remember(api_key, CachedVerdict(
+                APIKeyValidationResult(
                     success=False,
                     code=401,
                     message="API Key 不存在",
                     error="API Key 不存在"
-                )
-            
-            fields = record.get("fields", {})
-            status = self._extract_text(fields.get(FIELD_STATUS))
-            usage_count = self._extract_int(fields.get(FIELD_USAGE_COUNT))
-            
-            # 检查状态
-            if status == STATUS_EXPIRED:
-                return APIKeyValidationResult(
-                    success=False,
-                    code=403,
-                    message="API Key 已过期",
-                    error="API Key 已过期"
-                )
-            
-            if status == STATUS_FROZEN:
-                return APIKeyValidationResult(
-                    success=False,
-                    code=403,
-                    message="API Key 已被冻结",
-                    error="API Key 已被冻结"
-                )
-            
-            if status not in (STATUS_UNACTIVATED, STATUS_ACTIVE, ""):
-                return APIKeyValidationResult(
-                    success=False,
-                    code=403,
-                    message=f"API Key 状态异常: {status}",
-                    error=f"API Key 状态异常: {status}"
-                )
-            
-            # 更新使用信息
-            now_ms = int(time.time() * 1000)
-            update_fields: Dict[str, Any] = {
-                FIELD_LAST_USED_AT: now_ms,
-                FIELD_USAGE_COUNT: usage_count + 1,
-            }
-            
-            # 首次使用时激活
-            if status == STATUS_UNACTIVATED or not status:
-                update_fields[FIELD_STATUS] = STATUS_ACTIVE
-                update_fields[FIELD_ACTIVATED_AT] = now_ms
-            
-            await self._update_api_key_record(record["record_id"], update_fields)
-            
-            return APIKeyValidationResult(
-                success=True,
-                code=0,
-                message="API Key 验证通过"
+                ),
+                ttl=settings.APIKEY_NEGATIVE_CACHE_TTL
+            ))
+
+        fields = record.get("fields", {})
+        status = self._extract_text(fields.get(FIELD_STATUS))
+        record_id = record["record_id"]
+        self.usage.observe(record_id, self._extract_int(fields.get(FIELD_USAGE_COUNT)))
+
+        # 检查状态
+        if status == STATUS_EXPIRED:
+            result = APIKeyValidationResult(
+                success=False,
+                code=403,
+                message="API Key 已过期",
+                error="API Key 已过期"
             )
-            
-        except Exception as exc:
-            return APIKeyValidationResult(
+        elif status == STATUS_FROZEN:
+            result = APIKeyValidationResult(
                 success=False,
-                code=500,
-                message="API Key 验证失败",
-                error=f"API Key 验证失败: {exc}"
+                code=403,
+                message="API Key 已被冻结",
+                error="API Key 已被冻结"
+            )
+        elif status not in (STATUS_UNACTIVATED, STATUS_ACTIVE, ""):
+            result = APIKeyValidationResult(
+                success=False,
+                code=403,
+                message=f"API Key 状态异常: {status}",
+                error=f"API Key 状态异常: {status}"
             )
+        else:
+            limits = {
+                "concurrency": self._extract_int(fields.get(FIELD_CONCURRENCY)),
+                "ratePerMinute": self._extract_int(fields.get(FIELD_RATE_PER_MINUTE)),
+            }
+            return self._remember(api_key, CachedVerdict(
+                APIKeyValidationResult(
+                    success=True,
+                    code=0,
+                    message="API Key 验证通过",
+                    limits={name: value for name, value in limits.items() if value > 0}
+                ),
+                ttl=settings.APIKEY_CACHE_TTL,
+                record_id=record_id,
+                status=status
+            ))
+
+        return self._remember(api_key, CachedVerdict(
+            result,
+            ttl=settings.APIKEY_NEGATIVE_CACHE_TTL,
+            record_id=record_id,
+            status=status
+        ))
+
+    def _remember(self, api_key: str, verdict: "CachedVerdict") -> "CachedVerdict":
+        self._cache[api_key] = verdict
+        self._cache.move_to_end(api_key)
+        while len(self._cache) > API_KEY_CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return verdict
+
+    def invalidate(self, api_key: Optional[str] = None) -> None:
+        """清除验证缓存（不传 Key 时清除全部）"""
+        if api_key is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(api_key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "cached": len(self._cache),
+            "ttl": settings.APIKEY_CACHE_TTL,
+            "negativeTtl": settings.APIKEY_NEGATIVE_CACHE_TTL,
+            "usage": self.usage.stats(),
+            "signed": {
+                "enabled": signed_key_verifier.configured,
+                "alg": signed_key_verifier.alg,
+                **revocation_list.stats(),
+            },
+        }
+
+
+class CachedVerdict:
+    """缓存的验证结论"""
+
+    def __init__(
+        self,
+        result: APIKeyValidationResult,
+        ttl: float,
+        record_id: Optional[str] = None,
+        status: str = ""
+    ):
+        self.result = result
+        self.record_id = record_id
+        self.status = status
+        self.expires_at = time.monotonic() + ttl
+
+    @property
+    def expired(self) -> bool:
+        return self.expires_at <= time.monotonic()
+
+
+class UsageTracker:
+    """
+    API Key 使用次数累计
+
+    验证通过时只在内存中计数，后台每隔 flush_interval 秒通过 batch_update 批量回写
+    验证次数、最后验证时间与首次激活信息
+
+    回写前通过 batch_get 重新读取表中的验证次数，再加上本进程新增的次数，多个 worker 同时回写时
+    不会覆盖彼此已写入的计数（读取与写入之间仍有短暂窗口，极端并发下可能少计）
+    """
+
+    def __init__(self, app_token: str, table_id: str, flush_interval: float = 10.0):
+        self.app_token = app_token
+        self.table_id = table_id
+        self.flush_interval = flush_interval
+        self._totals: Dict[str, int] = {}
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {"flushes": 0, "flushErrors": 0, "written": 0}
+
+    def observe(self, record_id: str, usage_count: int) -> None:
+        """记录表中最新的验证次数"""
+        self._totals[record_id] = max(self._totals.get(record_id, 0), usage_count)
+
+    def record(self, record_id: str, activate: bool = False) -> None:
+        now_ms = int(time.time() * 1000)
+        entry = self._pending.setdefault(record_id, {"count": 0})
+        entry["count"] += 1
+        entry["lastUsedAt"] = now_ms
+        if activate and "activatedAt" not in entry:
+            entry["activatedAt"] = now_ms
+        self.start()
+
+    async def flush(self) -> None:
+        if not self._pending:
+            return
+
+        pending, self._pending = self._pending, {}
+        try:
+            self._totals.update(await self._fetch_counts(list(pending)))
+        except Exception as e:
+            # 读取失败时按上次读到的次数回写
+            print(f"[API Key] 读取验证次数失败，使用缓存的次数: {e}")
+        updates = []
+        for record_id, entry in pending.items():
+            fields: Dict[str, Any] = {
+                FIELD_USAGE_COUNT: self._totals.get(record_id, 0) + entry["count"],
+                FIELD_LAST_USED_AT: entry["lastUsedAt"],
+            }
+            if "activatedAt" in entry:
+                fields[FIELD_STATUS] = STATUS_ACTIVE
+                fields[FIELD_ACTIVATED_AT] = entry["activatedAt"]
+            updates.append({"record_id": record_id, "fields": fields})
+
+        from app.services.feishu_writer import FeishuWriter
+
+        self._stats["flushes"] += 1
+        result = await FeishuWriter(self.app_token, self.table_id, auth=apikey_auth).batch_update_records(updates)
+
+        if result.get("success"):
+            self._stats["written"] += len(updates)
+            for update in updates:
+                self._totals[update["record_id"]] = update["fields"][FIELD_USAGE_COUNT]
+            return
+
+        # 回写失败：计数并回待写入队列，下次重试
+        self._stats["flushErrors"] += 1
+        print(f"[API Key] 回写使用次数失败: {result.get('message')}")
+        for record_id, entry in pending.items():
+            current = self._pending.setdefault(record_id, {"count": 0})
+            current["count"] += entry["count"]
+            current.setdefault("lastUsedAt", entry["lastUsedAt"])
+            if "activatedAt" in entry:
+                current.setdefault("activatedAt", entry["activatedAt"])
+
+    async def _fetch_counts(self, record_ids: List[str]) -> Dict[str, int]:
+        """读取表中当前的验证次数"""
+        url = f"{apikey_auth.api_base}/bitable/v1/apps/{self.app_token}/tables/{self.table_id}/records/batch_get"
+        counts: Dict[str, int] = {}
+        async with httpx.AsyncClient(timeout=30.0) as client:
+            for start in range(0, len(record_ids), 100):
+                response = await client.post(
+                    url,
+                    headers=await apikey_auth.get_headers(),
+                    json={"record_ids": record_ids[start:start + 100]}
+                )
+                data = response.json()
+                if data.get("code") != 0:
+                    raise Exception(f"读取验证次数失败: {data.get('msg')}")
+                for record in data.get("data", {}).get("records", []):
+                    counts[record["record_id"]] = _validator._extract_int(
+                        record.get("fields", {}).get(FIELD_USAGE_COUNT)
+                    )
+        return counts
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"[API Key] 回写使用次数异常: {e}")
+
+    def start(self) -> None:
+        """启动后台回写任务（需在事件循环中调用）"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def stop(self) -> None:
+        """停止后台回写任务并写出剩余计数"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "pendingKeys": len(self._pending),
+            "pendingCount": sum(entry["count"] for entry in self._pending.values()),
+            "flushInterval": self.flush_interval,
+        }
 
 
 # 单例实例
@@ -224,3 +500,85 @@ async def validate_api_key(api_key: str) -> APIKeyValidationResult:
     """验证 API Key（便捷函数）"""
     return await _validator.validate(api_key)
 
+
+class SpeculativeValidation:
+    """
+    与上游采集并发进行的 API Key 验证
+
+    路由先完成本地校验，再创建本对象开始验证，同时开始只读的上游请求（主页 / 列表 / 详情），
+    验证失败时取消上游请求；写入（飞书、输出文件）必须等待验证通过
+    """
+
+    def __init__(self, api_key: str):
+        self.api_key = api_key
+        self.task = asyncio.ensure_future(validate_api_key(api_key))
+
+    async def limits(self) -> Dict[str, Any]:
+        """
+        Key 的套餐限制
+
+        签名 Key 从载荷本地解析，管理表中的 Key 使用未过期的通过结论，均无需等待验证；
+        其余情况（签名无效、缓存未命中 / 已过期 / 为拒绝结论）等待本次验证结果，
+        推测执行不会放宽套餐限制，未通过验证的 Key 也不会进入调度队列
+        """
+        if is_signed_key(self.api_key) and signed_key_verifier.configured:
+            claims = signed_key_verifier.verify(self.api_key)
+            if claims:
+                return claims.limits
+        verdict = _validator._cache.get(self.api_key)
+        if verdict and not verdict.expired and verdict.result.success:
+            return verdict.result.limits
+        result = await self.result()
+        return result.limits if result.success else {}
+
+    async def limit(self, name: str, requested: int) -> int:
+        """按套餐限制收紧请求参数"""
+        cap = (await self.limits()).get(name)
+        return min(requested, int(cap)) if cap else requested
+
+    async def result(self) -> APIKeyValidationResult:
+        return await asyncio.shield(self.task)
+
+    async def wait(self) -> None:
+        """等待验证通过（写入前调用），验证失败时抛出异常"""
+        result = await self.result()
+        if not result.success:
+            raise Exception(result.message)
+
+    async def run(self, work: Awaitable[Any]) -> Tuple[APIKeyValidationResult, Any]:
+        """
+        并发执行验证与上游请求
+
+        Returns:
+            (验证结果, 上游请求结果)；验证失败时上游请求被取消，结果为 None
+        """
+        if self.task.done() and not self.task.cancelled() and self.task.exception() is None:
+            # 验证已有结论（limits() 等待过验证）：未通过时不再开始上游请求
+            result = self.task.result()
+            if not result.success:
+                if asyncio.iscoroutine(work):
+                    work.close()
+                return result, None
+
+        work_task = asyncio.ensure_future(work)
+        try:
+            await asyncio.wait({self.task, work_task}, return_when=asyncio.FIRST_COMPLETED)
+            result = await self.result()
+        except BaseException:
+            # 被取消或验证出错时一并取消上游请求，不留下无人等待的采集任务
+            work_task.cancel()
+            self.task.cancel()
+            raise
+
+        if not result.success:
+            work_task.cancel()
+            try:
+                await work_task
+            except (asyncio.CancelledError, Exception):
+                pass
+            return result, None
+
+        return result, await work_task
+
+    def cancel(self) -> None:
+        self.task.cancel()
@@ -0,0 +1,293 @@
+"""
+表格驱动的批量采集任务
+从飞书源表分页读取博主链接 / 关键词，逐行调度采集，结果写入结果表，
+采集状态通过 batch_update 批量回写到源表对应行
+"""
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.models.schemas import BulkCrawlRequest
+from app.services.apikey_validator import validate_api_key
+from app.services.cookie_check import cookie_checker
+from app.services.cookie_rate import CookieInvalidError
+from app.services.douyin_collector import DouyinCollector
+from app.services.fair_scheduler import fair_scheduler
+from app.services.feishu_reader import FeishuReader, cell_text
+from app.services.feishu_writer import FeishuWriter
+from app.services.sinks import FanoutSink, FeishuSink
+from app.services.xhs_collector import XhsCollector
+
+
+STATUS_DONE = "已完成"
+STATUS_FAILED = "失败"
+
+# 最多保留的任务数（超出后淘汰最早的已结束任务）
+MAX_JOBS = 100
+
+
+class StatusWriter:
+    """源表状态回写（攒批后 batch_update）"""
+
+    def __init__(self, app_token: str, table_id: str, flush_size: int = 50):
+        self.writer = FeishuWriter(app_token, table_id)
+        self.flush_size = flush_size
+        self.updated = 0
+        self.errors: List[str] = []
+        self._buffer: List[Dict[str, Any]] = []
+        self._lock = asyncio.Lock()
+
+    async def update(self, record_id: str, fields: Dict[str, Any]) -> None:
+        self._buffer.append({"record_id": record_id, "fields": fields})
+        if len(self._buffer) >= self.flush_size:
+            await self.flush()
+
+    async def flush(self) -> None:
+        async with self._lock:
+            if not self._buffer:
+                return
+            batch, self._buffer = self._buffer, []
+            result = await self.writer.batch_update_records(batch)
+            self.updated += result.get("totalSuccess", 0)
+            if not result.get("success"):
+                self.errors.append(result.get("message", "回写状态失败"))
+
+
+class BulkCrawlJob:
+    """批量采集任务"""
+
+    def __init__(
+        self,
+        request: BulkCrawlRequest,
+        source: Tuple[str, str],
+        target: Tuple[str, str],
+        limits: Optional[Dict[str, Any]] = None
+    ):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.request = request
+        self.source = source
+        self.target = target
+        self.limits = limits or {}
+        self.status = "pending"
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.counters = {
+            "rows": 0,
+            "skipped": 0,
+            "succeeded": 0,
+            "failed": 0,
+            "records": 0,
+        }
+        self.status_writer = StatusWriter(*source)
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("completed", "failed", "cancelled")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "jobId": self.job_id,
+            "status": self.status,
+            "platform": self.request.platform,
+            "sourceTable": {"appToken": self.source[0], "tableId": self.source[1]},
+            "targetTable": {"appToken": self.target[0], "tableId": self.target[1]},
+            **self.counters,
+            "statusUpdated": self.status_writer.updated,
+            "statusErrors": self.status_writer.errors[-5:],
+            "error": self.error,
+            "createdAt": int(self.created_at),
+            "finishedAt": int(self.finished_at) if self.finished_at else None,
+        }
+
+
+class BulkCrawlManager:
+    """
+    批量采集任务管理器
+
+    所有任务共用一个全局信号量限制同时采集的行数；每个任务未完成的行数达到并发上限时暂停读取源表，
+    因此内存中最多只有一页源表记录与正在采集的行
+
+    每行采集前重新验证 API Key（使用验证缓存），与普通采集请求一样按行累计使用次数，
+    Key 在任务中途被冻结或过期后其余行直接失败
+    """
+
+    def __init__(self, concurrency: int = 2):
+        self.concurrency = concurrency
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._jobs: "OrderedDict[str, BulkCrawlJob]" = OrderedDict()
+
+    def submit(
+        self,
+        request: BulkCrawlRequest,
+        source: Tuple[str, str],
+        target: Tuple[str, str],
+        limits: Optional[Dict[str, Any]] = None
+    ) -> BulkCrawlJob:
+        job = BulkCrawlJob(request, source, target, limits)
+        self._jobs[job.job_id] = job
+        self._evict()
+        job._task = asyncio.get_running_loop().create_task(self._run(job))
+        return job
+
+    def get(self, job_id: str) -> Optional[BulkCrawlJob]:
+        return self._jobs.get(job_id)
+
+    def list(self) -> List[BulkCrawlJob]:
+        return list(reversed(self._jobs.values()))
+
+    def cancel(self, job_id: str) -> bool:
+        job = self._jobs.get(job_id)
+        if not job or job.finished or not job._task:
+            return False
+        job._task.cancel()
+        return True
+
+    def _evict(self) -> None:
+        for job_id in list(self._jobs):
+            if len(self._jobs) <= MAX_JOBS:
+                break
+            if self._jobs[job_id].finished:
+                self._jobs.pop(job_id)
+
+    def _row_target(self, fields: Dict[str, Any], request: BulkCrawlRequest) -> Optional[Tuple[str, str]]:
+        """解析一行的采集目标：("profile", 链接) 或 ("keyword", 关键词)"""
+        link = cell_text(fields.get(request.linkField))
+        if link:
+            return "profile", link
+        keyword = cell_text(fields.get(request.keywordField))
+        if keyword:
+            return "keyword", keyword
+        return None
+
+    async def _run(self, job: BulkCrawlJob) -> None:
+        request = job.request
+        job.status = "running"
+        tasks: set = set()
+
+        try:
+            reader = FeishuReader(*job.source)
+            async for items in reader.iter_pages(page_size=settings.BULK_CRAWL_PAGE_SIZE):
+                for item in items:
+                    if request.maxRows and job.counters["rows"] >= request.maxRows:
+                        break
+
+                    fields = item.get("fields") or {}
+                    target = self._row_target(fields, request)
+                    if not target or (
+                        request.skipCompleted
+                        and cell_text(fields.get(request.statusField)) == STATUS_DONE
+                    ):
+                        job.counters["skipped"] += 1
+                        continue
+
+                    job.counters["rows"] += 1
+                    while len(tasks) >= self.concurrency:
+                        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                    task = asyncio.ensure_future(self._run_row(job, item["record_id"], target))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+
+                if request.maxRows and job.counters["rows"] >= request.maxRows:
+                    break
+
+            if tasks:
+                await asyncio.gather(*tasks)
+            job.status = "completed"
+        except asyncio.CancelledError:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            job.status = "cancelled"
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+            print(f"[批量采集] 任务 {job.job_id} 失败: {e}")
+        finally:
+            try:
+                await job.status_writer.flush()
+            except Exception as e:
+                job.status_writer.errors.append(str(e))
+            job.finished_at = time.time()
+
+    async def _run_row(self, job: BulkCrawlJob, record_id: str, target: Tuple[str, str]) -> None:
+        request = job.request
+        kind, value = target
+        try:
+            async with self._semaphore:
+                # 每行按一次调用验证 API Key 并计入使用次数
+                validation_result = await validate_api_key(request.apiKey)
+                if not validation_result.success:
+                    raise Exception(validation_result.message)
+                # 每行与普通采集请求一起按 API Key 公平排队
+                count = await fair_scheduler.run(
+                    request.apiKey,
+                    self._collect(job, kind, value),
+                    cost=request.maxNotes,
+                    limits=job.limits
+                )
+            job.counters["succeeded"] += 1
+            job.counters["records"] += count
+            fields = {request.statusField: STATUS_DONE, request.resultField: f"成功采集 {count} 条"}
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            job.counters["failed"] += 1
+            fields = {request.statusField: STATUS_FAILED, request.resultField: str(e)[:500]}
+            if isinstance(e, CookieInvalidError) and not cookie_checker.cached(request.platform, request.cookie):
+                cookie_checker.mark_invalid(request.platform, request.cookie, str(e))
+
+        try:
+            await job.status_writer.update(record_id, fields)
+        except Exception as e:
+            job.status_writer.errors.append(str(e))
+
+    async def _collect(self, job: BulkCrawlJob, kind: str, value: str) -> int:
+        """采集一行，结果逐条写入结果表，返回采集条数"""
+        request = job.request
+        # Cookie 在任务中途失效后，其余行直接失败，不再请求
+        cookie_verdict = cookie_checker.known_invalid(request.platform, request.cookie)
+        if cookie_verdict:
+            raise Exception(f"Cookie 已失效: {cookie_verdict.message}")
+        write_behind = settings.FEISHU_WRITE_BEHIND if request.writeBehind is None else request.writeBehind
+        sink = FanoutSink([FeishuSink(*job.target, write_behind=write_behind)])
+        user_agent = request.userAgent or settings.DEFAULT_USER_AGENT
+        options = {
+            "max_notes": request.maxNotes,
+            "mode": request.mode,
+            "note_filter": request.filters,
+            "on_record": sink.write,
+        }
+
+        await sink.open()
+        try:
+            if request.platform == "douyin":
+                collector = DouyinCollector(cookie=request.cookie, user_agent=user_agent, ms_token=request.msToken)
+                if kind == "profile":
+                    result = await collector.collect_creator_videos(profile_url=value, **options)
+                else:
+                    result = await collector.collect_videos_by_keyword(keyword=value, sort=request.sort, **options)
+            else:
+                collector = XhsCollector(cookie=request.cookie, user_agent=user_agent)
+                if kind == "profile":
+                    result = await collector.collect_all_notes(profile_url=value, **options)
+                else:
+                    result = await collector.collect_notes_by_keyword(keyword=value, sort=request.sort, **options)
+        finally:
+            sink_results = await sink.close()
+
+        _, success_count, fail_count, _ = result
+        if success_count == 0 and fail_count > 0:
+            raise Exception(f"共 {fail_count} 条全部失败")
+        sink_error = sink_results[0].get("error")
+        if sink_error:
+            raise Exception(f"写入结果表失败: {sink_error}")
+        return success_count
+
+
+# 全局任务管理器（进程内共享）
+bulk_crawl_manager = BulkCrawlManager(concurrency=settings.BULK_CRAWL_CONCURRENCY)
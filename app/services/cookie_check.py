@@ -0,0 +1,162 @@
+"""
+Cookie 健康检查模块
+每个平台用一次轻量的签名请求检查 Cookie 登录状态，结论按 Cookie 缓存一段时间；
+采集接口开始前查询缓存，已知失效的 Cookie 直接拒绝，不再消耗 API Key 验证与请求延迟
+"""
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from app.core.config import settings
+from app.services.cookie_identity import cookie_identity
+
+
+# 最多缓存的 Cookie 数
+COOKIE_VERDICT_CACHE_SIZE = 10000
+
+
+class CookieVerdict:
+    """Cookie 检查结论"""
+
+    def __init__(self, platform: str, valid: bool, message: str, ttl: float, source: str = "probe"):
+        self.platform = platform
+        self.valid = valid
+        self.message = message
+        self.source = source  # probe: 主动检查 / collect: 采集时发现失效
+        self.checked_at = time.time()
+        self.expires_at = time.monotonic() + ttl
+
+    @property
+    def expired(self) -> bool:
+        return self.expires_at <= time.monotonic()
+
+
+class CookieChecker:
+    """Cookie 检查与结论缓存"""
+
+    def __init__(self, valid_ttl: float = 300.0, invalid_ttl: float = 600.0):
+        self.valid_ttl = valid_ttl
+        self.invalid_ttl = invalid_ttl
+        self._cache: "OrderedDict[Tuple[str, str], CookieVerdict]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._stats = {"probes": 0, "hits": 0, "rejected": 0}
+
+    @staticmethod
+    def _cache_key(platform: str, cookie: str) -> Tuple[str, str]:
+        # 账号标识 + Cookie 摘要：同一账号重新登录后 Cookie 变化，需要重新检查
+        digest = hashlib.sha256((cookie or "").encode("utf-8")).hexdigest()[:16]
+        return platform, f"{cookie_identity(cookie, platform)}:{digest}"
+
+    def cached(self, platform: str, cookie: str) -> Optional[CookieVerdict]:
+        """查询缓存的结论（不发起请求）"""
+        key = self._cache_key(platform, cookie)
+        verdict = self._cache.get(key)
+        if verdict is None:
+            return None
+        if verdict.expired:
+            self._cache.pop(key, None)
+            return None
+        return verdict
+
+    def known_invalid(self, platform: str, cookie: str) -> Optional[CookieVerdict]:
+        """Cookie 已知失效时返回结论（采集接口开始前调用）"""
+        verdict = self.cached(platform, cookie)
+        if verdict and not verdict.valid:
+            self._stats["rejected"] += 1
+            return verdict
+        return None
+
+    def _remember(self, key: Tuple[str, str], verdict: CookieVerdict) -> CookieVerdict:
+        self._cache[key] = verdict
+        self._cache.move_to_end(key)
+        while len(self._cache) > COOKIE_VERDICT_CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return verdict
+
+    def mark_invalid(self, platform: str, cookie: str, message: str) -> None:
+        """采集过程中发现 Cookie 失效时记录结论"""
+        self._remember(
+            self._cache_key(platform, cookie),
+            CookieVerdict(platform, False, message, self.invalid_ttl, source="collect"),
+        )
+
+    async def check(
+        self,
+        platform: str,
+        cookie: str,
+        user_agent: Optional[str] = None,
+        ms_token: Optional[str] = None,
+        force: bool = False
+    ) -> Tuple[CookieVerdict, bool]:
+        """
+        检查 Cookie（同一 Cookie 的并发检查只请求一次）
+
+        Returns:
+            (结论, 是否来自缓存)
+        """
+        key = self._cache_key(platform, cookie)
+        if not force:
+            verdict = self.cached(platform, cookie)
+            if verdict:
+                self._stats["hits"] += 1
+                return verdict, True
+
+        inflight = self._inflight.get(key)
+        if inflight:
+            return await asyncio.shield(inflight), False
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            valid, message = await self._probe(platform, cookie, user_agent, ms_token)
+            verdict = self._remember(
+                key,
+                CookieVerdict(platform, valid, message, self.valid_ttl if valid else self.invalid_ttl),
+            )
+            future.set_result(verdict)
+            return verdict, False
+        except BaseException as e:
+            # 检查请求本身失败（网络等）不缓存
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _probe(
+        self,
+        platform: str,
+        cookie: str,
+        user_agent: Optional[str],
+        ms_token: Optional[str]
+    ) -> Tuple[bool, str]:
+        from app.services.douyin_collector import DouyinCollector
+        from app.services.xhs_collector import XhsCollector
+
+        self._stats["probes"] += 1
+        user_agent = user_agent or settings.DEFAULT_USER_AGENT
+        if platform == "douyin":
+            return await DouyinCollector(cookie=cookie, user_agent=user_agent, ms_token=ms_token).check_login()
+        return await XhsCollector(cookie=cookie, user_agent=user_agent).check_login()
+
+    def stats(self) -> Dict[str, Any]:
+        invalid = sum(1 for verdict in self._cache.values() if not verdict.valid)
+        return {
+            **self._stats,
+            "cached": len(self._cache),
+            "cachedInvalid": invalid,
+            "validTtl": self.valid_ttl,
+            "invalidTtl": self.invalid_ttl,
+        }
+
+
+# 全局实例（进程内共享）
+cookie_checker = CookieChecker(
+    valid_ttl=settings.COOKIE_CHECK_VALID_TTL,
+    invalid_ttl=settings.COOKIE_CHECK_INVALID_TTL,
+)
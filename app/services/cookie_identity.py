@@ -0,0 +1,34 @@
+"""
+Cookie 身份识别模块
+从 Cookie 中提取账号标识，用于按账号共享缓存、限速等进程内状态
+"""
+import hashlib
+import re
+
+
+# 各平台用于标识账号的 Cookie 键（按优先级）
+IDENTITY_COOKIE_KEYS = {
+    "xhs": ("a1", "web_session"),
+    "douyin": ("sessionid", "sessionid_ss", "passport_csrf_token"),
+}
+
+
+def _find_cookie_value(cookie: str, key: str) -> str:
+    match = re.search(rf'(?:^|;)\s*{re.escape(key)}=([^;]*)', cookie or "")
+    return match.group(1).strip() if match else ""
+
+
+def cookie_identity(cookie: str, platform: str = "xhs") -> str:
+    """
+    获取 Cookie 对应的账号标识
+
+    优先使用平台的账号 Cookie（小红书 a1 / 抖音 sessionid），
+    缺失时退化为整个 Cookie 的摘要，保证同一 Cookie 始终映射到同一标识
+    """
+    for key in IDENTITY_COOKIE_KEYS.get(platform, ()):
+        value = _find_cookie_value(cookie, key)
+        if value:
+            return f"{platform}:{key}:{value}"
+
+    digest = hashlib.sha256((cookie or "").encode("utf-8")).hexdigest()[:16]
+    return f"{platform}:sha256:{digest}"
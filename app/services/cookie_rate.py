@@ -0,0 +1,257 @@
+"""
+按 Cookie 自适应限速模块
+根据上游返回的风控信号调整每个账号（Cookie 身份）的请求节奏，所有并发任务共享同一账号的状态
+
+- 请求正常时按加性增长加快节奏（延迟按速度倍数缩短），出现风控信号时按乘性减小放慢节奏（AIMD）
+- 签名失败（406）、风控验证（461 / 验证码跳转）、登录失效（code=-100）等风控信号连续出现时熔断，
+  熔断期间该账号的所有请求直接失败，冷却结束后放行一个探测请求，成功则恢复
+- 闲置超过 idle_ttl 的账号状态（熔断中的除外）在新账号加入时清除，状态数不超过 max_identities
+"""
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+import httpx
+
+from app.core.config import settings
+
+
+# 请求结果分类
+SIGNAL_OK = "ok"
+SIGNAL_ERROR = "error"  # 普通错误（网络异常、5xx），放慢节奏但不计入熔断
+SIGNAL_RISK = "risk"  # 风控信号，放慢节奏并计入熔断
+
+# 视为风控信号的 HTTP 状态码
+RISK_STATUS_CODES = {406, 429, 461, 471}
+
+# 跳转到这些地址说明触发了验证 / 登录
+RISK_URL_MARKERS = ("captcha", "website-login", "verify")
+
+BREAKER_CLOSED = "closed"
+BREAKER_OPEN = "open"
+BREAKER_HALF_OPEN = "half_open"
+
+
+class CookieCircuitOpenError(Exception):
+    """账号熔断中"""
+
+
+class CookieInvalidError(Exception):
+    """上游明确返回 Cookie 失效（code=-100），换数据源或重试都无法恢复"""
+
+
+class CookieRateState:
+    """单个账号的限速状态"""
+
+    def __init__(self, speed: float):
+        self.speed = speed
+        self.breaker = BREAKER_CLOSED
+        self.consecutive_risks = 0
+        self.opened_until = 0.0
+        self.probing = False
+        self.probe_started_at = 0.0
+        self.last_used = time.monotonic()
+        self.last_signal: Optional[str] = None
+        self.results: Deque[str] = deque(maxlen=50)
+        self.latency_ms: Deque[float] = deque(maxlen=50)
+        self.counts = {SIGNAL_OK: 0, SIGNAL_ERROR: 0, SIGNAL_RISK: 0, "breakerTrips": 0}
+
+    def to_dict(self) -> Dict[str, Any]:
+        latencies = sorted(self.latency_ms)
+        failures = sum(1 for result in self.results if result != SIGNAL_OK)
+        return {
+            "speed": round(self.speed, 3),
+            "breaker": self.breaker,
+            "reopenInSeconds": max(0, round(self.opened_until - time.monotonic())) if self.breaker == BREAKER_OPEN else 0,
+            "consecutiveRisks": self.consecutive_risks,
+            "errorRate": round(failures / len(self.results), 3) if self.results else 0,
+            "p50Ms": round(latencies[len(latencies) // 2]) if latencies else None,
+            "lastSignal": self.last_signal,
+            **self.counts,
+        }
+
+
+class CookieRateController:
+    """按 Cookie 身份的 AIMD 限速与熔断"""
+
+    def __init__(
+        self,
+        min_speed: float = 0.25,
+        max_speed: float = 2.0,
+        increase: float = 0.05,
+        decrease: float = 0.5,
+        slow_latency: float = 5.0,
+        breaker_threshold: int = 3,
+        breaker_cooldown: float = 300.0,
+        probe_timeout: float = 60.0,
+        idle_ttl: float = 1800.0,
+        max_identities: int = 10000
+    ):
+        self.min_speed = min_speed
+        self.max_speed = max_speed
+        self.increase = increase
+        self.decrease = decrease
+        self.slow_latency = slow_latency
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.probe_timeout = probe_timeout
+        self.idle_ttl = idle_ttl
+        self.max_identities = max_identities
+        # 按最近使用时间排序（最久未使用的在前）
+        self._states: "OrderedDict[str, CookieRateState]" = OrderedDict()
+
+    def state(self, identity: str) -> CookieRateState:
+        now = time.monotonic()
+        state = self._states.get(identity)
+        if state is None:
+            self._evict(now)
+            state = self._states[identity] = CookieRateState(speed=1.0)
+        else:
+            self._states.move_to_end(identity)
+        state.last_used = now
+        return state
+
+    def _evict(self, now: float) -> None:
+        """
+        清除闲置的账号状态；超过上限时从最久未使用的开始清除。
+        熔断中（冷却未结束或仍在使用）的账号不清除，清除后重新创建不会绕过熔断
+        """
+        for identity, state in list(self._states.items()):
+            idle = now - state.last_used >= self.idle_ttl
+            if len(self._states) < self.max_identities and not idle:
+                break
+            if state.breaker != BREAKER_CLOSED and (now < state.opened_until or not idle):
+                continue
+            del self._states[identity]
+
+    def delay_factor(self, identity: str) -> float:
+        """配置的延迟乘以该系数（速度越快延迟越短）"""
+        return 1.0 / self.state(identity).speed
+
+    def check(self, identity: str) -> None:
+        """发起请求前检查熔断状态，熔断中抛出 CookieCircuitOpenError"""
+        state = self.state(identity)
+        if state.breaker == BREAKER_CLOSED:
+            return
+
+        remaining = state.opened_until - time.monotonic()
+        if state.breaker == BREAKER_OPEN and remaining <= 0:
+            state.breaker = BREAKER_HALF_OPEN
+            state.probing = False
+
+        now = time.monotonic()
+        if state.breaker == BREAKER_HALF_OPEN and (
+            not state.probing or now - state.probe_started_at > self.probe_timeout
+        ):
+            # 冷却结束（或上一个探测请求长时间没有结果），放行一个探测请求
+            state.probing = True
+            state.probe_started_at = now
+            return
+
+        raise CookieCircuitOpenError(
+            f"账号触发风控（{state.last_signal or '未知'}），已暂停请求，约 {max(1, round(remaining))} 秒后重试"
+        )
+
+    def release_probe(self, identity: str) -> None:
+        """请求被取消或因非上游原因失败、没有调用 record 时释放探测名额"""
+        state = self.state(identity)
+        if state.breaker == BREAKER_HALF_OPEN:
+            state.probing = False
+
+    def record(self, identity: str, signal: str, latency: Optional[float] = None, detail: str = "") -> None:
+        """记录一次请求结果并调整节奏"""
+        state = self.state(identity)
+        state.results.append(signal)
+        state.counts[signal] += 1
+        if latency is not None:
+            state.latency_ms.append(latency * 1000)
+
+        if signal == SIGNAL_OK:
+            state.consecutive_risks = 0
+            if state.breaker == BREAKER_HALF_OPEN:
+                # 探测成功：恢复，从最低速度重新爬升
+                state.breaker = BREAKER_CLOSED
+                state.probing = False
+                state.speed = self.min_speed
+            elif latency is None or latency < self.slow_latency:
+                state.speed = min(self.max_speed, state.speed + self.increase)
+            return
+
+        state.speed = max(self.min_speed, state.speed * self.decrease)
+        state.last_signal = detail or signal
+        if signal != SIGNAL_RISK:
+            if state.breaker == BREAKER_HALF_OPEN:
+                state.probing = False
+            return
+
+        state.consecutive_risks += 1
+        if state.breaker == BREAKER_HALF_OPEN or state.consecutive_risks >= self.breaker_threshold:
+            state.breaker = BREAKER_OPEN
+            state.probing = False
+            state.opened_until = time.monotonic() + self.breaker_cooldown
+            state.counts["breakerTrips"] += 1
+            print(f"[限速] 账号 {_mask_identity(identity)} 触发风控熔断: {state.last_signal}")
+
+    def classify_response(self, response: httpx.Response, payload: Any = None) -> Tuple[str, str]:
+        """
+        按 HTTP 状态码、最终地址与响应数据判断请求结果，返回 (分类, 说明)
+
+        payload 为调用方已解析的 JSON 响应（见 json_payload），此处不再重复解析
+        """
+        if response.status_code in RISK_STATUS_CODES:
+            return SIGNAL_RISK, f"HTTP {response.status_code}"
+        if any(marker in response.url.path for marker in RISK_URL_MARKERS):
+            return SIGNAL_RISK, "跳转验证页"
+        if response.status_code >= 500:
+            return SIGNAL_ERROR, f"HTTP {response.status_code}"
+        if response.status_code == 200 and not response.content:
+            # 抖音签名被拒绝时返回 200 空响应
+            return SIGNAL_RISK, "空响应"
+        if isinstance(payload, dict) and payload.get("code") == -100:
+            return SIGNAL_RISK, "code=-100"
+        return SIGNAL_OK, ""
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "minSpeed": self.min_speed,
+            "maxSpeed": self.max_speed,
+            "breakerThreshold": self.breaker_threshold,
+            "breakerCooldown": self.breaker_cooldown,
+            "probeTimeout": self.probe_timeout,
+            "idleTtl": self.idle_ttl,
+            "identities": {
+                _mask_identity(identity): state.to_dict()
+                for identity, state in self._states.items()
+            },
+        }
+
+
+def json_payload(response: httpx.Response) -> Any:
+    """解析 JSON 响应（非 JSON 或解析失败时为 None），解析结果供限速分类与调用方共用"""
+    if "json" not in response.headers.get("content-type", ""):
+        return None
+    try:
+        return response.json()
+    except ValueError:
+        return None
+
+
+def _mask_identity(identity: str) -> str:
+    """监控输出中隐藏账号 Cookie 值"""
+    prefix, _, value = identity.rpartition(":")
+    return f"{prefix}:{value[:6]}***" if value else identity
+
+
+# 全局控制器（进程内所有采集任务共享）
+cookie_rate_controller = CookieRateController(
+    min_speed=settings.COOKIE_RATE_MIN_SPEED,
+    max_speed=settings.COOKIE_RATE_MAX_SPEED,
+    increase=settings.COOKIE_RATE_INCREASE,
+    decrease=settings.COOKIE_RATE_DECREASE,
+    slow_latency=settings.COOKIE_RATE_SLOW_LATENCY,
+    breaker_threshold=settings.COOKIE_BREAKER_THRESHOLD,
+    breaker_cooldown=settings.COOKIE_BREAKER_COOLDOWN,
+    probe_timeout=settings.COOKIE_BREAKER_PROBE_TIMEOUT,
+    idle_ttl=settings.COOKIE_STATE_IDLE_TTL,
+    max_identities=settings.COOKIE_STATE_MAX_IDENTITIES,
+)
@@ -7,6 +7,7 @@ import asyncio
 import json
 import random
 import re
+import time
 from http.cookies import SimpleCookie
 from typing import Any, Dict, List, Optional, Tuple
 from urllib.parse import parse_qs, quote, urlencode, urlparse
@@ -14,8 +15,15 @@ from urllib.parse import parse_qs, quote, urlencode, urlparse
 import httpx
 
 from app.core.config import settings
-from app.models.schemas import NoteRecord
+from app.models.schemas import NoteFilter, NoteRecord, RecordCallback
+from app.services.cookie_identity import cookie_identity
+from app.services.cookie_rate import SIGNAL_ERROR, cookie_rate_controller, json_payload
+from app.services.identity_scheduler import identity_scheduler
+from app.services.request_coalescer import request_coalescer
+from app.services.request_deadline import DeadlineExceeded, current_deadline
+from app.services.retry_engine import ACTION_ABORT, retry_engine
 from app.services.douyin_sign import DouyinSigner
+from app.services.note_filter import NoteSelector, aweme_metrics
 
 
 class DouyinCollector:
@@ -29,18 +37,23 @@ class DouyinCollector:
         self._signer = DouyinSigner()
         self._host = "https://www.douyin.com"
         self._verify_fp = "verify_ma3hrt8n_q2q2HyYA_uLyO_4N6D_BLvX_E2LgoGmkA1BU"
+        self.identity = cookie_identity(cookie, "douyin")
 
     async def _random_delay(self, min_sec: float, max_sec: float) -> float:
-        delay = random.uniform(min_sec, max_sec)
+        # 按账号当前健康状况缩放延迟，随请求剩余时间预算缩短
+        delay = random.uniform(min_sec, max_sec) * cookie_rate_controller.delay_factor(self.identity)
+        delay = current_deadline().cap_delay(delay)
         await asyncio.sleep(delay)
         return delay
 
     async def _get_smart_delay(self, index: int) -> float:
+        # 笔记之间：同一账号有交互式请求时先让出账号
+        yielded = await identity_scheduler.yield_to_interactive(self.identity)
         if index < 5:
-            return await self._random_delay(*settings.DELAY_BETWEEN_NOTES_EARLY)
+            return yielded + await self._random_delay(*settings.DELAY_BETWEEN_NOTES_EARLY)
         if index < 10:
-            return await self._random_delay(*settings.DELAY_BETWEEN_NOTES_MIDDLE)
-        return await self._random_delay(*settings.DELAY_BETWEEN_NOTES_LATE)
+            return yielded + await self._random_delay(*settings.DELAY_BETWEEN_NOTES_MIDDLE)
+        return yielded + await self._random_delay(*settings.DELAY_BETWEEN_NOTES_LATE)
 
     def _extract_cookie_value(self, key: str) -> str:
         cookie = SimpleCookie()
@@ -116,13 +129,34 @@ class DouyinCollector:
         headers = self._build_headers(referer=referer)
         url = f"{self._host}{uri}"
 
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(url, params=merged_params, headers=headers)
+        # 在账号调度器排队（同一账号的并发任务共享请求间隔），账号熔断中直接失败，请求结果报告给限速控制器；
+        # 超时不超过请求剩余的时间预算
+        deadline = current_deadline()
+        async with identity_scheduler.slot(self.identity):
+            if not deadline.allows(0):
+                raise DeadlineExceeded("请求时间预算已用完")
+            cookie_rate_controller.check(self.identity)
+            started = time.monotonic()
+            try:
+                async with httpx.AsyncClient(timeout=deadline.timeout(30.0)) as client:
+                    response = await client.get(url, params=merged_params, headers=headers)
+            except httpx.TransportError as e:
+                cookie_rate_controller.record(self.identity, SIGNAL_ERROR, detail=type(e).__name__)
+                raise
+            except BaseException:
+                # 请求被取消或出现其他异常，没有结果可报告，释放可能占用的探测名额
+                cookie_rate_controller.release_probe(self.identity)
+                raise
+        # JSON 只解析一次，限速分类与下面的结果检查共用
+        data = json_payload(response)
+        signal, detail = cookie_rate_controller.classify_response(response, data)
+        cookie_rate_controller.record(self.identity, signal, time.monotonic() - started, detail)
 
         if response.status_code != 200:
             raise Exception(f"抖音接口请求失败: HTTP {response.status_code}")
 
-        data = response.json()
+        if data is None:
+            data = response.json()
         status_code = data.get("status_code")
         if status_code not in (None, 0):
             raise Exception(f"抖音接口返回异常: {data.get('status_msg', status_code)}")
@@ -230,7 +264,28 @@ class DouyinCollector:
             deduped.append(tag)
         return deduped
 
+    async def check_login(self) -> Tuple[bool, str]:
+        """检查 Cookie 是否处于登录状态（请求 query/user，一次签名请求），返回 (是否有效, 说明)"""
+        if not self._extract_cookie_value("sessionid"):
+            return False, "Cookie 缺少 sessionid"
+        try:
+            data = await self._get("/aweme/v1/web/query/user/", {})
+        except ValueError:
+            # 空响应：签名被拒绝或账号异常
+            return False, "Cookie 已失效"
+        user_uid = str(data.get("user_uid") or "")
+        if not user_uid or user_uid == "0":
+            return False, "Cookie 未登录"
+        return True, "已登录"
+
     async def fetch_video_detail(self, aweme_id: str) -> Dict[str, Any]:
+        # 同一视频的并发请求只发起一次
+        return await request_coalescer.run(
+            "douyin", "video_detail", aweme_id, self.identity,
+            lambda: self._fetch_video_detail(aweme_id)
+        )
+
+    async def _fetch_video_detail(self, aweme_id: str) -> Dict[str, Any]:
         uri = "/aweme/v1/web/aweme/detail/"
         params = {"aweme_id": aweme_id}
         data = await self._get(uri, params, referer=f"https://www.douyin.com/video/{aweme_id}")
@@ -240,6 +295,13 @@ class DouyinCollector:
         return aweme_detail
 
     async def fetch_user_profile(self, sec_user_id: str) -> Dict[str, Any]:
+        # 同一博主的并发请求只发起一次
+        return await request_coalescer.run(
+            "douyin", "user_profile", sec_user_id, self.identity,
+            lambda: self._fetch_user_profile(sec_user_id)
+        )
+
+    async def _fetch_user_profile(self, sec_user_id: str) -> Dict[str, Any]:
         uri = "/aweme/v1/web/user/profile/other/"
         params = {
             "sec_user_id": sec_user_id,
@@ -248,13 +310,18 @@ class DouyinCollector:
         }
         return await self._get(uri, params, referer=f"https://www.douyin.com/user/{sec_user_id}")
 
-    async def fetch_user_posts(self, sec_user_id: str, max_notes: int) -> List[Dict[str, Any]]:
+    async def fetch_user_posts(
+        self,
+        sec_user_id: str,
+        max_notes: int,
+        note_filter: Optional[NoteFilter] = None,
+    ) -> List[Dict[str, Any]]:
         uri = "/aweme/v1/web/aweme/post/"
         max_cursor = "0"
         has_more = True
-        results: List[Dict[str, Any]] = []
+        selector = NoteSelector(note_filter, max_notes)
 
-        while has_more and len(results) < max_notes:
+        while has_more and not selector.done:
             params = {
                 "sec_user_id": sec_user_id,
                 "count": 18,
@@ -266,24 +333,29 @@ class DouyinCollector:
             }
             data = await self._get(uri, params, referer=f"https://www.douyin.com/user/{sec_user_id}")
             aweme_list = data.get("aweme_list") or []
-            if aweme_list:
-                for item in aweme_list:
-                    results.append(item)
-                    if len(results) >= max_notes:
-                        break
+            for item in aweme_list:
+                selector.offer(item, aweme_metrics(item))
+                if selector.done:
+                    break
             has_more = bool(data.get("has_more"))
             max_cursor = str(data.get("max_cursor") or "0")
 
-            if has_more and len(results) < max_notes:
+            if has_more and not selector.done:
                 await self._random_delay(0.4, 1.2)
 
-        return results
+        return selector.results()
 
-    async def search_videos(self, keyword: str, max_notes: int, sort: str = "general") -> List[Dict[str, Any]]:
+    async def search_videos(
+        self,
+        keyword: str,
+        max_notes: int,
+        sort: str = "general",
+        note_filter: Optional[NoteFilter] = None,
+    ) -> List[Dict[str, Any]]:
         uri = "/aweme/v1/web/general/search/single/"
         offset = 0
         search_id = ""
-        results: List[Dict[str, Any]] = []
+        selector = NoteSelector(note_filter, max_notes)
         sort_map = {
             "general": 0,
             "most_like": 1,
@@ -293,9 +365,8 @@ class DouyinCollector:
         }
         sort_value = sort_map.get(sort, 0)
 
-        while len(results) < max_notes:
-            remaining = max_notes - len(results)
-            count = min(15, remaining)
+        while not selector.done:
+            count = 15 if note_filter else min(15, max_notes - selector.scanned)
             params = {
                 "search_channel": "aweme_general",
                 "enable_history": "1",
@@ -328,17 +399,17 @@ class DouyinCollector:
                     aweme_info = mix_items[0] if mix_items else None
                 if not isinstance(aweme_info, dict):
                     continue
-                results.append(aweme_info)
-                if len(results) >= max_notes:
+                selector.offer(aweme_info, aweme_metrics(aweme_info))
+                if selector.done:
                     break
 
             search_id = data.get("extra", {}).get("logid") or search_id
             offset += count
 
-            if len(results) < max_notes:
+            if not selector.done:
                 await self._random_delay(0.4, 1.2)
 
-        return results
+        return selector.results()
 
     async def _ensure_aweme_detail(self, aweme_item: Dict[str, Any]) -> Dict[str, Any]:
         if aweme_item.get("statistics") and (aweme_item.get("video") or aweme_item.get("images")):
@@ -419,7 +490,7 @@ class DouyinCollector:
 
     async def collect_single_video(self, video_url: str) -> NoteRecord:
         aweme_id = await self.resolve_video_id(video_url)
-        detail = await self.fetch_video_detail(aweme_id)
+        detail = await retry_engine.run(lambda: self.fetch_video_detail(aweme_id))
         return self.process_aweme_detail(detail)
 
     async def collect_creator_profile(self, profile_url: str) -> NoteRecord:
@@ -427,69 +498,134 @@ class DouyinCollector:
         profile_data = await self.fetch_user_profile(sec_user_id)
         return self.process_profile_info(profile_data, sec_user_id)
 
+    def _build_list_records(self, aweme_list: List[Dict[str, Any]]) -> Tuple[List[NoteRecord], int, int, List[str]]:
+        """List mode: build records from list items without detail requests or pacing delays."""
+        records: List[NoteRecord] = []
+        failed_ids: List[str] = []
+
+        for aweme_item in aweme_list:
+            try:
+                records.append(self.process_aweme_detail(aweme_item))
+            except Exception as exc:
+                aweme_id = aweme_item.get("aweme_id") or ""
+                failed_ids.append(aweme_id)
+                print(f"处理抖音视频 {aweme_id} 列表数据失败: {exc}")
+
+        return records, len(records), len(failed_ids), failed_ids
+
+    async def _emit_records(
+        self,
+        result: Tuple[List[NoteRecord], int, int, List[str]],
+        on_record: Optional[RecordCallback],
+    ) -> Tuple[List[NoteRecord], int, int, List[str]]:
+        """Pass already-built records to the callback one by one."""
+        if on_record:
+            for record in result[0]:
+                await on_record(record)
+        return result
+
     async def collect_creator_videos(
         self,
         profile_url: str,
         max_notes: int = 20,
+        mode: str = "detail",
+        note_filter: Optional[NoteFilter] = None,
+        on_record: Optional[RecordCallback] = None,
     ) -> Tuple[List[NoteRecord], int, int, List[str]]:
         sec_user_id = self._extract_sec_user_id(profile_url)
         await self._random_delay(*settings.DELAY_BEFORE_HOME)
-        aweme_list = await self.fetch_user_posts(sec_user_id, max_notes)
+        aweme_list = await self.fetch_user_posts(sec_user_id, max_notes, note_filter)
 
         if not aweme_list:
             return [], 0, 0, []
 
-        records: List[NoteRecord] = []
-        failed_ids: List[str] = []
-        success_count = 0
-        fail_count = 0
-
-        for index, aweme_item in enumerate(aweme_list):
-            try:
-                aweme_detail = await self._ensure_aweme_detail(aweme_item)
-                record = self.process_aweme_detail(aweme_detail)
-                records.append(record)
-                success_count += 1
-            except Exception as exc:
-                aweme_id = aweme_item.get("aweme_id") or ""
-                failed_ids.append(aweme_id)
-                fail_count += 1
-                print(f"采集抖音视频 {aweme_id} 失败: {exc}")
-
-            if index < len(aweme_list) - 1:
-                await self._get_smart_delay(index)
+        if mode == "list":
+            return await self._emit_records(self._build_list_records(aweme_list), on_record)
 
-        return records, success_count, fail_count, failed_ids
+        return await self._collect_aweme_details(aweme_list, on_record)
 
     async def collect_videos_by_keyword(
         self,
         keyword: str,
         max_notes: int = 20,
         sort: str = "general",
+        mode: str = "detail",
+        note_filter: Optional[NoteFilter] = None,
+        on_record: Optional[RecordCallback] = None,
     ) -> Tuple[List[NoteRecord], int, int, List[str]]:
-        aweme_list = await self.search_videos(keyword, max_notes, sort)
+        aweme_list = await self.search_videos(keyword, max_notes, sort, note_filter)
 
         if not aweme_list:
             return [], 0, 0, []
 
+        if mode == "list":
+            return await self._emit_records(self._build_list_records(aweme_list), on_record)
+
+        return await self._collect_aweme_details(aweme_list, on_record)
+
+    async def _collect_aweme_details(
+        self,
+        aweme_list: List[Dict[str, Any]],
+        on_record: Optional[RecordCallback],
+    ) -> Tuple[List[NoteRecord], int, int, List[str]]:
+        # 逐条获取视频详情：按错误类型重试，临时错误在全部视频处理完后再统一重试一轮，Cookie 失效时终止任务；
+        # 请求时间预算不够再采集一条视频时停止，返回已采集的记录
         records: List[NoteRecord] = []
         failed_ids: List[str] = []
-        success_count = 0
-        fail_count = 0
+        deferred: List[Dict[str, Any]] = []
+        deadline = current_deadline()
+        started = time.monotonic()
+        processed = 0
 
-        for index, aweme_item in enumerate(aweme_list):
+        async def collect(aweme_item: Dict[str, Any], final: bool) -> None:
+            aweme_id = aweme_item.get("aweme_id") or ""
             try:
-                aweme_detail = await self._ensure_aweme_detail(aweme_item)
+                aweme_detail = await retry_engine.run(lambda: self._ensure_aweme_detail(aweme_item))
                 record = self.process_aweme_detail(aweme_detail)
-                records.append(record)
-                success_count += 1
+            except DeadlineExceeded:
+                raise
             except Exception as exc:
-                aweme_id = aweme_item.get("aweme_id") or ""
+                if retry_engine.classify(exc) == ACTION_ABORT:
+                    raise
+                if not final and retry_engine.deferrable(exc):
+                    deferred.append(aweme_item)
+                    retry_engine.record_deferred()
+                    print(f"采集抖音视频 {aweme_id} 失败，稍后重试: {exc}")
+                    return
                 failed_ids.append(aweme_id)
-                fail_count += 1
                 print(f"采集抖音视频 {aweme_id} 失败: {exc}")
-
-            if index < len(aweme_list) - 1:
-                await self._get_smart_delay(index)
-
-        return records, success_count, fail_count, failed_ids
+                return
+
+            if final:
+                retry_engine.record_deferred(recovered=True)
+            records.append(record)
+            if on_record:
+                await on_record(record)
+
+        async def collect_pass(aweme_items: List[Dict[str, Any]], final: bool) -> int:
+            # 依次采集，返回处理完的视频数（时间预算用完时提前返回）
+            nonlocal processed
+            for index, aweme_item in enumerate(aweme_items):
+                if processed and not deadline.allows((time.monotonic() - started) / processed):
+                    deadline.mark_partial(f"剩余时间不足，未采集 {len(aweme_items) - index} 条视频")
+                    return index
+                try:
+                    await collect(aweme_item, final)
+                except DeadlineExceeded:
+                    deadline.mark_partial("请求时间预算已用完")
+                    return index
+                processed += 1
+                if index < len(aweme_items) - 1:
+                    await self._get_smart_delay(index)
+            return len(aweme_items)
+
+        retry_list: List[Dict[str, Any]] = []
+        if await collect_pass(aweme_list, final=False) == len(aweme_list) and deferred:
+            print(f"{len(deferred)} 条抖音视频延后重试")
+            retry_list, deferred = deferred, []
+            await self._random_delay(*settings.RETRY_DEFERRED_DELAY)
+            retry_list = retry_list[await collect_pass(retry_list, final=True):]
+        # 时间预算用完未能重试的视频计为失败
+        failed_ids.extend(aweme_item.get("aweme_id") or "" for aweme_item in deferred + retry_list)
+
+        return records, len(records), len(failed_ids), failed_ids
@@ -0,0 +1,241 @@
+"""
+按 API Key 公平调度采集请求
+路由与采集器之间的调度层：全局限制同时进行的采集数，
+按 API Key 加权公平排队（WFQ），并限制每个 Key 的并发数与每分钟请求数
+
+- 请求成本按采集数量计算（单条采集为 1，列表采集为 maxNotes），
+  同一个 Key 提交的大批量任务不会挡住其他 Key 的单条请求
+- Key 的并发上限 / 每分钟请求数 / 权重可由签名 Key 套餐或 API Key 管理表配置，未配置时使用默认值
+- 空闲（无进行中 / 排队请求、令牌已恢复满额）的 Key 在新 Key 加入时清除，状态数不随历史 Key 增长
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Deque, Dict, Optional
+
+from app.core.config import settings
+
+
+class _Waiter:
+    """排队中的请求"""
+
+    __slots__ = ("future", "tag", "enqueued_at")
+
+    def __init__(self, future: asyncio.Future, tag: float):
+        self.future = future
+        self.tag = tag
+        self.enqueued_at = time.monotonic()
+
+
+class _KeyState:
+    """单个 API Key 的调度状态"""
+
+    def __init__(self, concurrency: int, rate_per_minute: float, weight: float):
+        self.concurrency = concurrency
+        self.rate_per_minute = rate_per_minute
+        self.weight = weight
+        self.queue: Deque[_Waiter] = deque()
+        self.running = 0
+        self.finish_tag = 0.0
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.stats = {"requests": 0, "waitTotal": 0.0, "waitMax": 0.0}
+
+    @property
+    def capacity(self) -> float:
+        # 允许的突发请求数（至少 1）
+        return max(1.0, self.rate_per_minute / 6) if self.rate_per_minute > 0 else 1.0
+
+    def _refill(self, now: float) -> None:
+        if self.rate_per_minute > 0:
+            rate = self.rate_per_minute / 60
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * rate)
+        self.updated_at = now
+
+    def token_wait(self, now: float) -> float:
+        """距下一个令牌可用的秒数（0 表示可立即使用）"""
+        if self.rate_per_minute <= 0:
+            return 0.0
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / (self.rate_per_minute / 60)
+
+    def take_token(self) -> None:
+        if self.rate_per_minute > 0:
+            self.tokens -= 1
+
+    def idle(self, now: float, virtual_time: float) -> bool:
+        """
+        是否可以清除（重新创建时与保留状态等价）：
+        无进行中 / 排队请求，令牌已恢复满额，完成标签不超过当前虚拟时间
+        """
+        if self.running or self.queue or self.finish_tag > virtual_time:
+            return False
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class FairShareScheduler:
+    """按 API Key 加权公平调度"""
+
+    def __init__(self, concurrency: int = 8, key_concurrency: int = 2, key_rate_per_minute: float = 60.0):
+        self.concurrency = concurrency
+        self.key_concurrency = key_concurrency
+        self.key_rate_per_minute = key_rate_per_minute
+        self._keys: Dict[str, _KeyState] = {}
+        self._running = 0
+        self._virtual_time = 0.0
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def _state(self, key: str, limits: Optional[Dict[str, Any]]) -> _KeyState:
+        limits = limits or {}
+        concurrency = int(limits.get("concurrency") or self.key_concurrency)
+        rate = float(limits.get("ratePerMinute") or self.key_rate_per_minute)
+        weight = float(limits.get("weight") or 1.0)
+
+        state = self._keys.get(key)
+        if state is None:
+            self._evict_idle()
+            state = self._keys[key] = _KeyState(concurrency, rate, weight)
+        elif limits:
+            # 管理表中的配置可能变化，以最新一次为准（未带配置的调用不覆盖已有配置）
+            state.concurrency, state.rate_per_minute, state.weight = concurrency, rate, weight
+        return state
+
+    def _evict_idle(self) -> None:
+        """清除空闲 Key 的状态"""
+        now = time.monotonic()
+        for key in [key for key, state in self._keys.items() if state.idle(now, self._virtual_time)]:
+            del self._keys[key]
+
+    async def run(
+        self,
+        key: str,
+        work: Awaitable[Any],
+        cost: float = 1.0,
+        limits: Optional[Dict[str, Any]] = None
+    ) -> Any:
+        """
+        排队获得执行名额后执行 work
+
+        Args:
+            key: API Key
+            work: 待执行的协程
+            cost: 请求成本（采集数量）
+            limits: Key 的调度配置（concurrency / ratePerMinute / weight）
+        """
+        try:
+            await self._acquire(key, cost, limits)
+        except BaseException:
+            # 排队期间被取消，协程未开始执行
+            if asyncio.iscoroutine(work):
+                work.close()
+            raise
+
+        try:
+            return await work
+        finally:
+            self._release(key)
+
+    async def _acquire(self, key: str, cost: float, limits: Optional[Dict[str, Any]]) -> None:
+        state = self._state(key, limits)
+        tag = max(self._virtual_time, state.finish_tag) + max(cost, 1.0) / state.weight
+        state.finish_tag = tag
+
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), tag)
+        state.queue.append(waiter)
+        self._dispatch()
+
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # 已分配名额但调用方被取消
+                self._release(key)
+            elif waiter in state.queue:
+                state.queue.remove(waiter)
+            raise
+
+        wait = time.monotonic() - waiter.enqueued_at
+        state.stats["requests"] += 1
+        state.stats["waitTotal"] += wait
+        state.stats["waitMax"] = max(state.stats["waitMax"], wait)
+
+    def _release(self, key: str) -> None:
+        self._running -= 1
+        self._keys[key].running -= 1
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """按完成标签从小到大分配空闲名额（跳过已达并发上限或请求频率上限的 Key）"""
+        now = time.monotonic()
+        while self._running < self.concurrency:
+            best: Optional[_KeyState] = None
+            retry_in: Optional[float] = None
+
+            for state in self._keys.values():
+                while state.queue and state.queue[0].future.done():
+                    state.queue.popleft()
+                if not state.queue or state.running >= state.concurrency:
+                    continue
+                wait = state.token_wait(now)
+                if wait > 0:
+                    retry_in = wait if retry_in is None else min(retry_in, wait)
+                    continue
+                if best is None or state.queue[0].tag < best.queue[0].tag:
+                    best = state
+
+            if best is None:
+                if retry_in is not None:
+                    self._schedule_retry(retry_in)
+                return
+
+            waiter = best.queue.popleft()
+            best.take_token()
+            best.running += 1
+            self._running += 1
+            self._virtual_time = max(self._virtual_time, waiter.tag)
+            waiter.future.set_result(None)
+
+    def _schedule_retry(self, delay: float) -> None:
+        """有 Key 仅因请求频率受限而等待时，令牌恢复后再次分配"""
+        if self._timer is not None and not self._timer.cancelled():
+            self._timer.cancel()
+        self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+
+    def stats(self) -> Dict[str, Any]:
+        keys = {}
+        for key, state in self._keys.items():
+            requests = state.stats["requests"]
+            keys[_mask_key(key)] = {
+                "running": state.running,
+                "queued": len(state.queue),
+                "requests": requests,
+                "avgWaitMs": round(state.stats["waitTotal"] / requests * 1000, 1) if requests else 0,
+                "maxWaitMs": round(state.stats["waitMax"] * 1000, 1),
+                "concurrency": state.concurrency,
+                "ratePerMinute": state.rate_per_minute,
+                "weight": state.weight,
+            }
+        return {
+            "running": self._running,
+            "queued": sum(len(state.queue) for state in self._keys.values()),
+            "concurrency": self.concurrency,
+            "keys": keys,
+        }
+
+
+def _mask_key(key: str) -> str:
+    """监控输出中隐藏 API Key 中间部分"""
+    if len(key) <= 8:
+        return key[:2] + "***"
+    return f"{key[:4]}***{key[-4:]}"
+
+
+# 全局调度器（进程内共享）
+fair_scheduler = FairShareScheduler(
+    concurrency=settings.FAIR_SCHEDULER_CONCURRENCY,
+    key_concurrency=settings.FAIR_KEY_CONCURRENCY,
+    key_rate_per_minute=settings.FAIR_KEY_RATE_PER_MINUTE,
+)
@@ -0,0 +1,330 @@
+"""
+飞书附件上传模块
+将图片 / 封面的 CDN 链接流式下载并上传到飞书素材接口，转换为附件字段可写入的 file_token
+
+- 下载内容边读边计算哈希，写入临时文件（小文件留在内存，大文件落盘），上传时从文件流式读取
+- 全局信号量限制并发下载 / 上传数
+- 本地 SQLite 缓存 (app_token, 内容哈希) -> file_token 与 (app_token, 链接) -> 内容哈希，
+  相同图片（包括不同链接的转载图片）不会重复上传
+"""
+import asyncio
+import hashlib
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from app.core.config import settings
+from app.services.request_deadline import current_deadline
+
+
+# 内容小于该值时临时文件保留在内存中
+SPOOL_MAX_MEMORY = 1024 * 1024
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS media_cache (
+    app_token TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    file_token TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (app_token, content_hash)
+);
+CREATE TABLE IF NOT EXISTS media_url (
+    app_token TEXT NOT NULL,
+    url TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    PRIMARY KEY (app_token, url)
+);
+"""
+
+CONTENT_TYPE_EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/webp": ".webp",
+    "image/gif": ".gif",
+    "image/heic": ".heic",
+    "video/mp4": ".mp4",
+}
+
+
+def split_attachment_urls(value) -> List[str]:
+    """从字段值中提取链接（支持换行 / 逗号分隔的文本与列表）"""
+    if value is None:
+        return []
+    if isinstance(value, dict):
+        value = value.get("link") or value.get("url") or value.get("text") or ""
+    if isinstance(value, list):
+        urls: List[str] = []
+        for item in value:
+            urls.extend(split_attachment_urls(item))
+        return urls
+    return [part.strip() for part in re.split(r"[\n,，\s]+", str(value)) if part.strip().startswith("http")]
+
+
+class MediaCache:
+    """素材 file_token 本地缓存"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _lookup_url(self, app_token: str, url: str) -> Optional[str]:
+        with self._lock:
+            row = self._connect().execute(
+                """
+                SELECT c.file_token FROM media_url u
+                JOIN media_cache c ON c.app_token = u.app_token AND c.content_hash = u.content_hash
+                WHERE u.app_token = ? AND u.url = ?
+                """,
+                (app_token, url)
+            ).fetchone()
+            return row[0] if row else None
+
+    def _lookup_hash(self, app_token: str, content_hash: str) -> Optional[str]:
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT file_token FROM media_cache WHERE app_token = ? AND content_hash = ?",
+                (app_token, content_hash)
+            ).fetchone()
+            return row[0] if row else None
+
+    def _store(self, app_token: str, url: str, content_hash: str, file_token: Optional[str], size: int) -> None:
+        with self._lock:
+            conn = self._connect()
+            if file_token:
+                conn.execute(
+                    "INSERT OR REPLACE INTO media_cache (app_token, content_hash, file_token, size, created_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (app_token, content_hash, file_token, size, time.time())
+                )
+            conn.execute(
+                "INSERT OR REPLACE INTO media_url (app_token, url, content_hash) VALUES (?, ?, ?)",
+                (app_token, url, content_hash)
+            )
+
+    async def lookup_url(self, app_token: str, url: str) -> Optional[str]:
+        return await asyncio.to_thread(self._lookup_url, app_token, url)
+
+    async def lookup_hash(self, app_token: str, content_hash: str) -> Optional[str]:
+        return await asyncio.to_thread(self._lookup_hash, app_token, content_hash)
+
+    async def store(self, app_token: str, url: str, content_hash: str, file_token: Optional[str], size: int) -> None:
+        await asyncio.to_thread(self._store, app_token, url, content_hash, file_token, size)
+
+
+class AttachmentUploader:
+    """附件上传器"""
+
+    def __init__(self, cache: MediaCache, concurrency: int = 4, max_bytes: int = 20 * 1024 * 1024):
+        self.cache = cache
+        self.max_bytes = max_bytes
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._hash_inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._stats = {"uploaded": 0, "urlHits": 0, "hashHits": 0, "failed": 0, "bytes": 0}
+
+    async def upload_urls(
+        self,
+        urls: List[str],
+        app_token: str,
+        token: str,
+        base_url: str,
+        parent_type: str = "bitable_image"
+    ) -> Dict[str, Optional[str]]:
+        """
+        上传一组链接，返回 链接 -> file_token（失败为 None）
+
+        同一链接的并发上传会合并为一次
+        """
+        unique_urls = list(dict.fromkeys(urls))
+        tokens = await asyncio.gather(*(
+            self._upload_once(url, app_token, token, base_url, parent_type)
+            for url in unique_urls
+        ))
+        return dict(zip(unique_urls, tokens))
+
+    async def _upload_once(
+        self,
+        url: str,
+        app_token: str,
+        token: str,
+        base_url: str,
+        parent_type: str
+    ) -> Optional[str]:
+        key = (app_token, url)
+        inflight = self._inflight.get(key)
+        if inflight is None:
+            # 上传在独立任务中进行，发起方被取消时其余等待方仍能拿到结果
+            inflight = self._inflight[key] = asyncio.ensure_future(
+                self._upload_or_none(url, app_token, token, base_url, parent_type)
+            )
+            inflight.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(inflight)
+
+    async def _upload_or_none(
+        self,
+        url: str,
+        app_token: str,
+        token: str,
+        base_url: str,
+        parent_type: str
+    ) -> Optional[str]:
+        try:
+            return await self._upload(url, app_token, token, base_url, parent_type)
+        except Exception as e:
+            self._stats["failed"] += 1
+            print(f"[附件上传] {url} 上传失败: {e}")
+            return None
+
+    async def _upload(
+        self,
+        url: str,
+        app_token: str,
+        token: str,
+        base_url: str,
+        parent_type: str
+    ) -> Optional[str]:
+        cached = await self.cache.lookup_url(app_token, url)
+        if cached:
+            self._stats["urlHits"] += 1
+            return cached
+
+        async with self._semaphore:
+            with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY) as spool:
+                content_hash, size, content_type = await self._download(url, spool)
+
+                # 同一内容正在上传时等待其结果（不同链接的相同图片）
+                hash_key = (app_token, content_hash)
+                pending = self._hash_inflight.get(hash_key)
+                if pending:
+                    self._stats["hashHits"] += 1
+                    file_token = await asyncio.shield(pending)
+                    await self.cache.store(app_token, url, content_hash, None, size)
+                    return file_token
+
+                future = asyncio.get_running_loop().create_future()
+                self._hash_inflight[hash_key] = future
+                try:
+                    cached = await self.cache.lookup_hash(app_token, content_hash)
+                    if cached:
+                        self._stats["hashHits"] += 1
+                        await self.cache.store(app_token, url, content_hash, None, size)
+                        future.set_result(cached)
+                        return cached
+
+                    spool.seek(0)
+                    file_name = content_hash[:16] + CONTENT_TYPE_EXTENSIONS.get(content_type, ".jpg")
+                    file_token = await self._upload_media(
+                        spool, file_name, size, app_token, token, base_url, parent_type
+                    )
+                    await self.cache.store(app_token, url, content_hash, file_token, size)
+                except asyncio.CancelledError:
+                    future.cancel()
+                    raise
+                except Exception as e:
+                    future.set_exception(e)
+                    # 避免无人等待时出现 "exception was never retrieved" 警告
+                    future.exception()
+                    raise
+                else:
+                    future.set_result(file_token)
+                finally:
+                    self._hash_inflight.pop(hash_key, None)
+
+        self._stats["uploaded"] += 1
+        self._stats["bytes"] += size
+        return file_token
+
+    async def _download(self, url: str, spool) -> Tuple[str, int, str]:
+        """流式下载到临时文件，同时计算内容哈希"""
+        digest = hashlib.sha256()
+        size = 0
+        headers = {
+            "User-Agent": settings.DEFAULT_USER_AGENT,
+            "Referer": "https://www.xiaohongshu.com/" if "xhscdn" in url else "https://www.douyin.com/",
+        }
+
+        async with httpx.AsyncClient(timeout=current_deadline().write_timeout(60.0), follow_redirects=True) as client:
+            async with client.stream("GET", url, headers=headers) as response:
+                if response.status_code != 200:
+                    raise Exception(f"下载失败: HTTP {response.status_code}")
+                content_type = response.headers.get("content-type", "").split(";")[0].strip()
+                async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise Exception(f"文件超过 {self.max_bytes} 字节上限")
+                    digest.update(chunk)
+                    spool.write(chunk)
+
+        if size == 0:
+            raise Exception("下载内容为空")
+        return digest.hexdigest(), size, content_type
+
+    async def _upload_media(
+        self,
+        spool,
+        file_name: str,
+        size: int,
+        app_token: str,
+        token: str,
+        base_url: str,
+        parent_type: str
+    ) -> str:
+        """上传素材（文件内容从临时文件流式读取）"""
+        url = f"{base_url}/drive/v1/medias/upload_all"
+        data = {
+            "file_name": file_name,
+            "parent_type": parent_type,
+            "parent_node": app_token,
+            "size": str(size),
+        }
+
+        async with httpx.AsyncClient(timeout=current_deadline().write_timeout(120.0)) as client:
+            response = await client.post(
+                url,
+                headers={"Authorization": f"Bearer {token}"},
+                data=data,
+                files={"file": (file_name, spool)}
+            )
+
+        if response.status_code != 200:
+            raise Exception(f"上传素材失败: HTTP {response.status_code}: {response.text}")
+
+        result = response.json()
+        if result.get("code") != 0:
+            raise Exception(f"上传素材失败 ({result.get('code')}): {result.get('msg', '未知错误')}")
+
+        file_token = (result.get("data") or {}).get("file_token")
+        if not file_token:
+            raise Exception("上传素材失败: 响应缺少 file_token")
+        return file_token
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self._stats)
+
+
+# 全局上传器实例（进程内共享）
+attachment_uploader = AttachmentUploader(
+    cache=MediaCache(settings.FEISHU_ATTACHMENT_CACHE_PATH),
+    concurrency=settings.FEISHU_ATTACHMENT_CONCURRENCY,
+    max_bytes=settings.FEISHU_ATTACHMENT_MAX_BYTES,
+)
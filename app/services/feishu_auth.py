@@ -0,0 +1,194 @@
+"""
+飞书授权模块
+统一提供飞书接口的访问凭证：授权码（PersonalBaseToken）或应用凭证换取的 tenant_access_token
+
+- tenant_access_token 进程内共享缓存，过期前提前在后台刷新（refresh-ahead）
+- 并发请求同时需要刷新时只发起一次请求（single-flight）
+- 稳态下请求直接使用缓存的 token，不会等待刷新
+"""
+import asyncio
+import time
+from typing import Optional
+
+import httpx
+
+from app.core.config import settings
+
+
+# token 无效 / 过期的错误码，收到后应使缓存失效
+TOKEN_ERROR_CODES = {99991661, 99991663, 99991668}
+
+
+class FeishuAuthProvider:
+    """访问凭证提供者基类"""
+
+    def __init__(self, api_base: str):
+        self.api_base = api_base
+
+    @property
+    def configured(self) -> bool:
+        return True
+
+    async def get_token(self) -> str:
+        raise NotImplementedError
+
+    async def get_headers(self) -> dict:
+        """获取授权请求头"""
+        return {
+            "Authorization": f"Bearer {await self.get_token()}",
+            "Content-Type": "application/json; charset=utf-8",
+        }
+
+    def invalidate(self) -> None:
+        """token 被飞书拒绝时调用"""
+
+    def start(self) -> None:
+        """启动后台刷新（需在事件循环中调用）"""
+
+    async def stop(self) -> None:
+        """停止后台刷新"""
+
+
+class StaticTokenProvider(FeishuAuthProvider):
+    """固定授权码（PersonalBaseToken）"""
+
+    def __init__(self, token: str, api_base: str):
+        super().__init__(api_base)
+        self.token = token
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.token)
+
+    async def get_token(self) -> str:
+        return self.token
+
+
+class TenantTokenProvider(FeishuAuthProvider):
+    """应用凭证（App ID / App Secret）换取的 tenant_access_token"""
+
+    def __init__(self, app_id: str, app_secret: str, api_base: str, refresh_ahead: float = 300.0):
+        super().__init__(api_base)
+        self.app_id = app_id
+        self.app_secret = app_secret
+        self.refresh_ahead = refresh_ahead
+        self._token: Optional[str] = None
+        self._expires_at = 0.0
+        self._refreshing: Optional[asyncio.Task] = None
+        self._loop_task: Optional[asyncio.Task] = None
+        self._stats = {"fetches": 0, "fetchErrors": 0, "waits": 0}
+
+    @property
+    def _refresh_at(self) -> float:
+        return self._expires_at - self.refresh_ahead
+
+    async def get_token(self) -> str:
+        now = time.monotonic()
+        if self._token and now < self._expires_at:
+            # 进入提前刷新窗口时在后台刷新，本次仍使用当前 token
+            if now >= self._refresh_at:
+                self._refresh()
+            return self._token
+
+        self._stats["waits"] += 1
+        await asyncio.shield(self._refresh())
+        return self._token
+
+    def _refresh(self) -> asyncio.Task:
+        """发起刷新（已有刷新进行中时复用同一任务）"""
+        if self._refreshing is None or self._refreshing.done():
+            self._refreshing = asyncio.get_running_loop().create_task(self._fetch())
+            self._refreshing.add_done_callback(self._consume_error)
+        return self._refreshing
+
+    @staticmethod
+    def _consume_error(task: asyncio.Task) -> None:
+        # 后台刷新失败时避免 "exception was never retrieved" 警告，失败会在下次取 token 时重试
+        if not task.cancelled():
+            task.exception()
+
+    async def _fetch(self) -> None:
+        url = f"{self.api_base}/auth/v3/tenant_access_token/internal"
+        payload = {"app_id": self.app_id, "app_secret": self.app_secret}
+        self._stats["fetches"] += 1
+
+        try:
+            async with httpx.AsyncClient(timeout=10.0) as client:
+                response = await client.post(url, json=payload)
+            data = response.json()
+        except Exception as e:
+            self._stats["fetchErrors"] += 1
+            raise Exception(f"获取 tenant_access_token 失败: {e}")
+
+        if data.get("code") != 0 or not data.get("tenant_access_token"):
+            self._stats["fetchErrors"] += 1
+            raise Exception(f"获取 tenant_access_token 失败: {data.get('msg', '未知错误')}")
+
+        self._token = data["tenant_access_token"]
+        self._expires_at = time.monotonic() + int(data.get("expire") or 7200)
+
+    def invalidate(self) -> None:
+        self._token = None
+        self._expires_at = 0.0
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            try:
+                await self._refresh()
+                delay = max(1.0, self._refresh_at - time.monotonic())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[飞书授权] {e}")
+                delay = 10.0
+            await asyncio.sleep(delay)
+
+    def start(self) -> None:
+        if self._loop_task is None or self._loop_task.done():
+            self._loop_task = asyncio.get_running_loop().create_task(self._refresh_loop())
+
+    async def stop(self) -> None:
+        if self._loop_task:
+            self._loop_task.cancel()
+            try:
+                await self._loop_task
+            except asyncio.CancelledError:
+                pass
+            self._loop_task = None
+
+    def stats(self) -> dict:
+        remaining = self._expires_at - time.monotonic() if self._token else None
+        return {
+            **self._stats,
+            "appId": self.app_id,
+            "hasToken": self._token is not None,
+            "expiresInSeconds": round(remaining) if remaining is not None else None,
+            "refreshAhead": self.refresh_ahead,
+        }
+
+
+def _build_tenant_provider() -> Optional[TenantTokenProvider]:
+    if not (settings.FEISHU_APP_ID and settings.FEISHU_APP_SECRET):
+        return None
+    return TenantTokenProvider(
+        settings.FEISHU_APP_ID,
+        settings.FEISHU_APP_SECRET,
+        api_base=settings.FEISHU_OPEN_API_BASE,
+        refresh_ahead=settings.FEISHU_TOKEN_REFRESH_AHEAD,
+    )
+
+
+# 配置了应用凭证时，所有飞书请求共用同一个 tenant_access_token
+tenant_auth = _build_tenant_provider()
+
+# 写入采集结果使用的凭证（应用凭证优先，其次写入授权码 / 授权码）
+write_auth: FeishuAuthProvider = tenant_auth or StaticTokenProvider(
+    settings.FEISHU_WRITE_TOKEN or settings.FEISHU_PERSONAL_BASE_TOKEN,
+    settings.FEISHU_API_BASE,
+)
+
+# API Key 管理表使用的凭证
+apikey_auth: FeishuAuthProvider = tenant_auth or StaticTokenProvider(
+    settings.FEISHU_PERSONAL_BASE_TOKEN,
+    settings.FEISHU_API_BASE,
+)
@@ -0,0 +1,70 @@
+"""
+飞书多维表格读取服务
+分页读取数据表记录，处理当前页时预取下一页
+"""
+import asyncio
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import httpx
+
+from app.services.feishu_auth import FeishuAuthProvider, write_auth
+
+
+def cell_text(value: Any) -> str:
+    """提取单元格文本（兼容文本片段列表、超链接、单选等结构）"""
+    if value is None:
+        return ""
+    if isinstance(value, list):
+        return "".join(cell_text(item) for item in value).strip()
+    if isinstance(value, dict):
+        for key in ("link", "text", "name", "value"):
+            if value.get(key):
+                return str(value[key]).strip()
+        return ""
+    return str(value).strip()
+
+
+class FeishuReader:
+    """飞书多维表格读取器"""
+
+    def __init__(self, app_token: str, table_id: str, auth: Optional[FeishuAuthProvider] = None):
+        self.app_token = app_token
+        self.table_id = table_id
+        self.auth = auth or write_auth
+        self.base_url = self.auth.api_base
+
+    async def _fetch_page(self, page_token: Optional[str], page_size: int) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """读取一页记录，返回 (记录列表, 下一页 page_token)"""
+        url = f"{self.base_url}/bitable/v1/apps/{self.app_token}/tables/{self.table_id}/records"
+        params: Dict[str, Any] = {"page_size": page_size}
+        if page_token:
+            params["page_token"] = page_token
+
+        async with httpx.AsyncClient(timeout=30.0) as client:
+            response = await client.get(url, headers=await self.auth.get_headers(), params=params)
+
+        if response.status_code != 200:
+            raise Exception(f"读取表格记录失败: HTTP {response.status_code}")
+
+        data = response.json()
+        if data.get("code") != 0:
+            raise Exception(f"读取表格记录失败: {data.get('msg', '未知错误')}")
+
+        payload = data.get("data") or {}
+        next_token = payload.get("page_token") if payload.get("has_more") else None
+        return payload.get("items") or [], next_token
+
+    async def iter_pages(self, page_size: int = 500) -> AsyncIterator[List[Dict[str, Any]]]:
+        """逐页返回记录，调用方处理当前页时下一页已在后台请求"""
+        next_page = asyncio.ensure_future(self._fetch_page(None, page_size))
+        try:
+            while next_page is not None:
+                items, page_token = await next_page
+                next_page = (
+                    asyncio.ensure_future(self._fetch_page(page_token, page_size))
+                    if page_token else None
+                )
+                yield items
+        finally:
+            if next_page is not None and not next_page.done():
+                next_page.cancel()
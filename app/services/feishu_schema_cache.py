@@ -0,0 +1,151 @@
+"""
+飞书多维表格字段结构缓存
+进程内按 (app_token, table_id) 共享字段信息，支持 TTL、并发请求合并与选项就地更新
+"""
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from app.core.config import settings
+
+
+TableKey = Tuple[str, str]
+
+
+def _retrieve_exception(task: asyncio.Future) -> None:
+    # 所有等待方都已取消时也读取一次异常，避免 "exception was never retrieved" 警告
+    if not task.cancelled():
+        task.exception()
+
+
+class SchemaEntry:
+    """单个数据表的字段缓存"""
+
+    def __init__(self, field_map: Dict[str, Any], ttl: float):
+        self.field_map = field_map
+        self.expires_at = time.monotonic() + ttl
+
+    @property
+    def expired(self) -> bool:
+        return self.expires_at <= time.monotonic()
+
+
+class FeishuSchemaCache:
+    """飞书表格字段结构缓存"""
+
+    def __init__(self, ttl: float = 300.0):
+        self.ttl = ttl
+        self._entries: Dict[TableKey, SchemaEntry] = {}
+        self._inflight: Dict[TableKey, asyncio.Future] = {}
+        self._versions: Dict[TableKey, int] = {}
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "loads": 0,
+            "loadErrors": 0,
+            "patches": 0,
+            "invalidations": 0,
+        }
+
+    async def get(
+        self,
+        app_token: str,
+        table_id: str,
+        loader: Callable[[], Awaitable[Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        """
+        获取字段信息，未命中时调用 loader 加载
+
+        同一数据表的并发未命中只会触发一次加载，其余请求等待同一结果
+        """
+        key = (app_token, table_id)
+        entry = self._entries.get(key)
+        if entry and not entry.expired:
+            self._stats["hits"] += 1
+            return entry.field_map
+
+        inflight = self._inflight.get(key)
+        if inflight:
+            self._stats["coalesced"] += 1
+        else:
+            self._stats["misses"] += 1
+            # 加载在独立任务中进行，发起方被取消时其余等待方仍能拿到结果
+            inflight = self._inflight[key] = asyncio.ensure_future(self._load(key, loader))
+            inflight.add_done_callback(_retrieve_exception)
+        return await asyncio.shield(inflight)
+
+    async def _load(self, key: TableKey, loader: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        try:
+            field_map = await loader()
+        except Exception:
+            self._stats["loadErrors"] += 1
+            raise
+        else:
+            self._stats["loads"] += 1
+            self._entries[key] = SchemaEntry(field_map, self.ttl)
+            self._bump_version(key)
+            return field_map
+        finally:
+            self._inflight.pop(key, None)
+
+    def _bump_version(self, key: TableKey) -> int:
+        self._versions[key] = self._versions.get(key, 0) + 1
+        return self._versions[key]
+
+    def version(self, app_token: str, table_id: str) -> int:
+        """当前字段结构版本号（重新加载或就地更新时递增）"""
+        return self._versions.get((app_token, table_id), 0)
+
+    def update_field(self, app_token: str, table_id: str, field_meta: Dict[str, Any]) -> bool:
+        """
+        字段更新成功后就地替换缓存中的字段信息，避免重新拉取整张表的字段
+
+        Returns:
+            是否命中缓存并完成更新
+        """
+        key = (app_token, table_id)
+        entry = self._entries.get(key)
+        field_name = field_meta.get("field_name")
+        if not entry or not field_name:
+            return False
+
+        cached = entry.field_map.get(field_name)
+        if cached is not None:
+            cached.clear()
+            cached.update(field_meta)
+        else:
+            entry.field_map[field_name] = field_meta
+        self._bump_version(key)
+        self._stats["patches"] += 1
+        return True
+
+    def invalidate(self, app_token: str, table_id: str) -> None:
+        """使指定数据表的缓存失效（如写入时字段不存在或类型不匹配）"""
+        key = (app_token, table_id)
+        if self._entries.pop(key, None) is not None:
+            self._bump_version(key)
+            self._stats["invalidations"] += 1
+
+    def peek(self, app_token: str, table_id: str) -> Optional[Dict[str, Any]]:
+        """获取未过期的缓存（不触发加载）"""
+        entry = self._entries.get((app_token, table_id))
+        if entry and not entry.expired:
+            return entry.field_map
+        return None
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self._stats["hits"] + self._stats["misses"] + self._stats["coalesced"]
+        return {
+            **self._stats,
+            "tables": len(self._entries),
+            "hitRate": round(self._stats["hits"] / lookups, 3) if lookups else None,
+            "ttl": self.ttl,
+        }
+
+
+# 全局缓存实例（进程内共享）
+schema_cache = FeishuSchemaCache(ttl=settings.FEISHU_SCHEMA_CACHE_TTL)
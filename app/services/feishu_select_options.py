@@ -0,0 +1,94 @@
+"""
+飞书单选 / 多选字段选项登记
+记录各数据表中已确认存在（或因超出上限被拒绝）的选项，后续写入同一数据表时无需再次检查；
+同一字段的选项更新逐个进行，避免并发更新互相覆盖
+"""
+import asyncio
+from collections import Counter
+from typing import Dict, List, Set, Tuple
+
+from app.core.config import settings
+
+
+# 超出选项上限时的处理方式
+OVERFLOW_DROP = "drop"  # 不新增选项，写入时丢弃该值
+OVERFLOW_KEEP = "keep"  # 不新增选项，按原值写入（由飞书处理）
+
+
+class SelectOptionRegistry:
+    """选项登记表"""
+
+    def __init__(self, max_options: int = 1000, limits: Dict[str, int] = None, overflow: str = OVERFLOW_DROP):
+        self.max_options = max_options
+        self.limits = limits or {}
+        self.overflow = overflow
+        self._known: Dict[Tuple[str, str, str], Set[str]] = {}
+        self._rejected: Dict[Tuple[str, str, str], Set[str]] = {}
+        self._locks: Dict[Tuple[str, str, str], asyncio.Lock] = {}
+        self._stats = {"added": 0, "rejected": 0, "updates": 0}
+
+    def limit_for(self, field_name: str) -> int:
+        """字段的选项数上限（可按字段名单独配置）"""
+        return self.limits.get(field_name, self.max_options)
+
+    def known(self, app_token: str, table_id: str, field_name: str) -> Set[str]:
+        return self._known.setdefault((app_token, table_id, field_name), set())
+
+    def rejected(self, app_token: str, table_id: str, field_name: str) -> Set[str]:
+        """被拒绝的选项（返回的集合对象会随登记更新，可被转换函数长期持有）"""
+        return self._rejected.setdefault((app_token, table_id, field_name), set())
+
+    def lock(self, app_token: str, table_id: str, field_name: str) -> asyncio.Lock:
+        """字段选项更新锁（更新会整体替换选项列表，同一字段必须逐个更新）"""
+        return self._locks.setdefault((app_token, table_id, field_name), asyncio.Lock())
+
+    def is_checked(self, app_token: str, table_id: str, field_name: str, value: str) -> bool:
+        key = (app_token, table_id, field_name)
+        return value in self._known.get(key, ()) or value in self._rejected.get(key, ())
+
+    def plan_additions(
+        self,
+        field_name: str,
+        existing_count: int,
+        missing: Counter
+    ) -> Tuple[List[str], List[str]]:
+        """
+        按上限拆分待新增选项
+
+        本批出现次数多的值优先新增，返回 (新增选项, 超出上限的选项)
+        """
+        room = max(0, self.limit_for(field_name) - existing_count)
+        ranked = [value for value, _ in missing.most_common()]
+        return ranked[:room], ranked[room:]
+
+    def mark_added(self, app_token: str, table_id: str, field_name: str, values: List[str]) -> None:
+        self.known(app_token, table_id, field_name).update(values)
+        self._stats["added"] += len(values)
+        self._stats["updates"] += 1
+
+    def mark_rejected(self, app_token: str, table_id: str, field_name: str, values: List[str]) -> None:
+        self.rejected(app_token, table_id, field_name).update(values)
+        self._stats["rejected"] += len(values)
+
+    def forget(self, app_token: str, table_id: str) -> None:
+        """字段结构变化时清除数据表的登记（被拒绝集合就地清空，保证转换函数持有的引用同步）"""
+        for registry in (self._known, self._rejected):
+            for key, values in registry.items():
+                if key[0] == app_token and key[1] == table_id:
+                    values.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            **self._stats,
+            "fields": len(self._known),
+            "maxOptions": self.max_options,
+            "overflow": self.overflow,
+        }
+
+
+# 全局登记实例（进程内共享）
+option_registry = SelectOptionRegistry(
+    max_options=settings.FEISHU_SELECT_OPTION_MAX,
+    limits=settings.FEISHU_SELECT_OPTION_LIMITS,
+    overflow=settings.FEISHU_SELECT_OPTION_OVERFLOW,
+)
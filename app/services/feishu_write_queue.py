@@ -0,0 +1,429 @@
+"""
+飞书写入队列（write-behind）
+采集结果先写入本地 SQLite（WAL 模式）持久化队列并立即返回，
+后台刷写任务按目标表合并多次请求的记录，以满批（500 条）调用 batch_create
+
+- 至少一次投递：记录在写入飞书成功后才从队列删除，进程崩溃后租约过期的记录会被重新投递
+- 幂等重试：每组记录首次投递时分配 client_token 并持久化，重试时以相同的记录与标识重新提交，
+  飞书对已创建的批次不会重复写入；部分批次成功时只确认这些批次的记录
+- 失败隔离：飞书明确拒绝（非临时错误）的批次拆成两半分别重试，直到定位出有问题的单条记录，
+  只有这些记录计入尝试次数并最终转入死信
+- 死信：超过最大尝试次数的记录标记为 dead，保留错误信息，可由管理员在服务所在机器上调用 requeue_dead 重新入队
+"""
+import asyncio
+import contextvars
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+
+
+BATCH_SIZE = 500
+
+STATUS_PENDING = "pending"
+STATUS_INFLIGHT = "inflight"
+STATUS_DEAD = "dead"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS write_queue (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    app_token TEXT NOT NULL,
+    table_id TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    next_attempt_at REAL NOT NULL,
+    lease_until REAL,
+    client_token TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_write_queue_target
+    ON write_queue (app_token, table_id, status, next_attempt_at);
+"""
+
+
+def _mask_token(app_token: str) -> str:
+    """监控输出中隐藏多维表格 App Token"""
+    return f"{app_token[:6]}***" if app_token else app_token
+
+
+class FeishuWriteQueue:
+    """飞书写入队列"""
+
+    def __init__(
+        self,
+        path: str,
+        flush_interval: float = 2.0,
+        max_attempts: int = 5,
+        lease_seconds: float = 300.0,
+        backoff_base: float = 5.0,
+        backoff_max: float = 600.0,
+    ):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._conn: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {"enqueued": 0, "flushed": 0, "batches": 0, "failedBatches": 0, "deadLettered": 0}
+
+    # ---------- SQLite 操作（在线程池中执行） ----------
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(write_queue)")}
+            if "client_token" not in columns:
+                # 旧版本创建的队列文件
+                conn.execute("ALTER TABLE write_queue ADD COLUMN client_token TEXT")
+            self._conn = conn
+        return self._conn
+
+    def _execute(self, fn, *args):
+        with self._db_lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(conn, *args)
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            return result
+
+    async def _run(self, fn, *args):
+        return await asyncio.to_thread(self._execute, fn, *args)
+
+    @staticmethod
+    def _insert(
+        conn: sqlite3.Connection,
+        app_token: str,
+        table_id: str,
+        payloads: List[str],
+        client_token: Optional[str] = None
+    ) -> int:
+        now = time.time()
+        conn.executemany(
+            "INSERT INTO write_queue (app_token, table_id, payload, created_at, next_attempt_at, client_token) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [(app_token, table_id, payload, now, now, client_token) for payload in payloads]
+        )
+        return len(payloads)
+
+    def _due_targets(self, conn: sqlite3.Connection, now: float) -> List[Tuple[str, str]]:
+        """待刷写的目标表：已满一批，或最早的记录已等待超过刷写间隔，或存在租约过期的记录"""
+        rows = conn.execute(
+            """
+            SELECT app_token, table_id, COUNT(*), MIN(created_at)
+            FROM write_queue
+            WHERE (status = ? AND next_attempt_at <= ?)
+               OR (status = ? AND lease_until <= ?)
+            GROUP BY app_token, table_id
+            """,
+            (STATUS_PENDING, now, STATUS_INFLIGHT, now)
+        ).fetchall()
+        return [
+            (app_token, table_id)
+            for app_token, table_id, count, oldest in rows
+            if count >= BATCH_SIZE or now - oldest >= self.flush_interval
+        ]
+
+    def _claim(
+        self, conn: sqlite3.Connection, app_token: str, table_id: str, now: float
+    ) -> Tuple[Optional[str], List[Tuple[int, str, int]]]:
+        """
+        领取一组记录，返回 (client_token, 记录)
+
+        已分配 client_token 的记录按原来的分组整组领取；新记录最多领取一批并分配新的 client_token
+        """
+        due = "app_token = ? AND table_id = ? AND ((status = ? AND next_attempt_at <= ?) OR (status = ? AND lease_until <= ?))"
+        due_params = (app_token, table_id, STATUS_PENDING, now, STATUS_INFLIGHT, now)
+        head = conn.execute(
+            f"SELECT client_token FROM write_queue WHERE {due} ORDER BY id LIMIT 1", due_params
+        ).fetchone()
+        if head is None:
+            return None, []
+
+        client_token = head[0]
+        if client_token:
+            rows = conn.execute(
+                f"SELECT id, payload, attempts FROM write_queue WHERE {due} AND client_token = ? ORDER BY id",
+                (*due_params, client_token)
+            ).fetchall()
+        else:
+            client_token = str(uuid.uuid4())
+            rows = conn.execute(
+                f"SELECT id, payload, attempts FROM write_queue WHERE {due} AND client_token IS NULL ORDER BY id LIMIT ?",
+                (*due_params, BATCH_SIZE)
+            ).fetchall()
+        conn.executemany(
+            "UPDATE write_queue SET status = ?, lease_until = ?, client_token = ? WHERE id = ?",
+            [(STATUS_INFLIGHT, now + self.lease_seconds, client_token, row[0]) for row in rows]
+        )
+        return client_token, rows
+
+    @staticmethod
+    def _ack(conn: sqlite3.Connection, ids: List[int]) -> None:
+        conn.executemany("DELETE FROM write_queue WHERE id = ?", [(i,) for i in ids])
+
+    def _nack(
+        self,
+        conn: sqlite3.Connection,
+        rows: List[Tuple[int, str, int]],
+        error: str,
+        client_token: Optional[str] = None
+    ) -> int:
+        """
+        写入失败：增加尝试次数并退避，超过上限的记录转入死信，返回死信条数
+
+        client_token 为这些记录重试时使用的标识（与失败时实际提交的批次一致）
+        """
+        now = time.time()
+        dead = 0
+        for row_id, _, attempts in rows:
+            attempts += 1
+            if attempts >= self.max_attempts:
+                dead += 1
+                conn.execute(
+                    "UPDATE write_queue SET status = ?, attempts = ?, last_error = ?, lease_until = NULL, "
+                    "client_token = COALESCE(?, client_token) WHERE id = ?",
+                    (STATUS_DEAD, attempts, error, client_token, row_id)
+                )
+            else:
+                delay = min(self.backoff_max, self.backoff_base * (2 ** (attempts - 1)))
+                conn.execute(
+                    "UPDATE write_queue SET status = ?, attempts = ?, last_error = ?, "
+                    "next_attempt_at = ?, lease_until = NULL, client_token = COALESCE(?, client_token) WHERE id = ?",
+                    (STATUS_PENDING, attempts, error, now + delay, client_token, row_id)
+                )
+        return dead
+
+    @staticmethod
+    def _split(conn: sqlite3.Connection, rows: List[Tuple[int, str, int]], error: str) -> None:
+        """飞书明确拒绝的批次（未写入任何记录）拆成两半，分配新的 client_token 后立即重试"""
+        now = time.time()
+        middle = len(rows) // 2
+        for half in (rows[:middle], rows[middle:]):
+            client_token = str(uuid.uuid4())
+            conn.executemany(
+                "UPDATE write_queue SET status = ?, last_error = ?, next_attempt_at = ?, lease_until = NULL, "
+                "client_token = ? WHERE id = ?",
+                [(STATUS_PENDING, error, now, client_token, row[0]) for row in half]
+            )
+
+    @staticmethod
+    def _requeue_dead(conn: sqlite3.Connection, app_token: Optional[str], table_id: Optional[str]) -> int:
+        sql = "UPDATE write_queue SET status = ?, attempts = 0, next_attempt_at = ? WHERE status = ?"
+        params: List[Any] = [STATUS_PENDING, time.time(), STATUS_DEAD]
+        if app_token:
+            sql += " AND app_token = ?"
+            params.append(app_token)
+        if table_id:
+            sql += " AND table_id = ?"
+            params.append(table_id)
+        return conn.execute(sql, params).rowcount
+
+    @staticmethod
+    def _depths(conn: sqlite3.Connection) -> List[Dict[str, Any]]:
+        rows = conn.execute(
+            """
+            SELECT app_token, table_id, status, COUNT(*), MIN(created_at), MAX(last_error)
+            FROM write_queue
+            GROUP BY app_token, table_id, status
+            ORDER BY app_token, table_id
+            """
+        ).fetchall()
+        now = time.time()
+        tables: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        for app_token, table_id, status, count, oldest, last_error in rows:
+            item = tables.setdefault((app_token, table_id), {
+                "appToken": _mask_token(app_token),
+                "tableId": table_id,
+                STATUS_PENDING: 0,
+                STATUS_INFLIGHT: 0,
+                STATUS_DEAD: 0,
+                "oldestAgeSeconds": 0,
+                "lastError": None,
+            })
+            item[status] = count
+            item["oldestAgeSeconds"] = max(item["oldestAgeSeconds"], round(now - oldest, 1))
+            if last_error:
+                item["lastError"] = last_error
+        return list(tables.values())
+
+    # ---------- 对外接口 ----------
+
+    async def enqueue(
+        self,
+        app_token: str,
+        table_id: str,
+        records: List[Dict[str, Any]],
+        client_token: Optional[str] = None
+    ) -> int:
+        """
+        记录入队并唤醒刷写任务，返回入队条数
+
+        client_token: 已用该标识提交过（结果未知）的一批记录整组入队，重试沿用原标识，不会重复创建
+        """
+        if not records:
+            return 0
+        payloads = [json.dumps(record, ensure_ascii=False) for record in records]
+        count = await self._run(self._insert, app_token, table_id, payloads, client_token)
+        self._stats["enqueued"] += count
+        self.start()
+        if self._wakeup:
+            self._wakeup.set()
+        return count
+
+    async def requeue_dead(self, app_token: Optional[str] = None, table_id: Optional[str] = None) -> int:
+        """将死信记录重新放回队列（不对外提供接口，由管理员在服务所在机器上调用）"""
+        count = await self._run(self._requeue_dead, app_token, table_id)
+        if count:
+            self.start()
+            if self._wakeup:
+                self._wakeup.set()
+        return count
+
+    async def status(self) -> Dict[str, Any]:
+        """各目标表的队列深度（App Token 已隐藏）"""
+        tables = await self._run(self._depths)
+        return {
+            "running": self.running,
+            "flushInterval": self.flush_interval,
+            "maxAttempts": self.max_attempts,
+            "tables": tables,
+            **self._stats,
+        }
+
+    async def flush_once(self) -> int:
+        """刷写所有到期目标表，返回成功写入条数"""
+        from app.services.feishu_writer import write_to_feishu
+
+        flushed = 0
+        targets = await self._run(lambda conn: self._due_targets(conn, time.time()))
+        for app_token, table_id in targets:
+            while True:
+                client_token, rows = await self._run(self._claim, app_token, table_id, time.time())
+                if not rows:
+                    break
+
+                self._stats["batches"] += 1
+                try:
+                    result = await write_to_feishu(
+                        app_token, table_id, [json.loads(row[1]) for row in rows], client_token
+                    )
+                except Exception as e:
+                    result = {"success": False, "message": str(e)}
+
+                written = await self._settle(rows, client_token, result)
+                flushed += written
+                self._stats["flushed"] += written
+                if written < len(rows):
+                    self._stats["failedBatches"] += 1
+                    print(f"[写入队列] {app_token}/{table_id} 写入 {len(rows) - written} 条失败: {result.get('message', '未知错误')}")
+                    break
+        return flushed
+
+    async def _settle(self, rows: List[Tuple[int, str, int]], client_token: str, result: Dict[str, Any]) -> int:
+        """按各批次的结果确认 / 重试 / 拆分领取的记录，返回成功写入条数"""
+        from app.services.feishu_writer import derive_client_token
+
+        if result.get("success"):
+            await self._run(self._ack, [row[0] for row in rows])
+            return len(rows)
+
+        details = result.get("details") or []
+        sizes = result.get("batchSizes") or []
+        if not details or sum(sizes) != len(rows):
+            # 未能提交任何批次（如获取字段信息时出错），整组原样重试
+            self._stats["deadLettered"] += await self._run(
+                self._nack, rows, result.get("message", "未知错误")
+            )
+            return 0
+
+        written = 0
+        offset = 0
+        for index, (detail, size) in enumerate(zip(details, sizes)):
+            batch_rows, offset = rows[offset:offset + size], offset + size
+            if detail.get("success"):
+                await self._run(self._ack, [row[0] for row in batch_rows])
+                written += len(batch_rows)
+                continue
+
+            error = detail.get("error") or "未知错误"
+            if not detail.get("retryable") and len(batch_rows) > 1:
+                # 飞书明确拒绝：批次内有记录无法写入，拆分后分别重试以定位问题记录
+                await self._run(self._split, batch_rows, error)
+                continue
+            # 临时错误可能已在服务端写入，保持提交时的 client_token 重试
+            batch_token = derive_client_token(client_token, index, len(sizes))
+            self._stats["deadLettered"] += await self._run(self._nack, batch_rows, error, batch_token)
+        return written
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await self.flush_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[写入队列] 刷写异常: {e}")
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+                # 被新记录唤醒后稍等片刻，让并发请求的记录合并到同一批
+                await asyncio.sleep(self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        """启动后台刷写任务（需在事件循环中调用）"""
+        if self.running:
+            return
+        self._wakeup = asyncio.Event()
+        # 在空白上下文中启动：入队请求的时间预算等上下文变量不应限制后台刷写
+        loop = asyncio.get_running_loop()
+        self._task = contextvars.Context().run(loop.create_task, self._loop())
+
+    async def stop(self) -> None:
+        """停止后台刷写任务，未写入的记录保留在队列中，下次启动后继续投递"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def has_backlog(self) -> bool:
+        """本地是否存在队列文件（用于启动时恢复投递）"""
+        return os.path.exists(self.path)
+
+
+# 全局队列实例（进程内共享）
+write_queue = FeishuWriteQueue(
+    path=settings.FEISHU_WRITE_QUEUE_PATH,
+    flush_interval=settings.FEISHU_WRITE_QUEUE_FLUSH_INTERVAL,
+    max_attempts=settings.FEISHU_WRITE_QUEUE_MAX_ATTEMPTS,
+)
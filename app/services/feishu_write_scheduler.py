@@ -0,0 +1,189 @@
+"""
+飞书写入调度模块
+按应用限流、并行发送批次，并对限频 / 5xx / 网络错误做指数退避重试；
+请求设置了时间预算时，排队等待令牌或退避重试超出剩余时间的批次不再发送，标记为 deferred 交由调用方转入写入队列
+"""
+import asyncio
+import json
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from app.core.config import settings
+from app.services.request_deadline import current_deadline
+
+
+# 飞书限频错误码
+RATE_LIMIT_CODES = {1254290, 99991400}
+# 可重试的飞书错误码（限频、写冲突、数据未就绪、内部超时）
+RETRYABLE_CODES = RATE_LIMIT_CODES | {1254291, 1254607, 1255040}
+
+
+class TokenBucket:
+    """令牌桶限流器"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    async def acquire(self, max_wait: Optional[float] = None) -> bool:
+        """获取一个令牌；需要等待超过 max_wait 秒时不等待，返回 False"""
+        async with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                wait = (1 - self._tokens) / self.rate
+                if max_wait is not None and wait > max_wait:
+                    return False
+                await asyncio.sleep(wait)
+                self._refill()
+            self._tokens -= 1
+            return True
+
+    def drain(self, seconds: float) -> None:
+        """收到限频响应时清空令牌，令后续请求至少等待 seconds 秒"""
+        self._tokens = min(self._tokens, -seconds * self.rate)
+
+
+def split_batches(
+    records: List[Dict[str, Any]],
+    max_records: int = 500,
+    max_bytes: int = 4 * 1024 * 1024
+) -> List[List[Dict[str, Any]]]:
+    """按条数与请求体大小切分批次（单条超限的记录单独成批）"""
+    batches: List[List[Dict[str, Any]]] = []
+    current: List[Dict[str, Any]] = []
+    current_bytes = 0
+
+    for record in records:
+        record_bytes = len(json.dumps(record, ensure_ascii=False).encode("utf-8")) + 1
+        if current and (len(current) >= max_records or current_bytes + record_bytes > max_bytes):
+            batches.append(current)
+            current, current_bytes = [], 0
+        current.append(record)
+        current_bytes += record_bytes
+
+    if current:
+        batches.append(current)
+    return batches
+
+
+class FeishuWriteScheduler:
+    """
+    飞书写入调度器
+
+    - 每个应用（app_token）一个令牌桶，控制请求频率
+    - 全局信号量限制并行批次数
+    - 限频 / 5xx / 网络错误按指数退避重试，重试沿用同一 client_token 保证幂等
+    """
+
+    def __init__(
+        self,
+        rate: float = 5.0,
+        burst: float = 5.0,
+        concurrency: int = 3,
+        max_retries: int = 4,
+        backoff_base: float = 0.5,
+        backoff_max: float = 20.0,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._stats = {"requests": 0, "retries": 0, "rateLimited": 0, "failed": 0, "deferred": 0}
+
+    def _bucket(self, app_token: str) -> TokenBucket:
+        bucket = self._buckets.get(app_token)
+        if bucket is None:
+            bucket = TokenBucket(self.rate, self.burst)
+            self._buckets[app_token] = bucket
+        return bucket
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        delay = delay * (0.5 + random.random() / 2)
+        if retry_after:
+            delay = max(delay, retry_after)
+        return delay
+
+    async def submit(
+        self,
+        app_token: str,
+        send: Callable[[], Awaitable[Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        """
+        发送一个批次，必要时重试
+
+        send 返回的结果中 retryable 为真时重试，retry_after 为服务端建议的等待秒数；
+        剩余时间预算不够等待令牌或退避时停止，结果标记 deferred
+        """
+        bucket = self._bucket(app_token)
+        deadline = current_deadline()
+        result: Dict[str, Any] = {}
+
+        for attempt in range(self.max_retries + 1):
+            max_wait = deadline.write_remaining() - 1.0 if deadline.limited else None
+            if not await bucket.acquire(max_wait):
+                result = {
+                    "success": False,
+                    "error": "请求时间预算不足，未能发送",
+                    "count": 0,
+                    "retryable": True,
+                    "deferred": True,
+                }
+                break
+            async with self._semaphore:
+                self._stats["requests"] += 1
+                result = await send()
+
+            if result.get("success") or not result.get("retryable"):
+                break
+
+            if result.get("rate_limited"):
+                self._stats["rateLimited"] += 1
+                bucket.drain(result.get("retry_after") or self.backoff_base)
+
+            if attempt < self.max_retries:
+                delay = self._backoff(attempt, result.get("retry_after"))
+                if not deadline.write_allows(delay + 1.0):
+                    result["deferred"] = True
+                    break
+                self._stats["retries"] += 1
+                await asyncio.sleep(delay)
+
+        if result.get("deferred"):
+            self._stats["deferred"] += 1
+        elif not result.get("success"):
+            self._stats["failed"] += 1
+        result["attempts"] = attempt + 1
+        return result
+
+    async def submit_all(
+        self,
+        app_token: str,
+        senders: List[Callable[[], Awaitable[Dict[str, Any]]]]
+    ) -> List[Dict[str, Any]]:
+        """并行发送多个批次，结果顺序与 senders 一致"""
+        return list(await asyncio.gather(*(self.submit(app_token, send) for send in senders)))
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._stats, "apps": len(self._buckets)}
+
+
+# 全局调度器实例（进程内共享）
+write_scheduler = FeishuWriteScheduler(
+    rate=settings.FEISHU_WRITE_RATE,
+    burst=settings.FEISHU_WRITE_BURST,
+    concurrency=settings.FEISHU_WRITE_CONCURRENCY,
+    max_retries=settings.FEISHU_WRITE_MAX_RETRIES,
+)
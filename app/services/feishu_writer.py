@@ -2,10 +2,25 @@
 飞书多维表格写入服务
 负责将采集数据批量写入飞书表格
 """
+import asyncio
+import uuid
 import httpx
-from typing import List, Dict, Any, Optional
+from collections import Counter, OrderedDict
+from typing import Callable, List, Dict, Any, Optional, Tuple
 
 from app.core.config import settings
+from app.services.feishu_attachment import attachment_uploader, split_attachment_urls
+from app.services.feishu_auth import TOKEN_ERROR_CODES, FeishuAuthProvider, StaticTokenProvider, write_auth
+from app.services.feishu_schema_cache import schema_cache
+from app.services.feishu_select_options import OVERFLOW_DROP, option_registry
+from app.services.feishu_write_queue import write_queue
+from app.services.feishu_write_scheduler import (
+    RATE_LIMIT_CODES,
+    RETRYABLE_CODES,
+    split_batches,
+    write_scheduler,
+)
+from app.services.request_deadline import current_deadline
 
 
 FIELD_UI_TYPE_MAP = {
@@ -18,37 +33,124 @@ FIELD_UI_TYPE_MAP = {
     "Formula": 20,
 }
 
+# 写入时出现以下错误码说明缓存的字段结构已过期（字段不存在 / 类型转换失败）
+SCHEMA_ERROR_CODES = {1254045, 1254060, 1254061, 1254062, 1254063, 1254064}
+
+# 采集字段名 -> 表格中可能使用的字段名（按优先级）
+FIELD_ALIASES: Dict[str, List[str]] = {
+    # 笔记字段别名
+    "笔记类型": ["笔记类型", "笔记类型1"],
+    "笔记标签": ["笔记标签", "标签"],
+    "图片链接": ["图片链接", "笔记封面图链接"],
+    "笔记标题": ["笔记标题", "标题"],
+    "笔记内容": ["笔记内容", "文案", "笔记文案", "内容"],
+    "账号名称": ["账号名称", "博主昵称"],
+    "头像链接": ["头像链接", "头像URL", "头像地址"],
+    # 博主字段别名
+    "博主昵称": ["账号名称", "博主昵称"],
+    "小红书号": ["小红书ID", "小红书号", "抖音号"],
+    "个人简介": ["简介", "个人简介"],
+    "获赞与收藏": ["赞藏总数", "获赞与收藏", "赞藏"],
+}
+
+# 允许写入任意值（缺失选项时自动新增）的单选 / 多选字段
+SINGLE_SELECT_ANY_VALUE = frozenset({"账号名称", "博主昵称"})
+MULTI_SELECT_ANY_VALUE = frozenset({"笔记标签", "标签"})
+
+# 编译后的规范化计划缓存上限
+NORMALIZE_PLAN_CACHE_SIZE = 256
+
+
+class FieldPlan:
+    """单个输入字段的规范化计划"""
+
+    __slots__ = ("source", "target", "field_type", "option_names", "convert", "auto_options")
+
+    def __init__(
+        self,
+        source: str,
+        target: str,
+        field_type: Optional[int],
+        option_names: frozenset,
+        convert: Callable[[Any], Any],
+        auto_options: bool
+    ):
+        self.source = source
+        self.target = target
+        self.field_type = field_type
+        self.option_names = option_names
+        self.convert = convert
+        # 单选 / 多选字段缺失选项时是否自动新增
+        self.auto_options = auto_options
+
+
+class NormalizePlan:
+    """
+    一组输入字段在某一版本字段结构下的规范化计划
+
+    字段名解析、类型判断与选项集合在编译时完成，规范化时只需逐字段调用转换函数
+    """
+
+    __slots__ = ("fields", "select_fields", "attachment_fields")
+
+    def __init__(self, fields: List[FieldPlan]):
+        self.fields = fields
+        self.select_fields = [plan for plan in fields if plan.auto_options]
+        self.attachment_fields = [plan for plan in fields if plan.field_type == 17]
+
+    def apply(self, fields: Dict[str, Any]) -> Dict[str, Any]:
+        normalized: Dict[str, Any] = {}
+        for plan in self.fields:
+            value = fields.get(plan.source)
+            if value is None:
+                continue
+            value = plan.convert(value)
+            if value is not None:
+                normalized[plan.target] = value
+        return normalized
+
+
+# (app_token, table_id, 字段结构版本, 输入字段) -> 规范化计划
+_plan_cache: "OrderedDict[Tuple[str, str, int, Tuple[str, ...]], NormalizePlan]" = OrderedDict()
+
 
 class FeishuWriter:
     """飞书多维表格写入器"""
     
-    def __init__(self, app_token: str, table_id: str, token: str = None):
+    def __init__(
+        self,
+        app_token: str,
+        table_id: str,
+        token: str = None,
+        auth: Optional[FeishuAuthProvider] = None
+    ):
         self.app_token = app_token
         self.table_id = table_id
-        self.base_url = settings.FEISHU_API_BASE
-        # 优先使用传入的 token，否则使用配置中的写入 token
-        self.token = token or settings.FEISHU_WRITE_TOKEN or settings.FEISHU_PERSONAL_BASE_TOKEN
-        self._fields_cache: Optional[Dict[str, Any]] = None
+        # 优先使用传入的 token / 凭证，否则使用全局凭证（应用凭证 / 写入授权码）
+        if token:
+            auth = StaticTokenProvider(token, settings.FEISHU_API_BASE)
+        self.auth = auth or write_auth
+        self.base_url = self.auth.api_base
     
-    def _get_headers(self) -> Dict[str, str]:
+    async def _get_headers(self) -> Dict[str, str]:
         """获取请求头"""
-        return {
-            "Authorization": f"Bearer {self.token}",
-            "Content-Type": "application/json; charset=utf-8"
-        }
+        return await self.auth.get_headers()
     
     async def batch_create_records(
         self, 
-        records: List[Dict[str, Any]]
+        records: List[Dict[str, Any]],
+        client_token: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         批量创建多条记录
         
         Args:
             records: 记录列表，每条记录包含 fields 字段
+            client_token: 幂等标识（写入队列重试同一组记录时传入同一个值，各批次的标识由其派生）
             
         Returns:
-            API 响应结果
+            API 响应结果（batchSizes 为各批次的记录数，与 details 一一对应；
+            时间预算内来不及写入的批次连同其 client_token 转入写入队列，计入 totalQueued）
         """
         if not records:
             return {"success": True, "message": "无数据需要写入", "count": 0}
@@ -56,38 +158,101 @@ class FeishuWriter:
         # 先根据表格字段类型做规范化处理，避免类型不匹配
         try:
             field_map = await self._get_table_fields()
-            updated = await self._ensure_select_options(records, field_map)
-            if updated:
-                field_map = await self._get_table_fields()
-            records = self._normalize_records(records, field_map)
         except Exception:
             # 获取字段信息失败时，保持原始数据写入
-            pass
+            field_map = None
+
+        if field_map is not None:
+            try:
+                # 新增的选项会就地更新到共享字段缓存中，无需重新拉取
+                await self._ensure_select_options(records, field_map)
+            except Exception as e:
+                print(f"[飞书写入] 补充选项失败: {e}")
+            if settings.FEISHU_ATTACHMENT_UPLOAD:
+                try:
+                    records = await self._upload_attachments(records, field_map)
+                except Exception as e:
+                    # 上传失败时附件字段保留原链接，由规范化处理
+                    print(f"[附件上传] 上传附件失败，保留原链接: {e}")
+            try:
+                records = self._normalize_records(records, field_map)
+            except Exception as e:
+                print(f"[飞书写入] 规范化记录失败，保持原始数据写入: {e}")
+
+        # 飞书批量创建 API 限制每次最多 500 条，同时按请求体大小切分
+        batches = split_batches(
+            records,
+            max_records=500,
+            max_bytes=settings.FEISHU_BATCH_MAX_BYTES
+        )
+        tokens = [
+            derive_client_token(client_token, index, len(batches)) or str(uuid.uuid4())
+            for index in range(len(batches))
+        ]
+        all_results = await write_scheduler.submit_all(
+            self.app_token,
+            [self._batch_sender(batch, token) for batch, token in zip(batches, tokens)]
+        )
+
+        for batch, token, result in zip(batches, tokens, all_results):
+            if result.get("deferred"):
+                # 可能已提交过（结果未知），沿用同一 client_token 入队，后台重试不会重复创建
+                result["queued"] = await write_queue.enqueue(self.app_token, self.table_id, batch, token)
+        return self._summarize_batches(batches, all_results, "写入")
 
-        # 飞书批量创建 API 限制每次最多 500 条
-        batch_size = 500
-        all_results = []
+    async def batch_update_records(self, records: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        批量更新多条记录
+        
+        Args:
+            records: 记录列表，每条记录包含 record_id 与 fields 字段
+            
+        Returns:
+            API 响应结果
+        """
+        if not records:
+            return {"success": True, "message": "无数据需要更新", "count": 0}
+
+        batches = split_batches(
+            records,
+            max_records=500,
+            max_bytes=settings.FEISHU_BATCH_MAX_BYTES
+        )
+        all_results = await write_scheduler.submit_all(
+            self.app_token,
+            [self._update_sender(batch) for batch in batches]
+        )
+        return self._summarize_batches(batches, all_results, "更新")
+
+    def _summarize_batches(
+        self,
+        batches: List[List[Dict[str, Any]]],
+        all_results: List[Dict[str, Any]],
+        action: str
+    ) -> Dict[str, Any]:
+        """汇总各批次结果"""
         total_success = 0
         total_failed = 0
+        total_queued = 0
         
-        for i in range(0, len(records), batch_size):
-            batch = records[i:i + batch_size]
-            result = await self._create_batch(batch)
-            all_results.append(result)
-            
+        for batch, result in zip(batches, all_results):
             if result.get("success"):
                 total_success += result.get("count", 0)
+            elif result.get("queued"):
+                total_queued += result["queued"]
             else:
                 total_failed += len(batch)
         
         error_messages = [
             result.get("error")
             for result in all_results
-            if not result.get("success") and result.get("error")
+            if not result.get("success") and not result.get("queued") and result.get("error")
         ]
         error_message = error_messages[0] if error_messages else ""
 
-        message = f"成功写入 {total_success} 条记录"
+        message = f"成功{action} {total_success} 条记录"
+        if total_queued > 0:
+            message += f"，{total_queued} 条因时间预算不足转入写入队列"
         if total_failed > 0:
             message += f"，{total_failed} 条失败"
             if error_message:
@@ -98,14 +263,42 @@ class FeishuWriter:
             "message": message,
             "totalSuccess": total_success,
             "totalFailed": total_failed,
+            "totalQueued": total_queued,
             "details": all_results,
+            "batchSizes": [len(batch) for batch in batches],
             "errors": error_messages
         }
     
-    async def _create_batch(self, records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    def _batch_sender(self, records: List[Dict[str, Any]], client_token: Optional[str] = None):
+        """构造批次发送函数（同一批次的所有重试共用一个 client_token，避免重复写入）"""
+        client_token = client_token or str(uuid.uuid4())
+
+        async def send() -> Dict[str, Any]:
+            return await self._create_batch(records, client_token)
+
+        return send
+
+    def _update_sender(self, records: List[Dict[str, Any]]):
+        """构造批量更新发送函数（更新按 record_id 覆盖字段，重试天然幂等）"""
+        async def send() -> Dict[str, Any]:
+            return await self._post_records("batch_update", records)
+
+        return send
+
+    async def _create_batch(self, records: List[Dict[str, Any]], client_token: Optional[str] = None) -> Dict[str, Any]:
         """创建一批记录"""
+        params = {"client_token": client_token} if client_token else None
+        return await self._post_records("batch_create", records, params)
+
+    async def _post_records(
+        self,
+        action: str,
+        records: List[Dict[str, Any]],
+        params: Optional[Dict[str, str]] = None
+    ) -> Dict[str, Any]:
+        """调用记录批量接口（batch_create / batch_update）"""
         # base_url 已包含 /open-apis
-        url = f"{self.base_url}/bitable/v1/apps/{self.app_token}/tables/{self.table_id}/records/batch_create"
+        url = f"{self.base_url}/bitable/v1/apps/{self.app_token}/tables/{self.table_id}/records/{action}"
         
         # 构建请求体
         payload = {
@@ -113,37 +306,21 @@ class FeishuWriter:
         }
         
         try:
-            async with httpx.AsyncClient(timeout=60.0) as client:
+            async with httpx.AsyncClient(timeout=current_deadline().write_timeout(60.0)) as client:
                 response = await client.post(
                     url, 
-                    headers=self._get_headers(), 
+                    headers=await self._get_headers(), 
+                    params=params,
                     json=payload
                 )
-                
-                if response.status_code != 200:
-                    return {
-                        "success": False,
-                        "error": f"HTTP {response.status_code}: {response.text}",
-                        "count": 0
-                    }
-                
-                data = response.json()
-                
-                if data.get("code") != 0:
-                    return {
-                        "success": False,
-                        "error": f"API 错误 ({data.get('code')}): {data.get('msg', '未知错误')}",
-                        "count": 0,
-                        "detail": data
-                    }
-                
-                created_records = data.get("data", {}).get("records", [])
-                return {
-                    "success": True,
-                    "count": len(created_records),
-                    "record_ids": [r.get("record_id") for r in created_records]
-                }
-                
+        except httpx.TransportError as e:
+            # 网络错误可安全重试（创建由 client_token 保证幂等，更新按 record_id 覆盖）
+            return {
+                "success": False,
+                "error": f"网络错误: {e}",
+                "count": 0,
+                "retryable": True
+            }
         except Exception as e:
             return {
                 "success": False,
@@ -151,15 +328,76 @@ class FeishuWriter:
                 "count": 0
             }
 
+        try:
+            data = response.json()
+        except ValueError:
+            data = {}
+
+        code = data.get("code")
+        retry_after = self._parse_retry_after(response)
+
+        if response.status_code != 200:
+            return {
+                "success": False,
+                "error": f"HTTP {response.status_code}: {response.text}",
+                "count": 0,
+                "retryable": response.status_code == 429 or response.status_code >= 500 or code in RETRYABLE_CODES,
+                "rate_limited": response.status_code == 429 or code in RATE_LIMIT_CODES,
+                "retry_after": retry_after
+            }
+        
+        if code in TOKEN_ERROR_CODES:
+            # token 过期或被吊销：使缓存失效后重试
+            self.auth.invalidate()
+            return {
+                "success": False,
+                "error": f"API 错误 ({code}): {data.get('msg', '未知错误')}",
+                "count": 0,
+                "retryable": True
+            }
+
+        if code != 0:
+            if code in SCHEMA_ERROR_CODES:
+                schema_cache.invalidate(self.app_token, self.table_id)
+                option_registry.forget(self.app_token, self.table_id)
+            return {
+                "success": False,
+                "error": f"API 错误 ({code}): {data.get('msg', '未知错误')}",
+                "count": 0,
+                "detail": data,
+                "retryable": code in RETRYABLE_CODES,
+                "rate_limited": code in RATE_LIMIT_CODES,
+                "retry_after": retry_after
+            }
+        
+        result_records = data.get("data", {}).get("records", [])
+        return {
+            "success": True,
+            "count": len(result_records),
+            "record_ids": [r.get("record_id") for r in result_records]
+        }
+
+    def _parse_retry_after(self, response: httpx.Response) -> Optional[float]:
+        """解析限频响应中的建议等待时间（秒）"""
+        for header in ("Retry-After", "x-ogw-ratelimit-reset"):
+            value = response.headers.get(header)
+            if value:
+                try:
+                    return float(value)
+                except ValueError:
+                    continue
+        return None
+
     async def _get_table_fields(self) -> Dict[str, Any]:
-        """获取表格字段信息并缓存"""
-        if self._fields_cache is not None:
-            return self._fields_cache
+        """获取表格字段信息（进程内共享缓存）"""
+        return await schema_cache.get(self.app_token, self.table_id, self._load_table_fields)
 
+    async def _load_table_fields(self) -> Dict[str, Any]:
+        """从飞书拉取表格字段信息"""
         url = f"{self.base_url}/bitable/v1/apps/{self.app_token}/tables/{self.table_id}/fields"
-        headers = self._get_headers()
+        headers = await self._get_headers()
 
-        async with httpx.AsyncClient(timeout=30.0) as client:
+        async with httpx.AsyncClient(timeout=current_deadline().write_timeout(30.0)) as client:
             response = await client.get(url, headers=headers)
             if response.status_code != 200:
                 raise Exception(f"获取表格字段失败: HTTP {response.status_code}")
@@ -169,60 +407,124 @@ class FeishuWriter:
             raise Exception(f"获取表格字段失败: {data.get('msg', '未知错误')}")
 
         items = data.get("data", {}).get("items", [])
-        field_map = {item.get("field_name"): item for item in items if item.get("field_name")}
-
-        self._fields_cache = field_map
-        return field_map
+        return {item.get("field_name"): item for item in items if item.get("field_name")}
 
     async def _ensure_select_options(
         self,
         records: List[Dict[str, Any]],
         field_map: Dict[str, Any]
     ) -> bool:
-        """确保单选/多选字段的选项包含将要写入的值"""
-        pending_updates: Dict[str, set] = {}
+        """
+        确保单选/多选字段的选项包含将要写入的值
+
+        一次遍历汇总所有字段的缺失选项，各字段并发更新；已登记（新增过或被拒绝）的选项不再检查
+        """
+        pending_updates: Dict[str, Counter] = {}
 
         for record in records:
             fields = record.get("fields", {}) if isinstance(record, dict) else {}
-            for raw_name, value in fields.items():
-                resolved_name = self._resolve_field_name(raw_name, field_map)
-                if not resolved_name:
-                    continue
+            plan = self._get_plan(fields, field_map)
+            for field_plan in plan.select_fields:
+                value = fields.get(field_plan.source)
+                candidate_values = self._collect_select_values(field_plan.target, value, field_plan.field_type)
+                missing = [
+                    v for v in candidate_values
+                    if v and v not in field_plan.option_names
+                    and not option_registry.is_checked(self.app_token, self.table_id, field_plan.target, v)
+                ]
+                if missing:
+                    pending_updates.setdefault(field_plan.target, Counter()).update(missing)
 
-                field_meta = field_map.get(resolved_name)
-                field_type = self._resolve_field_type(field_meta)
-                if field_type not in (3, 4):
-                    continue
+        if not pending_updates:
+            return False
 
-                if field_type == 3 and resolved_name not in self._allow_single_select_any_value():
-                    continue
-                if field_type == 4 and resolved_name not in self._allow_multi_select_any_value():
-                    continue
+        async with httpx.AsyncClient(timeout=current_deadline().write_timeout(30.0)) as client:
+            results = await asyncio.gather(*(
+                self._provision_field_options(client, field_map.get(field_name), missing)
+                for field_name, missing in pending_updates.items()
+            ))
 
-                option_names = {
-                    opt.get("name")
-                    for opt in (field_meta.get("property") or {}).get("options", [])
-                    if opt.get("name")
-                }
-                candidate_values = self._collect_select_values(resolved_name, value, field_type)
-                missing = {v for v in candidate_values if v and v not in option_names}
-                if missing:
-                    pending_updates.setdefault(resolved_name, set()).update(missing)
+        return any(results)
 
-        if not pending_updates:
+    async def _provision_field_options(
+        self,
+        client: httpx.AsyncClient,
+        field_meta: Optional[Dict[str, Any]],
+        missing: Counter
+    ) -> bool:
+        """
+        按选项上限新增一个字段的缺失选项，并登记结果
+
+        更新接口会整体替换选项列表：同一字段的更新持锁逐个进行，
+        持锁后以共享缓存中的最新字段信息为基础合并，不覆盖并发请求刚新增的选项
+        """
+        if not field_meta:
             return False
 
-        updated_any = False
-        for field_name, missing in pending_updates.items():
-            field_meta = field_map.get(field_name)
-            if not field_meta:
-                continue
-            success = await self._update_field_options(field_meta, missing)
-            updated_any = updated_any or success
+        field_name = field_meta.get("field_name")
+        async with option_registry.lock(self.app_token, self.table_id, field_name):
+            field_meta = (await self._get_table_fields()).get(field_name) or field_meta
+            existing = self._option_names(field_meta)
+            missing = Counter({
+                value: count for value, count in missing.items()
+                if value not in existing
+                and not option_registry.is_checked(self.app_token, self.table_id, field_name, value)
+            })
+            additions, overflow = option_registry.plan_additions(field_name, len(existing), missing)
+
+            if overflow:
+                option_registry.mark_rejected(self.app_token, self.table_id, field_name, overflow)
+                print(f"[飞书写入] 字段 {field_name} 选项数达到上限，{len(overflow)} 个新值未新增")
+
+            if not additions:
+                return False
+
+            success = await self._update_field_options(field_meta, set(additions), client)
+            if success:
+                option_registry.mark_added(self.app_token, self.table_id, field_name, additions)
+            return success
+
+    async def _upload_attachments(
+        self,
+        records: List[Dict[str, Any]],
+        field_map: Dict[str, Any]
+    ) -> List[Dict[str, Any]]:
+        """将附件字段中的图片链接上传为飞书素材，替换为附件结构"""
+        pending: List[Tuple[int, str, List[str]]] = []
 
-        if updated_any:
-            self._fields_cache = None
-        return updated_any
+        for index, record in enumerate(records):
+            fields = record.get("fields", {}) if isinstance(record, dict) else {}
+            plan = self._get_plan(fields, field_map)
+            for field_plan in plan.attachment_fields:
+                value = fields.get(field_plan.source)
+                if isinstance(value, list) and value and all(isinstance(item, dict) and "file_token" in item for item in value):
+                    continue
+                urls = split_attachment_urls(value)
+                if urls:
+                    pending.append((index, field_plan.source, urls))
+
+        if not pending:
+            return records
+
+        file_tokens = await attachment_uploader.upload_urls(
+            [url for _, _, urls in pending for url in urls],
+            app_token=self.app_token,
+            token=await self.auth.get_token(),
+            base_url=self.base_url
+        )
+
+        records = list(records)
+        for index, source, urls in pending:
+            attachments = [
+                {"file_token": file_tokens[url]}
+                for url in urls
+                if file_tokens.get(url)
+            ]
+            if attachments:
+                record = records[index]
+                records[index] = {**record, "fields": {**record["fields"], source: attachments}}
+
+        return records
 
     def _collect_select_values(self, field_name: str, value: Any, field_type: int) -> set:
         if value is None:
@@ -247,7 +549,12 @@ class FeishuWriter:
 
         return {v for v in values if v}
 
-    async def _update_field_options(self, field_meta: Dict[str, Any], missing: set) -> bool:
+    async def _update_field_options(
+        self,
+        field_meta: Dict[str, Any],
+        missing: set,
+        client: Optional[httpx.AsyncClient] = None
+    ) -> bool:
         field_id = field_meta.get("field_id") or field_meta.get("fieldId")
         field_name = field_meta.get("field_name")
         field_type = self._resolve_field_type(field_meta)
@@ -276,97 +583,156 @@ class FeishuWriter:
             f"tables/{self.table_id}/fields/{field_id}"
         )
 
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.put(url, headers=self._get_headers(), json=payload)
+        if client is None:
+            async with httpx.AsyncClient(timeout=current_deadline().write_timeout(30.0)) as own_client:
+                response = await own_client.put(url, headers=await self._get_headers(), json=payload)
+        else:
+            response = await client.put(url, headers=await self._get_headers(), json=payload)
 
         if response.status_code != 200:
             return False
 
         data = response.json()
-        return data.get("code") == 0
+        if data.get("code") != 0:
+            return False
+
+        # 就地更新共享字段缓存（优先使用接口返回的字段信息）
+        updated_field = (data.get("data") or {}).get("field") or {
+            **field_meta,
+            "property": payload["property"],
+        }
+        updated_field.setdefault("field_name", field_name)
+        schema_cache.update_field(self.app_token, self.table_id, updated_field)
+        return True
 
     def _normalize_records(
         self,
         records: List[Dict[str, Any]],
         field_map: Dict[str, Any]
     ) -> List[Dict[str, Any]]:
-        """按字段类型规范化记录"""
+        """按字段类型规范化记录（同一组输入字段共用一份编译后的计划）"""
         normalized_records: List[Dict[str, Any]] = []
 
         for record in records:
             fields = record.get("fields", {}) if isinstance(record, dict) else {}
-            normalized_fields: Dict[str, Any] = {}
-
-            for field_name, value in fields.items():
-                resolved_name = self._resolve_field_name(field_name, field_map)
-                if not resolved_name:
-                    continue
-
-                field_meta = field_map.get(resolved_name)
-                normalized_value = self._normalize_field_value(resolved_name, value, field_meta)
-                if normalized_value is not None:
-                    normalized_fields[resolved_name] = normalized_value
-
+            plan = self._get_plan(fields, field_map)
             normalized_records.append({
                 **record,
-                "fields": normalized_fields
+                "fields": plan.apply(fields)
             })
 
         return normalized_records
 
-    def _normalize_field_value(
+    def _get_plan(self, fields: Dict[str, Any], field_map: Dict[str, Any]) -> NormalizePlan:
+        """获取（必要时编译）输入字段对应的规范化计划，字段结构版本变化后自动重新编译"""
+        key = (
+            self.app_token,
+            self.table_id,
+            schema_cache.version(self.app_token, self.table_id),
+            tuple(fields)
+        )
+        plan = _plan_cache.get(key)
+        if plan is not None:
+            _plan_cache.move_to_end(key)
+            return plan
+
+        plan = self._compile_plan(key[3], field_map)
+        _plan_cache[key] = plan
+        while len(_plan_cache) > NORMALIZE_PLAN_CACHE_SIZE:
+            _plan_cache.popitem(last=False)
+        return plan
+
+    def _compile_plan(self, field_names: Tuple[str, ...], field_map: Dict[str, Any]) -> NormalizePlan:
+        """为一组输入字段编译规范化计划"""
+        field_plans: List[FieldPlan] = []
+
+        for field_name in field_names:
+            resolved_name = self._resolve_field_name(field_name, field_map)
+            if not resolved_name:
+                continue
+
+            field_meta = field_map.get(resolved_name)
+            field_type = self._resolve_field_type(field_meta)
+            # 20 Formula: 只读字段，跳过写入
+            if field_type == 20:
+                continue
+
+            option_names = self._option_names(field_meta)
+            auto_options = (
+                (field_type == 3 and resolved_name in SINGLE_SELECT_ANY_VALUE)
+                or (field_type == 4 and resolved_name in MULTI_SELECT_ANY_VALUE)
+            )
+            convert = self._build_converter(resolved_name, field_meta, field_type, option_names)
+            if auto_options and option_registry.overflow == OVERFLOW_DROP:
+                convert = _drop_rejected(
+                    convert,
+                    option_registry.rejected(self.app_token, self.table_id, resolved_name)
+                )
+            field_plans.append(FieldPlan(
+                source=field_name,
+                target=resolved_name,
+                field_type=field_type,
+                option_names=option_names,
+                convert=convert,
+                auto_options=auto_options
+            ))
+
+        return NormalizePlan(field_plans)
+
+    def _option_names(self, field_meta: Optional[Dict[str, Any]]) -> frozenset:
+        options = ((field_meta or {}).get("property") or {}).get("options") or []
+        return frozenset(opt.get("name") for opt in options if opt.get("name"))
+
+    def _build_converter(
         self,
         field_name: str,
-        value: Any,
-        field_meta: Optional[Dict[str, Any]]
-    ) -> Any:
-        """根据字段类型处理字段值"""
-        if value is None:
-            return None
-
+        field_meta: Optional[Dict[str, Any]],
+        field_type: Optional[int],
+        option_names: frozenset
+    ) -> Callable[[Any], Any]:
+        """根据字段类型生成转换函数"""
         if not field_meta:
-            return value
-
-        field_type = self._resolve_field_type(field_meta)
-        field_property = field_meta.get("property") or {}
-        options = field_property.get("options") or []
-        option_names = {opt.get("name") for opt in options if opt.get("name")}
+            return _identity
 
         # 20 Formula: 只读字段，跳过写入
         if field_type == 20:
-            return None
+            return _drop
 
         # 1 Text
         if field_type == 1:
-            if isinstance(value, list):
-                return "\n".join(self._to_text(v) for v in value if self._to_text(v))
-            return self._to_text(value)
+            return self._to_text_value
 
         # 2 Number
         if field_type == 2:
-            return self._to_number(value)
+            return self._to_number
 
         # 3 SingleSelect
         if field_type == 3:
-            normalized = self._to_single_select_value(field_name, value, option_names)
-            return normalized
+            return lambda value: self._to_single_select_value(field_name, value, option_names)
 
         # 4 MultiSelect
         if field_type == 4:
-            normalized = self._to_multi_select_value(field_name, value, option_names)
-            return normalized
+            return lambda value: self._to_multi_select_value(field_name, value, option_names)
 
         # 5 DateTime (ms timestamp)
         if field_type == 5:
-            return self._to_timestamp(value)
+            return self._to_timestamp
 
         # 17 Attachment: 跳过非附件结构，避免写入失败
         if field_type == 17:
-            if isinstance(value, list) and all(isinstance(item, dict) for item in value):
-                return value
-            return None
+            return self._to_attachment_value
 
-        return value
+        return _identity
+
+    def _to_text_value(self, value: Any) -> str:
+        if isinstance(value, list):
+            return "\n".join(self._to_text(v) for v in value if self._to_text(v))
+        return self._to_text(value)
+
+    def _to_attachment_value(self, value: Any) -> Optional[List[Dict[str, Any]]]:
+        if isinstance(value, list) and all(isinstance(item, dict) for item in value):
+            return value
+        return None
 
     def _to_text(self, value: Any) -> str:
         if value is None:
@@ -434,7 +800,7 @@ class FeishuWriter:
         normalized = self._to_text(value)
         normalized = self._normalize_note_type(field_name, normalized, option_names)
         if option_names and normalized not in option_names:
-            if field_name in self._allow_single_select_any_value():
+            if field_name in SINGLE_SELECT_ANY_VALUE:
                 return normalized or None
             return None
         return normalized or None
@@ -457,7 +823,7 @@ class FeishuWriter:
         if field_name in ("笔记标签", "标签"):
             values = [self._to_text(v) for v in values if self._to_text(v)]
 
-        if option_names and field_name not in self._allow_multi_select_any_value():
+        if option_names and field_name not in MULTI_SELECT_ANY_VALUE:
             values = [v for v in values if v in option_names]
 
         return values or None
@@ -472,44 +838,56 @@ class FeishuWriter:
             return "视频"
         return value
 
-    def _allow_single_select_any_value(self) -> set:
-        return {"账号名称", "博主昵称"}
-
-    def _allow_multi_select_any_value(self) -> set:
-        return {"笔记标签", "标签"}
-
     def _resolve_field_name(self, field_name: str, field_map: Dict[str, Any]) -> Optional[str]:
         if field_name in field_map:
             return field_name
 
-        aliases = self._field_aliases().get(field_name, [])
+        aliases = FIELD_ALIASES.get(field_name, [])
         for alias in aliases:
             if alias in field_map:
                 return alias
         return None
 
-    def _field_aliases(self) -> Dict[str, List[str]]:
-        return {
-            # 笔记字段别名
-            "笔记类型": ["笔记类型", "笔记类型1"],
-            "笔记标签": ["笔记标签", "标签"],
-            "图片链接": ["图片链接", "笔记封面图链接"],
-            "笔记标题": ["笔记标题", "标题"],
-            "笔记内容": ["笔记内容", "文案", "笔记文案", "内容"],
-            "账号名称": ["账号名称", "博主昵称"],
-            "头像链接": ["头像链接", "头像URL", "头像地址"],
-            # 博主字段别名
-            "博主昵称": ["账号名称", "博主昵称"],
-            "小红书号": ["小红书ID", "小红书号", "抖音号"],
-            "个人简介": ["简介", "个人简介"],
-            "获赞与收藏": ["赞藏总数", "获赞与收藏", "赞藏"],
-        }
+
+def _identity(value: Any) -> Any:
+    return value
+
+
+def _drop(value: Any) -> None:
+    return None
+
+
+def _drop_rejected(convert: Callable[[Any], Any], rejected: set) -> Callable[[Any], Any]:
+    """包装选项字段的转换函数，丢弃因超出选项上限被拒绝的值"""
+    def wrapped(value: Any) -> Any:
+        value = convert(value)
+        if not rejected or value is None:
+            return value
+        if isinstance(value, list):
+            return [v for v in value if v not in rejected] or None
+        return None if value in rejected else value
+
+    return wrapped
+
+
+def derive_client_token(client_token: Optional[str], index: int, count: int) -> Optional[str]:
+    """
+    由一组记录的 client_token 派生各批次的 client_token
+
+    只有一个批次时直接使用原值；多个批次时按序号确定性派生（仍为 uuid4 格式），
+    同一组记录重试时各批次拿到相同的标识
+    """
+    if not client_token or count <= 1:
+        return client_token
+    derived = uuid.uuid5(uuid.UUID(client_token), str(index))
+    return str(uuid.UUID(bytes=derived.bytes, version=4))
 
 
 async def write_to_feishu(
     app_token: str, 
     table_id: str, 
-    records: List[Dict[str, Any]]
+    records: List[Dict[str, Any]],
+    client_token: Optional[str] = None
 ) -> Dict[str, Any]:
     """
     写入数据到飞书表格的便捷函数
@@ -518,9 +896,10 @@ async def write_to_feishu(
         app_token: 多维表格应用 Token
         table_id: 数据表 ID
         records: 记录列表
+        client_token: 幂等标识（可选）
         
     Returns:
         写入结果
     """
     writer = FeishuWriter(app_token, table_id)
-    return await writer.batch_create_records(records)
+    return await writer.batch_create_records(records, client_token)
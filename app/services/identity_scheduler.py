@@ -0,0 +1,298 @@
+"""
+按账号调度上游请求
+同一个 Cookie 身份（小红书 a1 / 抖音 sessionid）的所有上游请求共用一个调度状态：
+限制同时进行的请求数，并保证相邻两次请求的开始时间至少间隔 IDENTITY_REQUEST_INTERVAL 秒，
+多个任务同时使用同一 Cookie 时账号看到的请求频率仍是配置值
+
+- 间隔按限速控制器的延迟系数缩放，账号出现风控信号时所有任务一起放慢
+- 按优先级排队：交互式接口的请求先于批量采集的请求获得名额；批量采集在笔记之间调用
+  yield_to_interactive，同一账号有交互式请求进行中时暂停
+- 配置 IDENTITY_SCHEDULER_SHARED_PATH 后，请求开始时间通过 SQLite 文件在同一台机器的多个 worker 间预约，
+  跨 worker 时只保证请求间隔，并发数仍按 worker 各自限制
+- 闲置（无进行中 / 排队请求）超过 idle_ttl 的账号状态在新账号加入时清除，状态数不超过 max_identities
+"""
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+
+from app.core.config import settings
+from app.services.cookie_rate import _mask_identity, cookie_rate_controller
+from app.services.priority_lanes import LANE_BULK, LANE_INTERACTIVE, LANES, current_lane
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS identity_slots (
+    identity TEXT PRIMARY KEY,
+    next_at REAL NOT NULL
+);
+"""
+
+
+class _IdentityState:
+    """单个账号的调度状态"""
+
+    def __init__(self):
+        self.queues: Dict[str, Deque[asyncio.Future]] = {lane: deque() for lane in LANES}
+        self.running: Dict[str, int] = {lane: 0 for lane in LANES}
+        self.next_at = 0.0  # 下一个请求最早的开始时间（monotonic）
+        self.interactive_done_at = 0.0  # 最近一个交互式请求结束的时间
+        self.last_used = time.monotonic()
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.stats = {
+            lane: {"requests": 0, "waitTotal": 0.0, "waitMax": 0.0}
+            for lane in LANES
+        }
+        self.stats["yields"] = {"count": 0, "waitTotal": 0.0}
+
+    def queued(self, lane: Optional[str] = None) -> int:
+        lanes = (lane,) if lane else LANES
+        return sum(1 for name in lanes for future in self.queues[name] if not future.done())
+
+    def busy(self) -> bool:
+        """是否有进行中 / 排队的请求或待触发的分配"""
+        return bool(sum(self.running.values()) or self.queued() or self.timer)
+
+
+class IdentityScheduler:
+    """按账号的全局请求调度"""
+
+    def __init__(
+        self,
+        interval: float = 0.5,
+        concurrency: int = 2,
+        shared_path: str = "",
+        bulk_max_yield: float = 10.0,
+        idle_ttl: float = 1800.0,
+        max_identities: int = 10000
+    ):
+        self.interval = interval
+        self.concurrency = concurrency
+        self.shared_path = shared_path
+        self.bulk_max_yield = bulk_max_yield
+        self.idle_ttl = idle_ttl
+        self.max_identities = max_identities
+        # 按最近使用时间排序（最久未使用的在前）
+        self._states: "OrderedDict[str, _IdentityState]" = OrderedDict()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+
+    def _state(self, identity: str) -> _IdentityState:
+        now = time.monotonic()
+        state = self._states.get(identity)
+        if state is None:
+            self._evict(now)
+            state = self._states[identity] = _IdentityState()
+        else:
+            self._states.move_to_end(identity)
+        state.last_used = now
+        return state
+
+    def _evict(self, now: float) -> None:
+        """清除闲置的账号状态；超过上限时从最久未使用的开始清除，有请求进行中或排队的账号不清除"""
+        for identity, state in list(self._states.items()):
+            if len(self._states) < self.max_identities and now - state.last_used < self.idle_ttl:
+                break
+            if state.busy() or now < state.next_at:
+                continue
+            del self._states[identity]
+
+    def _interval(self, identity: str) -> float:
+        return self.interval * cookie_rate_controller.delay_factor(identity)
+
+    def estimate_wait(self, identity: str, lane: str = LANE_BULK) -> float:
+        """指定优先级的新请求预计需要等待的秒数（按排在前面的请求数与请求间隔估算）"""
+        state = self._states.get(identity)
+        if state is None:
+            return 0.0
+        # 同优先级与更高优先级的排队请求依次占用后续的时间片
+        ahead = sum(state.queued(name) for name in LANES[:LANES.index(lane) + 1])
+        return max(0.0, state.next_at - time.monotonic()) + ahead * self._interval(identity)
+
+    @asynccontextmanager
+    async def slot(self, identity: str) -> AsyncIterator[float]:
+        """
+        按当前请求的优先级获取账号的请求名额，离开上下文时释放
+
+        Yields:
+            实际等待的秒数
+        """
+        lane = current_lane()
+        state = self._state(identity)
+        enqueued_at = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        state.queues[lane].append(future)
+        self._dispatch(identity, state)
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 已分配名额但调用方被取消
+                self._release(identity, state, lane)
+            raise
+
+        try:
+            if self.shared_path:
+                await self._wait_shared(identity)
+            wait = time.monotonic() - enqueued_at
+            stats = state.stats[lane]
+            stats["requests"] += 1
+            stats["waitTotal"] += wait
+            stats["waitMax"] = max(stats["waitMax"], wait)
+            yield wait
+        finally:
+            self._release(identity, state, lane)
+
+    def _release(self, identity: str, state: _IdentityState, lane: str) -> None:
+        state.running[lane] -= 1
+        if lane == LANE_INTERACTIVE:
+            state.interactive_done_at = time.monotonic()
+        self._dispatch(identity, state)
+
+    def _dispatch(self, identity: str, state: _IdentityState) -> None:
+        """按优先级分配空闲名额，距上一个请求不足间隔时等到间隔结束再分配"""
+        while sum(state.running.values()) < self.concurrency:
+            lane = next((name for name in LANES if self._head(state.queues[name])), None)
+            if lane is None:
+                return
+
+            now = time.monotonic()
+            if now < state.next_at:
+                if state.timer is None:
+                    def _retry() -> None:
+                        state.timer = None
+                        self._dispatch(identity, state)
+                    state.timer = asyncio.get_running_loop().call_later(state.next_at - now, _retry)
+                return
+
+            future = state.queues[lane].popleft()
+            state.next_at = now + self._interval(identity)
+            state.running[lane] += 1
+            future.set_result(None)
+
+    @staticmethod
+    def _head(queue: Deque[asyncio.Future]) -> Optional[asyncio.Future]:
+        while queue and queue[0].done():
+            # 排队期间被取消的请求
+            queue.popleft()
+        return queue[0] if queue else None
+
+    async def _wait_shared(self, identity: str) -> None:
+        """跨 worker 预约开始时间（墙钟时间）并等待"""
+        start = await asyncio.to_thread(self._reserve_shared, identity, self._interval(identity))
+        delay = start - time.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def yield_to_interactive(self, identity: str) -> float:
+        """
+        批量采集在笔记之间调用：同一账号有交互式请求排队或进行中时暂停，
+        直到交互式请求结束后一个请求间隔（最多等待 bulk_max_yield 秒）
+
+        Returns:
+            等待的秒数
+        """
+        state = self._states.get(identity)
+        if state is None or current_lane() == LANE_INTERACTIVE:
+            return 0.0
+
+        started = time.monotonic()
+        deadline = started + self.bulk_max_yield
+        while True:
+            now = time.monotonic()
+            interval = self._interval(identity)
+            if state.queued(LANE_INTERACTIVE) or state.running[LANE_INTERACTIVE]:
+                resume_at = now + interval
+            else:
+                # 交互式请求的后续请求通常紧跟着发出，多留一个间隔
+                resume_at = state.interactive_done_at + interval
+            if resume_at <= now or now >= deadline:
+                break
+            await asyncio.sleep(min(resume_at, deadline) - now)
+
+        waited = time.monotonic() - started
+        if waited > 0:
+            state.stats["yields"]["count"] += 1
+            state.stats["yields"]["waitTotal"] += waited
+        return waited
+
+    # ---------- 跨 worker 预约（在线程池中执行） ----------
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.shared_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.shared_path, check_same_thread=False, isolation_level=None, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _reserve_shared(self, identity: str, interval: float) -> float:
+        """预约下一个开始时间，返回预约到的墙钟时间"""
+        # 只保存账号标识的摘要，不在文件中留下 Cookie 值
+        key = hashlib.sha256(identity.encode("utf-8")).hexdigest()
+        with self._db_lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT next_at FROM identity_slots WHERE identity = ?", (key,)).fetchone()
+                now = time.time()
+                start = max(now, row[0]) if row else now
+                conn.execute(
+                    "INSERT INTO identity_slots (identity, next_at) VALUES (?, ?) "
+                    "ON CONFLICT(identity) DO UPDATE SET next_at = excluded.next_at",
+                    (key, start + interval)
+                )
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            return start
+
+    def stats(self) -> Dict[str, Any]:
+        identities = {}
+        for identity, state in self._states.items():
+            lanes = {}
+            for lane in LANES:
+                stats = state.stats[lane]
+                requests = stats["requests"]
+                lanes[lane] = {
+                    "running": state.running[lane],
+                    "queued": state.queued(lane),
+                    "requests": requests,
+                    "estimatedWaitSeconds": round(self.estimate_wait(identity, lane), 2),
+                    "avgWaitMs": round(stats["waitTotal"] / requests * 1000, 1) if requests else 0,
+                    "maxWaitMs": round(stats["waitMax"] * 1000, 1),
+                }
+            identities[_mask_identity(identity)] = {
+                "intervalSeconds": round(self._interval(identity), 3),
+                "lanes": lanes,
+                "bulkYields": state.stats["yields"]["count"],
+                "bulkYieldSeconds": round(state.stats["yields"]["waitTotal"], 2),
+            }
+        return {
+            "interval": self.interval,
+            "concurrency": self.concurrency,
+            "shared": bool(self.shared_path),
+            "idleTtl": self.idle_ttl,
+            "identities": identities,
+        }
+
+
+# 全局调度器（进程内所有采集器共享）
+identity_scheduler = IdentityScheduler(
+    interval=settings.IDENTITY_REQUEST_INTERVAL,
+    concurrency=settings.IDENTITY_CONCURRENCY,
+    shared_path=settings.IDENTITY_SCHEDULER_SHARED_PATH,
+    bulk_max_yield=settings.PRIORITY_BULK_MAX_YIELD,
+    idle_ttl=settings.COOKIE_STATE_IDLE_TTL,
+    max_identities=settings.COOKIE_STATE_MAX_IDENTITIES,
+)
@@ -0,0 +1,140 @@
+"""
+笔记筛选模块
+在列表分页阶段执行筛选与排序，只对最终保留的笔记请求详情
+"""
+import re
+import time
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from app.models.schemas import NOTE_RECORD_FIELDS, NoteFilter, NoteInfo, NoteRecord
+
+
+class NoteMetrics(NamedTuple):
+    """筛选使用的列表级字段，未知值为 None"""
+    note_type: Optional[str]
+    likes: Optional[int]
+    publish_time: Optional[int]  # 毫秒时间戳
+    title: Optional[str]
+
+
+def _to_ms(value: Any) -> Optional[int]:
+    if not isinstance(value, (int, float)) or isinstance(value, bool) or value <= 0:
+        return None
+    value_int = int(value)
+    if value_int < 100000000000:
+        return value_int * 1000
+    return value_int
+
+
+def note_info_metrics(note_info: NoteInfo) -> NoteMetrics:
+    """小红书列表项（NoteInfo）的筛选字段"""
+    return NoteMetrics(
+        note_type=note_info.type or None,
+        likes=note_info.likedCount,
+        publish_time=_to_ms(note_info.publishTime),
+        title=note_info.displayTitle or None,
+    )
+
+
+def aweme_metrics(aweme_item: Dict[str, Any]) -> NoteMetrics:
+    """抖音列表项（aweme）的筛选字段"""
+    statistics = aweme_item.get("statistics") or {}
+    likes = statistics.get("digg_count")
+    return NoteMetrics(
+        note_type="normal" if aweme_item.get("images") else "video",
+        likes=int(likes) if isinstance(likes, (int, float)) else None,
+        publish_time=_to_ms(aweme_item.get("create_time")),
+        title=aweme_item.get("desc") or None,
+    )
+
+
+def record_metrics(record: NoteRecord) -> NoteMetrics:
+    """详情记录的筛选字段（用于详情返回后的复核）"""
+    fields = record.fields
+    likes = fields.get("点赞数")
+    return NoteMetrics(
+        note_type=fields.get("笔记类型") or None,
+        likes=int(likes) if isinstance(likes, (int, float)) else None,
+        publish_time=_to_ms(fields.get("发布时间")),
+        title=fields.get("笔记标题") or None,
+    )
+
+
+def missing_note_fields(records: List[NoteRecord]) -> List[str]:
+    """列出记录中缺失的标准笔记字段（列表模式使用）"""
+    return [
+        field
+        for field in NOTE_RECORD_FIELDS
+        if any(field not in record.fields for record in records)
+    ]
+
+
+class NoteSelector:
+    """
+    列表阶段的筛选与 Top-K 选择器
+
+    - 未设置 rankBy 时，命中 maxNotes 条即停止翻页
+    - 设置 rankBy 时，扫描至 scanLimit 条后按指标取前 maxNotes 条
+    - 列表中缺失的字段视为命中，由详情返回后的 matches() 复核
+    """
+
+    def __init__(self, note_filter: Optional[NoteFilter], max_notes: int):
+        self.note_filter = note_filter
+        self.max_notes = max_notes
+        self.scanned = 0
+        self._accepted: List[tuple] = []
+        self._title_re = (
+            re.compile(note_filter.titlePattern)
+            if note_filter and note_filter.titlePattern
+            else None
+        )
+        self._min_publish_time = None
+        if note_filter and note_filter.publishedWithinDays:
+            self._min_publish_time = int((time.time() - note_filter.publishedWithinDays * 86400) * 1000)
+
+    @property
+    def done(self) -> bool:
+        """是否可以停止翻页"""
+        if self.note_filter:
+            if self.scanned >= self.note_filter.scanLimit:
+                return True
+            if self.note_filter.rankBy:
+                return False
+        return len(self._accepted) >= self.max_notes
+
+    def matches(self, metrics: NoteMetrics) -> bool:
+        flt = self.note_filter
+        if not flt:
+            return True
+        if flt.noteType and metrics.note_type and metrics.note_type != flt.noteType:
+            return False
+        if flt.minLikes is not None and metrics.likes is not None and metrics.likes < flt.minLikes:
+            return False
+        if self._min_publish_time and metrics.publish_time and metrics.publish_time < self._min_publish_time:
+            return False
+        if self._title_re and metrics.title is not None and not self._title_re.search(metrics.title):
+            return False
+        return True
+
+    def offer(self, item: Any, metrics: NoteMetrics) -> bool:
+        """提交一个列表项，返回是否被保留"""
+        if self.done:
+            return False
+        self.scanned += 1
+        if not self.matches(metrics):
+            return False
+        self._accepted.append((metrics, item))
+        return True
+
+    def results(self) -> List[Any]:
+        """按排序规则返回最终保留的列表项"""
+        return self.rank(self._accepted)
+
+    def rank(self, pairs: List[tuple]) -> List[Any]:
+        """按排序规则对 (指标, 项) 排序并取前 maxNotes 条（未设置 rankBy 时保持原顺序）"""
+        rank_by = self.note_filter.rankBy if self.note_filter else None
+        if rank_by == "likes":
+            pairs = sorted(pairs, key=lambda pair: pair[0].likes if pair[0].likes is not None else -1, reverse=True)
+        elif rank_by == "time":
+            pairs = sorted(pairs, key=lambda pair: pair[0].publish_time or 0, reverse=True)
+        return [item for _, item in pairs[:self.max_notes]]
@@ -0,0 +1,133 @@
+"""
+请求优先级与延迟 SLO 模块
+单条笔记 / 单个视频 / 博主信息等交互式接口需要在 1 秒级返回，
+而博主主页、关键词与批量采集可能持续数分钟，两者共用同一批 Cookie
+
+- 交互式接口的上游请求在账号调度器中优先于批量采集的请求（见 identity_scheduler）
+- 批量采集在笔记之间让出账号，等交互式请求完成后再继续
+- 按优先级统计接口耗时与 SLO 达成率
+"""
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, Iterator, Optional
+
+from app.core.config import settings
+
+
+LANE_INTERACTIVE = "interactive"
+LANE_BULK = "bulk"
+
+# 优先级从高到低
+LANES = (LANE_INTERACTIVE, LANE_BULK)
+
+# 交互式接口
+INTERACTIVE_PATHS = {
+    "/api/v1/collect/note",
+    "/api/v1/collect/profile-info",
+    "/api/v1/douyin/collect/video",
+    "/api/v1/douyin/collect/profile-info",
+    "/api/v1/cookie/check",
+}
+
+# 统计耗时的批量采集接口（批量任务在后台执行，不按接口统计）
+BULK_PATHS = {
+    "/api/v1/collect",
+    "/api/v1/collect/keyword",
+    "/api/v1/douyin/collect",
+    "/api/v1/douyin/collect/keyword",
+}
+
+# 当前请求的优先级（未设置时按批量采集处理）
+_current_lane: ContextVar[str] = ContextVar("priority_lane", default=LANE_BULK)
+
+
+def current_lane() -> str:
+    return _current_lane.get()
+
+
+@contextmanager
+def use_lane(lane: str) -> Iterator[None]:
+    """在上下文内以指定优先级发起上游请求"""
+    token = _current_lane.set(lane)
+    try:
+        yield
+    finally:
+        _current_lane.reset(token)
+
+
+def lane_for_path(path: str) -> Optional[str]:
+    """接口对应的优先级，不统计的接口返回 None"""
+    path = path.rstrip("/")
+    if path in INTERACTIVE_PATHS:
+        return LANE_INTERACTIVE
+    if path in BULK_PATHS:
+        return LANE_BULK
+    return None
+
+
+class LatencySLOTracker:
+    """按优先级统计接口耗时与 SLO 达成率"""
+
+    def __init__(self, targets: Dict[str, float], window: int = 1000):
+        self.targets = targets
+        self._samples: Dict[str, Deque[float]] = {lane: deque(maxlen=window) for lane in LANES}
+        self._counts: Dict[str, Dict[str, int]] = {lane: {"requests": 0, "breaches": 0} for lane in LANES}
+
+    def record(self, lane: str, seconds: float) -> None:
+        self._samples[lane].append(seconds)
+        self._counts[lane]["requests"] += 1
+        if seconds > self.targets[lane]:
+            self._counts[lane]["breaches"] += 1
+
+    @staticmethod
+    def _percentile(latencies: list, percentile: float) -> Optional[int]:
+        if not latencies:
+            return None
+        index = min(len(latencies) - 1, int(len(latencies) * percentile))
+        return round(latencies[index] * 1000)
+
+    def stats(self) -> Dict[str, Any]:
+        lanes = {}
+        for lane in LANES:
+            latencies = sorted(self._samples[lane])
+            target = self.targets[lane]
+            within = sum(1 for latency in latencies if latency <= target)
+            lanes[lane] = {
+                **self._counts[lane],
+                "targetMs": round(target * 1000),
+                "p50Ms": self._percentile(latencies, 0.5),
+                "p95Ms": self._percentile(latencies, 0.95),
+                "p99Ms": self._percentile(latencies, 0.99),
+                # 最近窗口内的达成率
+                "attainment": round(within / len(latencies), 3) if latencies else None,
+            }
+        return lanes
+
+
+class PriorityLaneMiddleware:
+    """按接口路径设置请求优先级并统计耗时（ASGI 中间件）"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        lane = lane_for_path(scope.get("path", "")) if scope["type"] == "http" else None
+        if lane is None:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.monotonic()
+        with use_lane(lane):
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                slo_tracker.record(lane, time.monotonic() - started)
+
+
+# 全局实例（进程内共享）
+slo_tracker = LatencySLOTracker({
+    LANE_INTERACTIVE: settings.SLO_INTERACTIVE_SECONDS,
+    LANE_BULK: settings.SLO_BULK_SECONDS,
+})
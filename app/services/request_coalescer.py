@@ -0,0 +1,155 @@
+"""
+相同上游请求合并模块
+同一时间多个调用方请求同一个对象（同一篇笔记、同一个博主主页、同一个视频）时，
+只发起一次上游请求，其余调用方等待并共享解析结果
+
+- 合并键为 (平台, 接口, 对象 ID)，只合并同时进行中的请求，不缓存结果
+- 上游请求失败时，使用同一账号的调用方共享该错误；使用其他账号的调用方改用自己的 Cookie 单独请求，
+  避免一个失效 Cookie 连累其他用户
+- 所有等待方都取消后才取消上游请求
+- 共享请求在独立的上下文中执行，不继承发起方的时间预算；优先级取发起方的优先级，
+  交互式请求只加入同为交互式的请求，不会排在批量采集的队列里
+"""
+import asyncio
+import contextvars
+import copy
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from app.core.config import settings
+from app.services.priority_lanes import LANES, current_lane, use_lane
+from app.services.request_deadline import DeadlineExceeded
+
+
+FlightKey = Tuple[str, str, str, str]
+
+
+class _Flight:
+    """进行中的上游请求"""
+
+    __slots__ = ("task", "identity", "waiters", "shared")
+
+    def __init__(self, task: asyncio.Task, identity: str):
+        self.task = task
+        self.identity = identity
+        self.waiters = 0
+        self.shared = False  # 是否有其他调用方加入
+
+
+class RequestCoalescer:
+    """按 (平台, 接口, 对象 ID) 合并并发的相同请求"""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._flights: Dict[FlightKey, _Flight] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, platform: str, endpoint: str, name: str) -> None:
+        stats = self._stats.setdefault(
+            f"{platform}:{endpoint}", {"requests": 0, "upstream": 0, "coalesced": 0, "fallback": 0}
+        )
+        stats[name] += 1
+
+    async def run(
+        self,
+        platform: str,
+        endpoint: str,
+        entity_id: str,
+        identity: str,
+        work: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """
+        执行上游请求（同一对象已有进行中的请求时等待其结果）
+
+        Args:
+            platform: 平台（xhs / douyin）
+            endpoint: 接口名称
+            entity_id: 对象 ID（笔记 ID、博主 ID、视频 ID）
+            identity: 调用方的账号标识
+            work: 发起上游请求的函数
+        """
+        if not self.enabled or not entity_id:
+            return await work()
+
+        self._count(platform, endpoint, "requests")
+        lane = current_lane()
+        # 加入优先级不低于自己的进行中请求
+        flight = next(
+            (
+                self._flights[(platform, endpoint, entity_id, name)]
+                for name in LANES[:LANES.index(lane) + 1]
+                if (platform, endpoint, entity_id, name) in self._flights
+            ),
+            None
+        )
+        if flight is None:
+            self._count(platform, endpoint, "upstream")
+            flight = self._start((platform, endpoint, entity_id, lane), identity, work)
+            result = await self._wait(flight)
+            return copy.deepcopy(result) if flight.shared else result
+
+        self._count(platform, endpoint, "coalesced")
+        flight.shared = True
+        try:
+            result = await self._wait(flight)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if flight.identity == identity and not isinstance(e, DeadlineExceeded):
+                raise
+            # 其他账号的请求失败（或受其他请求的时间预算限制），改用自己的 Cookie 与时间预算请求
+            self._count(platform, endpoint, "fallback")
+            return await work()
+        # 共享的解析结果可能被调用方修改，每个等待方拿到独立副本
+        return copy.deepcopy(result)
+
+    def _start(self, key: FlightKey, identity: str, work: Callable[[], Awaitable[Any]]) -> _Flight:
+        loop = asyncio.get_running_loop()
+
+        def spawn() -> asyncio.Task:
+            # 在空白上下文中创建任务：只设置优先级，不带发起方的时间预算
+            with use_lane(key[3]):
+                return loop.create_task(work())
+
+        task = contextvars.Context().run(spawn)
+        flight = self._flights[key] = _Flight(task, identity)
+
+        def _done(finished: asyncio.Task) -> None:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            if not finished.cancelled():
+                # 没有等待方时也读取一次异常，避免 "exception was never retrieved" 警告
+                finished.exception()
+
+        task.add_done_callback(_done)
+        return flight
+
+    @staticmethod
+    async def _wait(flight: _Flight) -> Any:
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if not flight.task.done() and flight.waiters == 1:
+                # 最后一个等待方取消，上游请求不再需要
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        endpoints = {}
+        for name, stats in self._stats.items():
+            requests = stats["requests"]
+            endpoints[name] = {
+                **stats,
+                "coalescedRate": round(stats["coalesced"] / requests, 3) if requests else 0,
+            }
+        return {
+            "enabled": self.enabled,
+            "inflight": len(self._flights),
+            "endpoints": endpoints,
+        }
+
+
+# 全局实例（进程内共享）
+request_coalescer = RequestCoalescer(enabled=settings.REQUEST_COALESCING_ENABLED)
@@ -0,0 +1,119 @@
+"""
+请求时间预算模块
+调用方通过 deadlineMs 指定整个请求的时间预算，预算在请求上下文中传递给所有上游请求、延迟与飞书写入：
+
+- 预算末尾预留一段时间用于写入飞书，其余时间用于采集
+- 上游请求的超时不超过剩余采集时间，笔记之间的延迟随剩余时间缩短
+- 剩余时间不足以再采集一条笔记时停止采集；到达采集截止时间时取消进行中的请求
+- 接口返回并写入已采集的记录，标记为部分结果（partial）
+"""
+import asyncio
+import time
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Optional
+
+from app.core.config import settings
+
+
+# 延迟最多占用剩余采集时间的比例
+DELAY_BUDGET_SHARE = 0.25
+
+
+class DeadlineExceeded(Exception):
+    """请求时间预算已用完"""
+
+
+class RequestDeadline:
+    """单个请求的时间预算（未设置 deadlineMs 时不限制）"""
+
+    def __init__(self, deadline_ms: Optional[int] = None, write_reserve: Optional[float] = None):
+        if write_reserve is None:
+            write_reserve = settings.DEADLINE_WRITE_RESERVE
+        self.limited = bool(deadline_ms)
+        self.partial = False
+        self.reason = ""
+        if self.limited:
+            budget = deadline_ms / 1000
+            now = time.monotonic()
+            self.deadline_at = now + budget
+            # 写入预留时间最多占预算的四分之一
+            self.collect_at = self.deadline_at - min(write_reserve, budget / 4)
+        else:
+            self.deadline_at = self.collect_at = float("inf")
+
+    def remaining(self) -> float:
+        """剩余采集时间（秒）"""
+        return max(0.0, self.collect_at - time.monotonic())
+
+    def write_remaining(self) -> float:
+        """距整个请求截止的剩余时间（秒）"""
+        return max(0.0, self.deadline_at - time.monotonic())
+
+    def allows(self, seconds: float) -> bool:
+        """剩余采集时间是否还够 seconds 秒"""
+        return not self.limited or self.remaining() > seconds
+
+    def write_allows(self, seconds: float) -> bool:
+        """距整个请求截止的剩余时间是否还够 seconds 秒"""
+        return not self.limited or self.write_remaining() > seconds
+
+    def timeout(self, default: float, minimum: float = 1.0) -> float:
+        """上游请求超时：不超过剩余采集时间（至少 minimum 秒）"""
+        if not self.limited:
+            return default
+        return min(default, max(minimum, self.remaining()))
+
+    def write_timeout(self, default: float, minimum: float = 1.0) -> float:
+        """飞书写入超时：不超过整个请求的剩余时间（至少 minimum 秒）"""
+        if not self.limited:
+            return default
+        return min(default, max(minimum, self.write_remaining()))
+
+    def cap_delay(self, delay: float) -> float:
+        """延迟随剩余时间缩短"""
+        if not self.limited:
+            return delay
+        return min(delay, self.remaining() * DELAY_BUDGET_SHARE)
+
+    def mark_partial(self, reason: str) -> None:
+        if self.limited and not self.partial:
+            self.partial = True
+            self.reason = reason
+            print(f"[时间预算] {reason}，返回部分结果")
+
+    def _start(self, work: Awaitable[Any]) -> asyncio.Future:
+        # 在带有本预算的上下文中启动任务，work 内的所有请求、延迟与写入都能读到剩余时间
+        token = _current_deadline.set(self)
+        try:
+            return asyncio.ensure_future(work)
+        finally:
+            _current_deadline.reset(token)
+
+    async def run(self, work: Awaitable[Any]) -> Any:
+        """在本预算下执行 work（用于飞书写入，不在到期时取消）"""
+        if not self.limited:
+            return await work
+        return await self._start(work)
+
+    async def guard(self, work: Awaitable[Any], fallback: Callable[[], Any]) -> Any:
+        """
+        在剩余采集时间内执行 work，到期时取消并返回 fallback()（已采集的部分结果）
+        """
+        if not self.limited:
+            return await work
+        try:
+            return await asyncio.wait_for(self._start(work), timeout=self.remaining())
+        except (asyncio.TimeoutError, DeadlineExceeded):
+            self.mark_partial("采集时间预算已用完")
+            return fallback()
+
+
+# 未设置时间预算的请求共用的实例
+_UNLIMITED = RequestDeadline()
+
+# 当前请求的时间预算
+_current_deadline: ContextVar[RequestDeadline] = ContextVar("request_deadline", default=_UNLIMITED)
+
+
+def current_deadline() -> RequestDeadline:
+    return _current_deadline.get()
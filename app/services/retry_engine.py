@@ -0,0 +1,148 @@
+"""
+采集失败重试模块
+按错误类型决定单条笔记 / 视频详情请求的处理方式：
+
+- 签名失败（406）、抖音空响应：签名随每次请求重新生成（新的时间戳），短暂等待后重试
+- xsec_token 失效（参数无效、详情页无笔记数据）：从笔记详情页重新获取 xsec_token 后重试（每条笔记一次）
+- 超时、网络错误、5xx、限流：指数退避后重试
+- Cookie 失效、账号熔断：不再重试，终止整个任务
+- 其他错误（笔记已删除等）、请求时间预算用完：不重试
+
+重试后仍因临时错误失败的笔记，由采集循环在全部笔记处理完后统一再重试一轮
+"""
+import asyncio
+import json
+import random
+import re
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import httpx
+
+from app.core.config import settings
+from app.services.cookie_rate import CookieCircuitOpenError, CookieInvalidError
+from app.services.request_deadline import DeadlineExceeded, current_deadline
+
+
+ACTION_RESIGN = "resign"
+ACTION_REFRESH_TOKEN = "refresh_token"
+ACTION_BACKOFF = "backoff"
+ACTION_ABORT = "abort"
+ACTION_FATAL = "fatal"
+
+# 可延后重试的错误类型
+DEFERRABLE_ACTIONS = {ACTION_RESIGN, ACTION_REFRESH_TOKEN, ACTION_BACKOFF}
+
+COOKIE_INVALID_MARKERS = ("Cookie 已失效", "account blocked", "用户未登录")
+TOKEN_INVALID_MARKERS = ("参数无效", "未找到笔记数据")
+BACKOFF_PATTERN = re.compile(r"HTTP (5\d\d|429|461|471)")
+
+
+class RetryEngine:
+    """按错误类型重试"""
+
+    def __init__(self, max_attempts: int = 3, backoff_base: float = 1.0, backoff_max: float = 8.0):
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._stats = {
+            "errors": {action: 0 for action in (
+                ACTION_RESIGN, ACTION_REFRESH_TOKEN, ACTION_BACKOFF, ACTION_ABORT, ACTION_FATAL
+            )},
+            "retries": 0,
+            "recovered": 0,
+            "deferred": 0,
+            "deferredRecovered": 0,
+        }
+
+    def classify(self, error: BaseException) -> str:
+        """判断错误类型"""
+        if isinstance(error, (CookieInvalidError, CookieCircuitOpenError)):
+            return ACTION_ABORT
+        if isinstance(error, DeadlineExceeded):
+            return ACTION_FATAL
+        message = str(error)
+        if any(marker in message for marker in COOKIE_INVALID_MARKERS):
+            return ACTION_ABORT
+        if isinstance(error, httpx.TransportError):
+            return ACTION_BACKOFF
+        if isinstance(error, json.JSONDecodeError) or "(406)" in message or "HTTP 406" in message:
+            # 406 / 200 空响应：签名被拒绝
+            return ACTION_RESIGN
+        if any(marker in message for marker in TOKEN_INVALID_MARKERS):
+            return ACTION_REFRESH_TOKEN
+        if BACKOFF_PATTERN.search(message) or "Cookie 可能已失效" in message:
+            # 验证页 / 登录跳转可能是临时风控，稍后再试
+            return ACTION_BACKOFF
+        return ACTION_FATAL
+
+    def deferrable(self, error: BaseException) -> bool:
+        """重试后仍失败时，是否值得在任务末尾再试一轮"""
+        return self.classify(error) in DEFERRABLE_ACTIONS
+
+    def _backoff(self, attempt: int) -> float:
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    async def run(
+        self,
+        work: Callable[[], Awaitable[Any]],
+        refresh_token: Optional[Callable[[], Awaitable[None]]] = None,
+        max_attempts: Optional[int] = None
+    ) -> Any:
+        """
+        执行 work，失败时按错误类型重试
+
+        Args:
+            work: 发起请求的函数（每次重试重新调用，签名随之重新生成）
+            refresh_token: 刷新 xsec_token 的函数，未提供时 token 失效不重试
+            max_attempts: 本次最多尝试次数，默认使用全局配置
+        """
+        max_attempts = max_attempts or self.max_attempts
+        refreshed = False
+        for attempt in range(1, max_attempts + 1):
+            try:
+                result = await work()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                action = self.classify(e)
+                self._stats["errors"][action] += 1
+                if action in (ACTION_ABORT, ACTION_FATAL) or attempt >= max_attempts:
+                    raise
+                if action == ACTION_REFRESH_TOKEN:
+                    if refresh_token is None or refreshed:
+                        raise
+                    await refresh_token()
+                    refreshed = True
+                else:
+                    delay = random.uniform(0.5, 1.5) if action == ACTION_RESIGN else self._backoff(attempt)
+                    if not current_deadline().allows(delay):
+                        # 剩余时间预算不够等待后重试
+                        raise
+                    await asyncio.sleep(delay)
+                self._stats["retries"] += 1
+                continue
+
+            if attempt > 1:
+                self._stats["recovered"] += 1
+            return result
+
+    def record_deferred(self, recovered: bool = False) -> None:
+        """记录延后重试（由采集循环调用）"""
+        self._stats["deferredRecovered" if recovered else "deferred"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "maxAttempts": self.max_attempts,
+            "backoffBase": self.backoff_base,
+            "backoffMax": self.backoff_max,
+        }
+
+
+# 全局实例（进程内共享）
+retry_engine = RetryEngine(
+    max_attempts=settings.RETRY_MAX_ATTEMPTS,
+    backoff_base=settings.RETRY_BACKOFF_BASE,
+    backoff_max=settings.RETRY_BACKOFF_MAX,
+)
@@ -0,0 +1,297 @@
+"""
+签名 API Key
+Key 内嵌 Key ID、过期时间与套餐限制，由服务端密钥签名，验证时只需本地校验签名，无需查询飞书
+
+格式: sk1.<载荷 base64url>.<签名 base64url>
+载荷: {"kid": Key ID, "exp": 过期时间戳（秒，0 为不过期）, "lim": 套餐限制（如 {"maxNotes": 20, "concurrency": 2}）}
+
+签名算法:
+- hs256: HMAC-SHA256，签发与验证使用同一密钥（APIKEY_SIGNING_SECRET）
+- ed25519: 私钥签发、公钥验证（APIKEY_SIGNING_PUBLIC_KEY，依赖 cryptography）
+
+吊销仍以飞书 API Key 管理表为准：后台定时读取管理表，状态为已冻结 / 已过期的 Key ID 进入吊销列表
+"""
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import time
+from typing import Any, Dict, Optional, Set
+
+from app.core.config import settings
+
+
+SIGNED_KEY_PREFIX = "sk1"
+
+ALG_HS256 = "hs256"
+ALG_ED25519 = "ed25519"
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def is_signed_key(api_key: str) -> bool:
+    return api_key.startswith(SIGNED_KEY_PREFIX + ".")
+
+
+class SignedKeyClaims:
+    """签名 Key 的载荷"""
+
+    def __init__(self, key_id: str, expires_at: int = 0, limits: Optional[Dict[str, Any]] = None):
+        self.key_id = key_id
+        self.expires_at = expires_at
+        self.limits = limits or {}
+
+    @property
+    def expired(self) -> bool:
+        return bool(self.expires_at) and self.expires_at <= time.time()
+
+
+class SignedKeyVerifier:
+    """签名 Key 签发与本地验证"""
+
+    def __init__(self, alg: str = ALG_HS256, secret: str = "", public_key: str = ""):
+        self.alg = alg
+        self.secret = secret.encode("utf-8")
+        self._public_key = None
+        if alg == ALG_ED25519 and public_key:
+            self._public_key = self._load_public_key(public_key)
+
+    @property
+    def configured(self) -> bool:
+        if self.alg == ALG_ED25519:
+            return self._public_key is not None
+        return bool(self.secret)
+
+    @staticmethod
+    def _load_public_key(public_key: str):
+        try:
+            from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PublicKey
+        except ImportError:
+            raise Exception("ed25519 签名 Key 需要安装 cryptography")
+        return Ed25519PublicKey.from_public_bytes(_b64decode(public_key))
+
+    def _sign(self, message: bytes, private_key: Optional[str] = None) -> bytes:
+        if self.alg == ALG_ED25519:
+            if not private_key:
+                raise ValueError("ed25519 签发需要私钥")
+            from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+            return Ed25519PrivateKey.from_private_bytes(_b64decode(private_key)).sign(message)
+        return hmac.new(self.secret, message, hashlib.sha256).digest()
+
+    def _check_signature(self, message: bytes, signature: bytes) -> bool:
+        if self.alg == ALG_ED25519:
+            from cryptography.exceptions import InvalidSignature
+            try:
+                self._public_key.verify(signature, message)
+                return True
+            except InvalidSignature:
+                return False
+        expected = hmac.new(self.secret, message, hashlib.sha256).digest()
+        return hmac.compare_digest(expected, signature)
+
+    def issue(
+        self,
+        key_id: str,
+        expires_at: int = 0,
+        limits: Optional[Dict[str, Any]] = None,
+        private_key: Optional[str] = None
+    ) -> str:
+        """签发签名 Key"""
+        if not key_id:
+            raise ValueError("Key ID 不能为空")
+        payload = {"kid": key_id, "exp": int(expires_at), "lim": limits or {}}
+        body = _b64encode(json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8"))
+        message = f"{SIGNED_KEY_PREFIX}.{body}".encode("ascii")
+        return f"{SIGNED_KEY_PREFIX}.{body}.{_b64encode(self._sign(message, private_key))}"
+
+    def verify(self, api_key: str) -> Optional[SignedKeyClaims]:
+        """校验签名，成功返回载荷，格式或签名不正确返回 None（不检查过期与吊销）"""
+        parts = api_key.split(".")
+        if len(parts) != 3 or parts[0] != SIGNED_KEY_PREFIX or not self.configured:
+            return None
+        try:
+            signature = _b64decode(parts[2])
+            message = f"{parts[0]}.{parts[1]}".encode("ascii")
+            if not self._check_signature(message, signature):
+                return None
+            payload = json.loads(_b64decode(parts[1]))
+            return SignedKeyClaims(
+                key_id=str(payload["kid"]),
+                expires_at=int(payload.get("exp") or 0),
+                limits=payload.get("lim") or {},
+            )
+        except (ValueError, KeyError, TypeError, UnicodeEncodeError):
+            return None
+
+
+# 吊销列表失效时按需同步失败后，至少间隔该秒数再重试
+SYNC_RETRY_SECONDS = 5.0
+
+
+class RevocationList:
+    """
+    签名 Key 吊销列表
+
+    定时从飞书 API Key 管理表同步：记录 Key ID → 记录 ID 的映射（用于回写使用次数），
+    状态为已冻结 / 已过期的 Key ID 视为已吊销，管理表中不存在的 Key ID 不可用。
+    同步失败时保留上次结果，但超过 max_staleness 秒未同步成功时列表视为失效，签名 Key 验证失败
+    """
+
+    def __init__(self, verifier: SignedKeyVerifier, sync_interval: float = 60.0, max_staleness: float = 300.0):
+        self.verifier = verifier
+        self.sync_interval = sync_interval
+        self.max_staleness = max_staleness
+        self.revoked: Set[str] = set()
+        self.record_ids: Dict[str, str] = {}
+        self.usage_counts: Dict[str, int] = {}
+        self.synced_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self._syncing: Optional[asyncio.Task] = None
+        self._attempted_at = 0.0
+        self._stats = {"syncs": 0, "syncErrors": 0}
+
+    def is_revoked(self, key_id: str) -> bool:
+        return key_id in self.revoked
+
+    def is_known(self, key_id: str) -> bool:
+        """Key ID 是否在管理表中有记录"""
+        return key_id in self.record_ids
+
+    @property
+    def fresh(self) -> bool:
+        """最近一次成功同步是否在 max_staleness 秒内"""
+        return self.synced_at is not None and time.time() - self.synced_at <= self.max_staleness
+
+    async def ensure_fresh(self) -> bool:
+        """列表失效时立即同步一次（并发调用合并为一次），返回同步后是否可用"""
+        if self.fresh:
+            return True
+        if self._syncing is None or self._syncing.done():
+            if time.time() - self._attempted_at < SYNC_RETRY_SECONDS:
+                # 刚同步失败过，避免每个请求都去请求管理表
+                return False
+            self._syncing = asyncio.ensure_future(self._sync_logged())
+        await asyncio.shield(self._syncing)
+        return self.fresh
+
+    async def _sync_logged(self) -> None:
+        self._attempted_at = time.time()
+        try:
+            await self.sync()
+        except Exception as e:
+            self._stats["syncErrors"] += 1
+            print(f"[签名 API Key] 同步吊销列表失败: {e}")
+
+    async def sync(self) -> None:
+        from app.services.apikey_validator import (
+            FIELD_API_KEY, FIELD_STATUS, FIELD_USAGE_COUNT, STATUS_EXPIRED, STATUS_FROZEN,
+        )
+        from app.services.feishu_auth import apikey_auth
+        from app.services.feishu_reader import FeishuReader, cell_text
+
+        revoked: Set[str] = set()
+        record_ids: Dict[str, str] = {}
+        usage_counts: Dict[str, int] = {}
+        reader = FeishuReader(settings.FEISHU_APIKEY_APP_TOKEN, settings.FEISHU_APIKEY_TABLE_ID, auth=apikey_auth)
+
+        self._stats["syncs"] += 1
+        async for items in reader.iter_pages(page_size=500):
+            for item in items:
+                fields = item.get("fields") or {}
+                api_key = cell_text(fields.get(FIELD_API_KEY))
+                claims = self.verifier.verify(api_key) if is_signed_key(api_key) else None
+                if not claims:
+                    continue
+                record_ids[claims.key_id] = item["record_id"]
+                try:
+                    usage_counts[claims.key_id] = int(float(cell_text(fields.get(FIELD_USAGE_COUNT)) or 0))
+                except ValueError:
+                    usage_counts[claims.key_id] = 0
+                if cell_text(fields.get(FIELD_STATUS)) in (STATUS_FROZEN, STATUS_EXPIRED):
+                    revoked.add(claims.key_id)
+
+        self.revoked, self.record_ids, self.usage_counts = revoked, record_ids, usage_counts
+        self.synced_at = time.time()
+
+    async def _loop(self) -> None:
+        while True:
+            await self._sync_logged()
+            await asyncio.sleep(self.sync_interval)
+
+    def start(self) -> None:
+        """启动后台同步（需在事件循环中调用）"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "keys": len(self.record_ids),
+            "revoked": len(self.revoked),
+            "syncedAt": int(self.synced_at) if self.synced_at else None,
+            "fresh": self.fresh,
+            "syncInterval": self.sync_interval,
+            "maxStaleness": self.max_staleness,
+        }
+
+
+def _build_verifier() -> SignedKeyVerifier:
+    try:
+        return SignedKeyVerifier(
+            alg=settings.APIKEY_SIGNING_ALG,
+            secret=settings.APIKEY_SIGNING_SECRET,
+            public_key=settings.APIKEY_SIGNING_PUBLIC_KEY,
+        )
+    except Exception as e:
+        print(f"[签名 API Key] 未启用: {e}")
+        return SignedKeyVerifier(alg=settings.APIKEY_SIGNING_ALG)
+
+
+# 全局实例（未配置签名密钥时签名 Key 不可用，仍按飞书表格验证）
+signed_key_verifier = _build_verifier()
+revocation_list = RevocationList(
+    signed_key_verifier,
+    sync_interval=settings.APIKEY_REVOCATION_SYNC_INTERVAL,
+    max_staleness=settings.APIKEY_REVOCATION_MAX_STALENESS,
+)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="签发签名 API Key")
+    parser.add_argument("key_id", help="Key ID（需与管理表中的记录对应）")
+    parser.add_argument("--days", type=int, default=0, help="有效天数，0 为不过期")
+    parser.add_argument("--max-notes", type=int, default=None, help="单次最大采集数量限制")
+    parser.add_argument("--concurrency", type=int, default=None, help="并发上限")
+    parser.add_argument("--rate", type=int, default=None, help="每分钟请求数")
+    parser.add_argument("--private-key", default="", help="ed25519 私钥（base64url）")
+    args = parser.parse_args()
+
+    limits = {
+        name: value
+        for name, value in (
+            ("maxNotes", args.max_notes),
+            ("concurrency", args.concurrency),
+            ("ratePerMinute", args.rate),
+        )
+        if value
+    }
+    expires_at = int(time.time()) + args.days * 86400 if args.days else 0
+    print(signed_key_verifier.issue(args.key_id, expires_at, limits, private_key=args.private_key or None))
@@ -0,0 +1,431 @@
+"""
+采集结果输出模块
+将采集记录逐条输出到一个或多个目标（JSONL / CSV / Parquet 文件、飞书表格），
+各目标按批次刷写，内存中只保留一个批次的记录
+"""
+import asyncio
+import csv
+import json
+import os
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from app.core.config import settings
+from app.models.schemas import NOTE_RECORD_FIELDS, NoteRecord, SinkSpec
+
+
+def _record_fields(record: Any) -> Dict[str, Any]:
+    if isinstance(record, NoteRecord):
+        return record.fields
+    if isinstance(record, dict):
+        return record.get("fields", record)
+    return {}
+
+
+def _flatten_value(value: Any) -> Any:
+    """文件输出时将链接、列表等结构化字段转为文本"""
+    if isinstance(value, dict):
+        return value.get("link") or value.get("text") or json.dumps(value, ensure_ascii=False)
+    if isinstance(value, list):
+        return "\n".join(str(_flatten_value(v)) for v in value)
+    return value
+
+
+def resolve_output_path(file_name: str) -> str:
+    """
+    输出文件统一写入 SINK_OUTPUT_DIR，文件名不允许包含目录
+
+    文件以独占方式创建（见 FileSink / ParquetSink），已存在的文件不会被覆盖
+    """
+    if not file_name or os.path.basename(file_name) != file_name or file_name.startswith("."):
+        raise ValueError(f"输出文件名不合法: {file_name}")
+    os.makedirs(settings.SINK_OUTPUT_DIR, exist_ok=True)
+    return os.path.join(settings.SINK_OUTPUT_DIR, file_name)
+
+
+def _create_exclusive(path: str, binary: bool = False, **kwargs):
+    """独占创建输出文件，文件已存在时报错（避免覆盖其他任务的输出）"""
+    try:
+        return open(path, "xb" if binary else "x", **kwargs)
+    except FileExistsError:
+        raise Exception(f"输出文件已存在: {os.path.basename(path)}")
+
+
+class RecordSink:
+    """
+    输出目标基类
+
+    子类实现 _flush（写出一个批次）与可选的 _open / _close，
+    write 逐条接收记录，攒满 flush_size 条后刷写
+    """
+
+    name = "sink"
+
+    def __init__(self, flush_size: int = 100):
+        self.flush_size = flush_size
+        self.count = 0
+        self.error: Optional[str] = None
+        self._buffer: List[Dict[str, Any]] = []
+
+    async def open(self) -> None:
+        await self._open()
+
+    async def write(self, record: Any) -> None:
+        self._buffer.append(_record_fields(record))
+        if len(self._buffer) >= self.flush_size:
+            await self.flush()
+
+    async def flush(self) -> None:
+        if not self._buffer:
+            return
+        batch, self._buffer = self._buffer, []
+        await self._flush(batch)
+        self.count += len(batch)
+
+    async def close(self) -> Dict[str, Any]:
+        try:
+            await self.flush()
+        finally:
+            await self._close()
+        return self.summary()
+
+    def summary(self) -> Dict[str, Any]:
+        return {"type": self.name, "count": self.count, "error": self.error}
+
+    async def _open(self) -> None:
+        pass
+
+    async def _flush(self, batch: List[Dict[str, Any]]) -> None:
+        raise NotImplementedError
+
+    async def _close(self) -> None:
+        pass
+
+
+class FileSink(RecordSink):
+    """文件输出基类（文件读写在线程池中执行）"""
+
+    def __init__(self, path: str, flush_size: int = 100):
+        super().__init__(flush_size)
+        self.path = path
+        self._file = None
+
+    async def _open(self) -> None:
+        self._file = await asyncio.to_thread(self._open_file)
+
+    def _open_file(self):
+        return _create_exclusive(self.path, encoding="utf-8", newline="")
+
+    async def _flush(self, batch: List[Dict[str, Any]]) -> None:
+        await asyncio.to_thread(self._write_batch, batch)
+
+    def _write_batch(self, batch: List[Dict[str, Any]]) -> None:
+        raise NotImplementedError
+
+    async def _close(self) -> None:
+        if self._file:
+            await asyncio.to_thread(self._file.close)
+            self._file = None
+
+    def summary(self) -> Dict[str, Any]:
+        return {**super().summary(), "path": self.path}
+
+
+class JsonlSink(FileSink):
+    """JSON Lines 输出，每行一条记录"""
+
+    name = "jsonl"
+
+    def _write_batch(self, batch: List[Dict[str, Any]]) -> None:
+        for fields in batch:
+            self._file.write(json.dumps(fields, ensure_ascii=False, default=str))
+            self._file.write("\n")
+        self._file.flush()
+
+
+class CsvSink(FileSink):
+    """CSV 输出（标准笔记字段在前，其余字段按首批记录出现顺序追加）"""
+
+    name = "csv"
+
+    def __init__(self, path: str, flush_size: int = 100):
+        super().__init__(path, flush_size)
+        self._writer: Optional[csv.DictWriter] = None
+
+    def _open_file(self):
+        # 带 BOM，便于 Excel 直接打开
+        return _create_exclusive(self.path, encoding="utf-8-sig", newline="")
+
+    def _write_batch(self, batch: List[Dict[str, Any]]) -> None:
+        if self._writer is None:
+            columns = list(NOTE_RECORD_FIELDS)
+            for fields in batch:
+                columns.extend(key for key in fields if key not in columns)
+            self._writer = csv.DictWriter(self._file, fieldnames=columns, extrasaction="ignore")
+            self._writer.writeheader()
+        self._writer.writerows(
+            {key: _flatten_value(value) for key, value in fields.items()}
+            for fields in batch
+        )
+        self._file.flush()
+
+
+class ParquetSink(RecordSink):
+    """
+    Parquet 列式输出（依赖 pyarrow）
+
+    每攒满 row_group_size 条写出一个行组，列类型由首个行组推断：
+    全部为数值的列使用 int64 / float64，其余列使用字符串。
+    后续行组中与列类型不符的值写为空值、首个行组之后才出现的字段无法写入，
+    两者都在输出结果（summary）中报告
+    """
+
+    name = "parquet"
+
+    def __init__(self, path: str, row_group_size: int = 1000):
+        super().__init__(flush_size=row_group_size)
+        self.path = path
+        self._pa = None
+        self._pq = None
+        self._schema = None
+        self._writer = None
+        self._file = None
+        self._mismatched: Dict[str, int] = {}
+        self._dropped: List[str] = []
+
+    async def _open(self) -> None:
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise Exception("Parquet 输出需要安装 pyarrow")
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+        self._file = await asyncio.to_thread(_create_exclusive, self.path, True)
+
+    def _infer_schema(self, batch: List[Dict[str, Any]]):
+        pa = self._pa
+        columns = list(NOTE_RECORD_FIELDS)
+        for fields in batch:
+            columns.extend(key for key in fields if key not in columns)
+
+        schema_fields = []
+        for column in columns:
+            values = [_flatten_value(fields.get(column)) for fields in batch]
+            values = [v for v in values if v is not None and v != ""]
+            if values and all(isinstance(v, int) and not isinstance(v, bool) for v in values):
+                column_type = pa.int64()
+            elif values and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values):
+                column_type = pa.float64()
+            else:
+                column_type = pa.string()
+            schema_fields.append(pa.field(column, column_type))
+        return pa.schema(schema_fields)
+
+    def _coerce(self, column: str, value: Any, column_type) -> Any:
+        value = _flatten_value(value)
+        if value is None or value == "":
+            return None
+        pa = self._pa
+        if column_type == pa.string():
+            return str(value)
+        if isinstance(value, bool):
+            coerced = None
+        elif column_type == pa.int64():
+            coerced = value if isinstance(value, int) else (
+                int(value) if isinstance(value, float) and value.is_integer() else None
+            )
+        else:
+            coerced = float(value) if isinstance(value, (int, float)) else None
+        if coerced is None:
+            # 与首个行组推断的列类型不符，写为空值并计数
+            self._mismatched[column] = self._mismatched.get(column, 0) + 1
+        return coerced
+
+    def _write_batch(self, batch: List[Dict[str, Any]]) -> None:
+        if self._schema is None:
+            self._schema = self._infer_schema(batch)
+            self._writer = self._pq.ParquetWriter(self._file, self._schema)
+
+        known = set(self._schema.names)
+        for fields in batch:
+            self._dropped.extend(key for key in fields if key not in known and key not in self._dropped)
+
+        arrays = [
+            self._pa.array(
+                [self._coerce(field.name, fields.get(field.name), field.type) for fields in batch],
+                type=field.type
+            )
+            for field in self._schema
+        ]
+        self._writer.write_table(self._pa.Table.from_arrays(arrays, schema=self._schema))
+
+    async def _flush(self, batch: List[Dict[str, Any]]) -> None:
+        await asyncio.to_thread(self._write_batch, batch)
+
+    async def _close(self) -> None:
+        if self._writer is not None:
+            await asyncio.to_thread(self._writer.close)
+            self._writer = None
+        if self._file is not None:
+            await asyncio.to_thread(self._file.close)
+            self._file = None
+
+    def summary(self) -> Dict[str, Any]:
+        summary = {**super().summary(), "path": self.path}
+        if self._mismatched:
+            summary["mismatchedValues"] = dict(self._mismatched)
+        if self._dropped:
+            summary["droppedColumns"] = list(self._dropped)
+        return summary
+
+
+class FeishuSink(RecordSink):
+    """飞书表格输出（攒批写入，可选写入本地队列由后台合并）"""
+
+    name = "feishu"
+
+    def __init__(self, app_token: str, table_id: str, write_behind: bool = False, flush_size: int = 500):
+        super().__init__(flush_size)
+        self.app_token = app_token
+        self.table_id = table_id
+        self.write_behind = write_behind
+        self.queued = 0
+
+    async def _flush(self, batch: List[Dict[str, Any]]) -> None:
+        from app.services.feishu_write_queue import write_queue
+        from app.services.feishu_writer import write_to_feishu
+
+        records = [{"fields": fields} for fields in batch]
+        if self.write_behind:
+            self.queued += await write_queue.enqueue(self.app_token, self.table_id, records)
+            return
+
+        result = await write_to_feishu(self.app_token, self.table_id, records)
+        if not result.get("success"):
+            raise Exception(result.get("message", "写入飞书失败"))
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            **super().summary(),
+            "appToken": self.app_token,
+            "tableId": self.table_id,
+            "queued": self.queued,
+        }
+
+
+class FanoutSink:
+    """
+    多目标输出
+
+    每条记录并发写入所有目标；某个目标出错后记录错误并停止向其写入，不影响其他目标与采集流程
+    """
+
+    def __init__(self, sinks: List[RecordSink]):
+        self.sinks = sinks
+
+    async def _call(self, sink: RecordSink, method: str, *args) -> None:
+        if sink.error:
+            return
+        try:
+            await getattr(sink, method)(*args)
+        except Exception as e:
+            sink.error = str(e)
+            print(f"[输出] {sink.name} 写入失败: {e}")
+
+    async def open(self) -> None:
+        await asyncio.gather(*(self._call(sink, "open") for sink in self.sinks))
+
+    async def write(self, record: Any) -> None:
+        await asyncio.gather(*(self._call(sink, "write", record) for sink in self.sinks))
+
+    async def close(self) -> List[Dict[str, Any]]:
+        await asyncio.gather(*(self._call(sink, "close") for sink in self.sinks))
+        return [sink.summary() for sink in self.sinks]
+
+
+class GatedSink:
+    """
+    等待前置条件通过后才打开并写入的输出（如 API Key 验证与采集并发进行时）
+
+    gate 在条件不满足时抛出异常；条件未通过时不会创建任何输出文件或写入飞书
+    """
+
+    def __init__(self, sink: FanoutSink, gate: Callable[[], Awaitable[None]]):
+        self.sink = sink
+        self.gate = gate
+        self._opened = False
+        self._lock = asyncio.Lock()
+
+    async def _ensure_open(self) -> None:
+        if self._opened:
+            return
+        async with self._lock:
+            if not self._opened:
+                await self.gate()
+                await self.sink.open()
+                self._opened = True
+
+    async def write(self, record: Any) -> None:
+        await self._ensure_open()
+        await self.sink.write(record)
+
+    async def close(self) -> List[Dict[str, Any]]:
+        try:
+            await self._ensure_open()
+        except Exception:
+            return []
+        return await self.sink.close()
+
+
+def build_sink(specs: List[SinkSpec], job_name: str, write_behind: Optional[bool] = None) -> FanoutSink:
+    """
+    根据请求中的输出配置创建多目标输出
+
+    Args:
+        specs: 输出配置列表
+        job_name: 任务名（未指定文件名时用于生成文件名）
+        write_behind: 飞书输出是否写入本地队列，默认使用服务配置
+
+    Raises:
+        ValueError: 输出配置不合法
+    """
+    from app.services.xhs_collector import parse_feishu_table_url
+
+    if write_behind is None:
+        write_behind = settings.FEISHU_WRITE_BEHIND
+
+    # 自动生成的文件名带随机后缀，同一秒内的并发请求不会冲突
+    timestamp = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+    sinks: List[RecordSink] = []
+
+    for index, spec in enumerate(specs):
+        if spec.type == "feishu":
+            if not spec.tableUrl:
+                raise ValueError("feishu 输出缺少 tableUrl")
+            app_token, table_id = parse_feishu_table_url(spec.tableUrl)
+            sinks.append(FeishuSink(app_token, table_id, write_behind))
+            continue
+
+        file_name = spec.path or f"{job_name}-{timestamp}-{index}.{spec.type}"
+        path = resolve_output_path(file_name)
+        if spec.type == "jsonl":
+            sinks.append(JsonlSink(path, settings.SINK_FLUSH_SIZE))
+        elif spec.type == "csv":
+            sinks.append(CsvSink(path, settings.SINK_FLUSH_SIZE))
+        elif spec.type == "parquet":
+            sinks.append(ParquetSink(path, settings.SINK_PARQUET_ROW_GROUP))
+
+    return FanoutSink(sinks)
+
+
+def sink_message(results: List[Dict[str, Any]]) -> str:
+    """输出结果的消息后缀"""
+    parts = []
+    for result in results:
+        if result.get("error"):
+            parts.append(f"{result['type']} 输出失败: {result['error']}")
+        else:
+            parts.append(f"{result['type']} 输出 {result['count']} 条")
+    return f"，{'，'.join(parts)}" if parts else ""
@@ -0,0 +1,204 @@
+"""
+多数据源路由模块
+按操作记录各数据源（签名 API / 页面 HTML）在各账号下的成功率与耗时，优先选择表现最好的数据源
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.services.cookie_rate import CookieInvalidError
+
+
+class SourceStats:
+    """单个数据源的滚动统计"""
+
+    def __init__(self, window: int):
+        self._samples: Deque[Tuple[bool, float]] = deque(maxlen=window)
+
+    def record(self, ok: bool, latency: float) -> None:
+        self._samples.append((ok, latency))
+
+    @property
+    def count(self) -> int:
+        return len(self._samples)
+
+    @property
+    def success_rate(self) -> float:
+        """成功率（拉普拉斯平滑，无样本时为 0.5）"""
+        successes = sum(1 for ok, _ in self._samples if ok)
+        return (successes + 1) / (len(self._samples) + 2)
+
+    def latency_percentile(self, percentile: float) -> Optional[float]:
+        latencies = sorted(latency for ok, latency in self._samples if ok)
+        if not latencies:
+            return None
+        index = min(len(latencies) - 1, int(len(latencies) * percentile))
+        return latencies[index]
+
+    def to_dict(self) -> Dict[str, Any]:
+        p50 = self.latency_percentile(0.5)
+        p95 = self.latency_percentile(0.95)
+        return {
+            "samples": self.count,
+            "successRate": round(self.success_rate, 3),
+            "p50Ms": round(p50 * 1000) if p50 is not None else None,
+            "p95Ms": round(p95 * 1000) if p95 is not None else None,
+        }
+
+
+class SourceRouter:
+    """
+    数据源路由器
+
+    - 按 (操作, 数据源) 与 (操作, 数据源, 账号) 两个维度统计成功率与耗时
+    - 账号维度样本足够时按账号统计排序，否则按全局统计排序，样本不足时保持默认顺序
+    - 开启对冲时，首选数据源超过其 p95 耗时仍未返回，则并行启动次选数据源，取先成功者
+    """
+
+    def __init__(self, window: int = 50, min_samples: int = 5, hedge: bool = False, hedge_delay: float = 3.0):
+        self.window = window
+        self.min_samples = min_samples
+        self.hedge = hedge
+        self.hedge_delay = hedge_delay
+        self._stats: Dict[Tuple[str, ...], SourceStats] = {}
+
+    def _get_stats(self, *key: str) -> SourceStats:
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = SourceStats(self.window)
+            self._stats[key] = stats
+        return stats
+
+    def _effective_stats(self, op: str, path: str, identity: str) -> SourceStats:
+        identity_stats = self._stats.get((op, path, identity))
+        if identity_stats and identity_stats.count >= self.min_samples:
+            return identity_stats
+        return self._get_stats(op, path)
+
+    def record(self, op: str, path: str, identity: str, ok: bool, latency: float) -> None:
+        self._get_stats(op, path).record(ok, latency)
+        self._get_stats(op, path, identity).record(ok, latency)
+
+    def rank(self, op: str, paths: List[str], identity: str) -> List[str]:
+        """按成功率、耗时排序数据源（样本不足的数据源按 0.5 成功率计，并保持默认顺序）"""
+        def sort_key(item: Tuple[int, str]):
+            index, path = item
+            stats = self._effective_stats(op, path, identity)
+            if stats.count < self.min_samples:
+                return (-0.5, 0.0, index)
+            p50 = stats.latency_percentile(0.5)
+            return (-round(stats.success_rate, 1), p50 if p50 is not None else float("inf"), index)
+
+        return [path for _, path in sorted(enumerate(paths), key=sort_key)]
+
+    def _hedge_delay_for(self, op: str, path: str, identity: str) -> float:
+        p95 = self._effective_stats(op, path, identity).latency_percentile(0.95)
+        return p95 if p95 is not None else self.hedge_delay
+
+    async def _attempt(self, op: str, path: str, identity: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        started = time.monotonic()
+        try:
+            result = await factory()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.record(op, path, identity, False, time.monotonic() - started)
+            raise
+        self.record(op, path, identity, True, time.monotonic() - started)
+        return result
+
+    async def run(
+        self,
+        op: str,
+        identity: str,
+        sources: Dict[str, Callable[[], Awaitable[Any]]],
+        hedge: Optional[bool] = None,
+        fallback: bool = True,
+    ) -> Any:
+        """
+        按排序依次尝试数据源，返回第一个成功的结果；全部失败时抛出最后一个异常
+
+        Args:
+            op: 操作名（如 xhs_search / xhs_note_detail）
+            identity: 账号标识
+            sources: 数据源名 -> 无参协程工厂
+            hedge: 是否对冲，默认使用全局配置
+            fallback: 为 False 时只请求排序最前的数据源（外层已有重试时使用，避免请求数成倍增加）
+        """
+        order = self.rank(op, list(sources.keys()), identity)
+        if not fallback:
+            order = order[:1]
+        hedge = self.hedge if hedge is None else hedge
+
+        if hedge and len(order) > 1:
+            return await self._run_hedged(op, identity, order, sources)
+
+        last_error: Optional[BaseException] = None
+        for path in order:
+            try:
+                return await self._attempt(op, path, identity, sources[path])
+            except CookieInvalidError:
+                # Cookie 失效时其他数据源同样不可用
+                raise
+            except Exception as e:
+                last_error = e
+        raise last_error
+
+    async def _run_hedged(
+        self,
+        op: str,
+        identity: str,
+        order: List[str],
+        sources: Dict[str, Callable[[], Awaitable[Any]]],
+    ) -> Any:
+        primary, secondary = order[0], order[1]
+        tasks: Dict[asyncio.Task, str] = {
+            asyncio.ensure_future(self._attempt(op, primary, identity, sources[primary])): primary
+        }
+        last_error: Optional[BaseException] = None
+        remaining = list(order[1:])
+
+        try:
+            done, _ = await asyncio.wait(tasks.keys(), timeout=self._hedge_delay_for(op, primary, identity))
+            if not done:
+                remaining.remove(secondary)
+                tasks[asyncio.ensure_future(self._attempt(op, secondary, identity, sources[secondary]))] = secondary
+
+            while tasks:
+                done, _ = await asyncio.wait(tasks.keys(), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    tasks.pop(task)
+                    if task.exception() is None:
+                        return task.result()
+                    last_error = task.exception()
+                    if isinstance(last_error, CookieInvalidError):
+                        raise last_error
+
+                if not tasks and remaining:
+                    path = remaining.pop(0)
+                    tasks[asyncio.ensure_future(self._attempt(op, path, identity, sources[path]))] = path
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        raise last_error
+
+    def snapshot(self) -> Dict[str, Any]:
+        """导出各操作、数据源的全局统计"""
+        result: Dict[str, Dict[str, Any]] = {}
+        for key, stats in self._stats.items():
+            if len(key) != 2:
+                continue
+            op, path = key
+            result.setdefault(op, {})[path] = stats.to_dict()
+        return result
+
+
+# 全局路由实例（进程内共享）
+source_router = SourceRouter(
+    window=settings.SOURCE_ROUTER_WINDOW,
+    hedge=settings.SOURCE_ROUTER_HEDGE,
+    hedge_delay=settings.SOURCE_ROUTER_HEDGE_DELAY,
+)
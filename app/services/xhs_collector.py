@@ -3,17 +3,32 @@
 负责采集博主主页笔记数据
 """
 import asyncio
+import copy
 import random
 import re
 import json
+import time
 from urllib.parse import urlparse, parse_qs, quote, urlencode
 from typing import List, Dict, Any, Optional, Tuple
 
 import httpx
 
 from app.core.config import settings
-from app.models.schemas import NoteInfo, NoteRecord
+from app.models.schemas import CreatorSnapshot, NoteFilter, NoteInfo, NoteRecord, RecordCallback
+from app.services.cookie_identity import cookie_identity
+from app.services.cookie_rate import SIGNAL_ERROR, CookieInvalidError, cookie_rate_controller, json_payload
+from app.services.identity_scheduler import identity_scheduler
+from app.services.request_coalescer import request_coalescer
+from app.services.request_deadline import DeadlineExceeded, current_deadline
+from app.services.retry_engine import ACTION_ABORT, retry_engine
+from app.services.source_router import source_router
+from app.services.note_filter import NoteSelector, note_info_metrics, record_metrics
 from app.services.xhs_sign import generate_sign_headers, XhsSign
+from app.services.xhs_token_cache import token_cache
+
+
+# 博主主页快照缓存: (账号标识, 博主) -> (过期时间, 快照)
+_snapshot_cache: Dict[Tuple[str, str], Tuple[float, CreatorSnapshot]] = {}
 
 
 class XhsCollector:
@@ -22,21 +37,61 @@ class XhsCollector:
     def __init__(self, cookie: str, user_agent: Optional[str] = None):
         self.cookie = cookie
         self.user_agent = user_agent or settings.DEFAULT_USER_AGENT
+        self.identity = cookie_identity(cookie, "xhs")
+        # 列表阶段无法判断、详情返回后不符合筛选条件而丢弃的笔记数
+        self.filtered_count = 0
     
     async def _random_delay(self, min_sec: float, max_sec: float) -> float:
-        """随机延迟"""
-        delay = random.uniform(min_sec, max_sec)
+        """随机延迟（按账号当前健康状况缩放，随请求剩余时间预算缩短）"""
+        delay = random.uniform(min_sec, max_sec) * cookie_rate_controller.delay_factor(self.identity)
+        delay = current_deadline().cap_delay(delay)
         await asyncio.sleep(delay)
         return delay
+
+    async def _send(self, method: str, url: str, timeout: float = 30.0, **kwargs) -> httpx.Response:
+        """发起上游请求并向限速控制器报告结果（页面 HTML 等非 JSON 请求使用）"""
+        response, _ = await self._request(method, url, timeout, **kwargs)
+        return response
+
+    async def _request(self, method: str, url: str, timeout: float = 30.0, **kwargs) -> Tuple[httpx.Response, Any]:
+        """
+        发起上游请求并向限速控制器报告结果，返回 (响应, 已解析的 JSON 数据)
+
+        同一账号的请求先在账号调度器排队（与其他并发任务共享请求间隔），账号熔断中直接失败；
+        超时不超过请求剩余的时间预算。JSON 响应只解析一次，解析失败时数据为 None，
+        调用方再调用 response.json() 以得到原来的解析异常
+        """
+        deadline = current_deadline()
+        async with identity_scheduler.slot(self.identity):
+            if not deadline.allows(0):
+                raise DeadlineExceeded("请求时间预算已用完")
+            cookie_rate_controller.check(self.identity)
+            started = time.monotonic()
+            try:
+                async with httpx.AsyncClient(timeout=deadline.timeout(timeout)) as client:
+                    response = await client.request(method, url, **kwargs)
+            except httpx.TransportError as e:
+                cookie_rate_controller.record(self.identity, SIGNAL_ERROR, detail=type(e).__name__)
+                raise
+            except BaseException:
+                # 请求被取消或出现其他异常，没有结果可报告，释放可能占用的探测名额
+                cookie_rate_controller.release_probe(self.identity)
+                raise
+
+        payload = json_payload(response)
+        signal, detail = cookie_rate_controller.classify_response(response, payload)
+        cookie_rate_controller.record(self.identity, signal, time.monotonic() - started, detail)
+        return response, payload
     
     async def _get_smart_delay(self, index: int) -> float:
-        """智能延迟（根据笔记序号）"""
+        """智能延迟（根据笔记序号），同一账号有交互式请求时先让出账号"""
+        yielded = await identity_scheduler.yield_to_interactive(self.identity)
         if index < 5:
-            return await self._random_delay(*settings.DELAY_BETWEEN_NOTES_EARLY)
+            return yielded + await self._random_delay(*settings.DELAY_BETWEEN_NOTES_EARLY)
         elif index < 10:
-            return await self._random_delay(*settings.DELAY_BETWEEN_NOTES_MIDDLE)
+            return yielded + await self._random_delay(*settings.DELAY_BETWEEN_NOTES_MIDDLE)
         else:
-            return await self._random_delay(*settings.DELAY_BETWEEN_NOTES_LATE)
+            return yielded + await self._random_delay(*settings.DELAY_BETWEEN_NOTES_LATE)
 
     def _parse_initial_state(self, html_content: str) -> Dict[str, Any]:
         """解析页面中的 __INITIAL_STATE__"""
@@ -137,28 +192,59 @@ class XhsCollector:
         }
         return f"https://www.xiaohongshu.com/search_result?{urlencode(params)}"
 
+    def _parse_count(self, count: Any) -> int:
+        """解析计数值（支持 "1.2万" 等格式）"""
+        if isinstance(count, (int, float)):
+            return int(count)
+        if isinstance(count, str):
+            num_str = count.replace(",", "").strip()
+            if "万" in num_str:
+                try:
+                    return round(float(num_str.replace("万", "")) * 10000)
+                except ValueError:
+                    return 0
+            try:
+                return int(float(num_str))
+            except ValueError:
+                return 0
+        return 0
+
     def _parse_interaction_count(self, interactions: List[Dict[str, Any]], target_type: str) -> int:
         """解析博主互动数据中的计数值"""
         for item in interactions:
             if item.get("type") != target_type:
                 continue
-            count = item.get("count", 0)
-            if isinstance(count, (int, float)):
-                return int(count)
-            if isinstance(count, str):
-                num_str = count.replace(",", "").strip()
-                if "万" in num_str:
-                    try:
-                        return round(float(num_str.replace("万", "")) * 10000)
-                    except ValueError:
-                        return 0
-                try:
-                    return int(float(num_str))
-                except ValueError:
-                    return 0
-            return 0
+            return self._parse_count(item.get("count", 0))
         return 0
 
+    def _extract_list_metrics(self, note_card: Dict[str, Any]) -> Dict[str, Any]:
+        """提取列表项中的封面、互动数据与发布时间"""
+        interact_info = note_card.get("interact_info") or note_card.get("interactInfo") or {}
+        if not isinstance(interact_info, dict):
+            interact_info = {}
+
+        metrics: Dict[str, Any] = {
+            "coverUrl": self._extract_image_url(note_card.get("cover") or {}),
+        }
+
+        count_keys = {
+            "likedCount": ("liked_count", "likedCount"),
+            "collectedCount": ("collected_count", "collectedCount"),
+            "commentCount": ("comment_count", "commentCount"),
+            "shareCount": ("shared_count", "share_count", "sharedCount", "shareCount"),
+        }
+        for field, keys in count_keys.items():
+            for key in keys:
+                if interact_info.get(key) not in (None, ""):
+                    metrics[field] = self._parse_count(interact_info.get(key))
+                    break
+
+        publish_time = note_card.get("time") or note_card.get("publish_time")
+        if isinstance(publish_time, (int, float)) and publish_time > 0:
+            metrics["publishTime"] = int(publish_time)
+
+        return metrics
+
     def _extract_image_url(self, image_info: Dict[str, Any]) -> str:
         """提取图片链接"""
         if not isinstance(image_info, dict):
@@ -221,27 +307,123 @@ class XhsCollector:
             return ""
         return self._find_first_url(video_info)
 
-    async def fetch_notes_via_api(self, profile_url: str, max_notes: int = 20) -> List[NoteInfo]:
+    async def fetch_notes_via_api(
+        self,
+        profile_url: str,
+        max_notes: int = 20,
+        note_filter: Optional[NoteFilter] = None,
+        snapshot: Optional[CreatorSnapshot] = None
+    ) -> List[NoteInfo]:
         """
         通过 API 获取博主笔记列表（推荐方式）
         
         Args:
             profile_url: 博主主页链接
             max_notes: 最大笔记数量
+            note_filter: 筛选条件（在列表阶段执行，必要时继续翻页）
+            snapshot: 主页快照，提供时首页笔记直接取自快照，仅后续页请求 user_posted
             
         Returns:
             笔记信息列表
         """
         user_id = self._extract_user_id_from_url(profile_url)
+        selector = NoteSelector(note_filter, max_notes)
+        user_home_page = f"https://www.xiaohongshu.com/user/profile/{user_id}"
+        cursor = ""
         
-        # 请求前延迟
-        await self._random_delay(*settings.DELAY_BEFORE_HOME)
+        if snapshot and snapshot.notes:
+            for note_info in snapshot.notes:
+                selector.offer(note_info, note_info_metrics(note_info))
+            if selector.done or not snapshot.hasMore or not snapshot.cursor:
+                return selector.results()
+            cursor = snapshot.cursor
+            # 翻页间隔
+            await self._random_delay(0.4, 1.2)
+        else:
+            # 请求前延迟
+            await self._random_delay(*settings.DELAY_BEFORE_HOME)
+        
+        while True:
+            page_data = await self._fetch_user_posted_page(user_id, cursor, min(max_notes, 30))
+            notes_data = page_data.get("notes", [])
+            
+            if not notes_data and not cursor:
+                raise Exception("该博主暂无笔记数据")
+            
+            page_notes = []
+            for note in notes_data:
+                note_info = NoteInfo(
+                    noteId=note.get("note_id", ""),
+                    xsecToken=note.get("xsec_token", ""),
+                    displayTitle=note.get("display_title", ""),
+                    type=note.get("type", ""),
+                    userNickname=note.get("user", {}).get("nickname", ""),
+                    userId=note.get("user", {}).get("user_id", user_id),
+                    userAvatar=note.get("user", {}).get("avatar", ""),
+                    userHomePage=user_home_page,
+                    **self._extract_list_metrics(note)
+                )
+                if note_info.noteId and note_info.xsecToken:
+                    page_notes.append(note_info)
+            
+            token_cache.put_many(page_notes)
+            for note_info in page_notes:
+                selector.offer(note_info, note_info_metrics(note_info))
+            
+            cursor = page_data.get("cursor") or ""
+            if selector.done or not notes_data or not cursor or not page_data.get("has_more"):
+                break
+            
+            # 翻页间隔
+            await self._random_delay(0.4, 1.2)
         
+        return selector.results()
+
+    async def check_login(self) -> Tuple[bool, str]:
+        """
+        检查 Cookie 是否处于登录状态（请求 user/me，一次签名请求）
+
+        Returns:
+            (是否有效, 说明)
+        """
+        api_url = "https://edith.xiaohongshu.com/api/sns/web/v2/user/me"
+        try:
+            sign_headers = XhsSign().sign_headers_get(api_url, self.cookie)
+        except ValueError:
+            return False, "Cookie 缺少 a1"
+
+        headers = {
+            "Accept": "application/json, text/plain, */*",
+            "Cookie": self.cookie,
+            "Origin": "https://www.xiaohongshu.com",
+            "Referer": "https://www.xiaohongshu.com/",
+            "User-Agent": self.user_agent,
+        }
+        headers.update(sign_headers)
+
+        response, data = await self._request("GET", api_url, headers=headers, timeout=10.0)
+        if response.status_code != 200:
+            raise Exception(f"检查登录状态失败: HTTP {response.status_code}")
+
+        if data is None:
+            data = response.json()
+        if data.get("code") == -100:
+            return False, "Cookie 已失效"
+        if data.get("code") != 0:
+            raise Exception(f"检查登录状态失败: {data.get('msg', '未知错误')}")
+
+        user = data.get("data") or {}
+        if user.get("guest", True):
+            return False, "Cookie 未登录"
+        return True, f"已登录: {user.get('nickname', '')}"
+
+    async def _fetch_user_posted_page(self, user_id: str, cursor: str, num: int) -> Dict[str, Any]:
+        """请求一页 user_posted 数据"""
         signer = XhsSign()
         api_url = "https://edith.xiaohongshu.com/api/sns/web/v1/user_posted"
         params = {
-            "num": str(min(max_notes, 30)),
-            "cursor": "",
+            "num": str(num),
+            "cursor": cursor,
             "user_id": user_id,
             "image_formats": "jpg,webp,avif"
         }
@@ -268,45 +450,21 @@ class XhsCollector:
         query = "&".join(f"{k}={v}" for k, v in params.items())
         full_url = f"{api_url}?{query}"
         
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(full_url, headers=headers)
-            
-            if response.status_code != 200:
-                raise Exception(f"请求笔记列表 API 失败: HTTP {response.status_code}")
-            
+        response, data = await self._request("GET", full_url, headers=headers)
+        
+        if response.status_code != 200:
+            raise Exception(f"请求笔记列表 API 失败: HTTP {response.status_code}")
+        
+        if data is None:
             data = response.json()
-            
-            if data.get("code") == -100:
-                raise Exception("Cookie 已失效，请重新获取")
-            
-            if data.get("code") != 0:
-                raise Exception(f"API 返回错误: {data.get('msg', '未知错误')}")
-            
-            notes_data = data.get("data", {}).get("notes", [])
-            
-            if not notes_data:
-                raise Exception("该博主暂无笔记数据")
-            
-            # 构建用户主页链接
-            user_home_page = f"https://www.xiaohongshu.com/user/profile/{user_id}"
-            
-            # 提取笔记信息
-            note_list = []
-            for note in notes_data[:max_notes]:
-                note_info = NoteInfo(
-                    noteId=note.get("note_id", ""),
-                    xsecToken=note.get("xsec_token", ""),
-                    displayTitle=note.get("display_title", ""),
-                    type=note.get("type", ""),
-                    userNickname=note.get("user", {}).get("nickname", ""),
-                    userId=note.get("user", {}).get("user_id", user_id),
-                    userAvatar=note.get("user", {}).get("avatar", ""),
-                    userHomePage=user_home_page
-                )
-                if note_info.noteId and note_info.xsecToken:
-                    note_list.append(note_info)
-            
-            return note_list
+        
+        if data.get("code") == -100:
+            raise CookieInvalidError("Cookie 已失效，请重新获取")
+        
+        if data.get("code") != 0:
+            raise Exception(f"API 返回错误: {data.get('msg', '未知错误')}")
+        
+        return data.get("data", {}) or {}
 
     def _build_note_info_from_search_item(self, item: Dict[str, Any]) -> Optional[NoteInfo]:
         """从搜索结果中构造 NoteInfo"""
@@ -375,7 +533,8 @@ class XhsCollector:
             userNickname=user_nickname,
             userId=user_id,
             userAvatar=user_avatar,
-            userHomePage=user_home_page
+            userHomePage=user_home_page,
+            **self._extract_list_metrics(note_card)
         )
 
     async def search_notes_via_api(
@@ -424,33 +583,34 @@ class XhsCollector:
         }
         headers.update(sign_headers)
 
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(api_url, headers=headers, json=payload)
+        response, data = await self._request("POST", api_url, headers=headers, json=payload)
 
-            if response.status_code != 200:
-                raise Exception(f"搜索请求失败: HTTP {response.status_code}")
+        if response.status_code != 200:
+            raise Exception(f"搜索请求失败: HTTP {response.status_code}")
 
+        if data is None:
             data = response.json()
 
-            if data.get("code") == -100:
-                raise Exception("Cookie 已失效，请重新获取")
+        if data.get("code") == -100:
+            raise CookieInvalidError("Cookie 已失效，请重新获取")
 
-            if data.get("code") != 0:
-                raise Exception(f"搜索接口返回错误: {data.get('msg', '未知错误')}")
+        if data.get("code") != 0:
+            raise Exception(f"搜索接口返回错误: {data.get('msg', '未知错误')}")
 
-            result_data = data.get("data", {})
-            items = result_data.get("items") or result_data.get("notes") or []
+        result_data = data.get("data", {})
+        items = result_data.get("items") or result_data.get("notes") or []
 
-            note_list: List[NoteInfo] = []
-            for item in items:
-                note_info = self._build_note_info_from_search_item(item)
-                if note_info:
-                    note_list.append(note_info)
+        note_list: List[NoteInfo] = []
+        for item in items:
+            note_info = self._build_note_info_from_search_item(item)
+            if note_info:
+                note_list.append(note_info)
 
-            has_more = bool(result_data.get("has_more") or result_data.get("hasMore"))
-            new_search_id = result_data.get("search_id") or result_data.get("searchId") or search_id
+        has_more = bool(result_data.get("has_more") or result_data.get("hasMore"))
+        new_search_id = result_data.get("search_id") or result_data.get("searchId") or search_id
 
-            return note_list, has_more, new_search_id
+        token_cache.put_many(note_list)
+        return note_list, has_more, new_search_id
     
     async def fetch_homepage_html(self, profile_url: str) -> Tuple[str, str]:
         """
@@ -462,6 +622,18 @@ class XhsCollector:
         Returns:
             (html_content, clean_url)
         """
+        # 同一博主主页的并发请求只发起一次
+        clean_url = profile_url.strip().split("?")[0].strip()
+        try:
+            user_key = self._extract_user_id_from_url(clean_url)
+        except ValueError:
+            user_key = clean_url
+        return await request_coalescer.run(
+            "xhs", "homepage", user_key, self.identity,
+            lambda: self._fetch_homepage_html(profile_url)
+        )
+
+    async def _fetch_homepage_html(self, profile_url: str) -> Tuple[str, str]:
         # 清理 URL，但保留 xsec_token 参数
         profile_url = profile_url.strip()
         # 提取基础 URL（不含参数）用于后续笔记构建
@@ -482,13 +654,12 @@ class XhsCollector:
             "referer": "https://www.xiaohongshu.com/"
         }
         
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(request_url, headers=headers, follow_redirects=True)
-            
-            if response.status_code != 200:
-                raise Exception(f"请求主页失败: HTTP {response.status_code}")
-            
-            return response.text, clean_url
+        response = await self._send("GET", request_url, headers=headers, follow_redirects=True)
+        
+        if response.status_code != 200:
+            raise Exception(f"请求主页失败: HTTP {response.status_code}")
+        
+        return response.text, clean_url
 
     async def fetch_search_html(self, keyword: str) -> str:
         """获取搜索结果页 HTML"""
@@ -505,13 +676,12 @@ class XhsCollector:
             "referer": "https://www.xiaohongshu.com/"
         }
 
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(search_url, headers=headers, follow_redirects=True)
+        response = await self._send("GET", search_url, headers=headers, follow_redirects=True)
 
-            if response.status_code != 200:
-                raise Exception(f"请求搜索页失败: HTTP {response.status_code}")
+        if response.status_code != 200:
+            raise Exception(f"请求搜索页失败: HTTP {response.status_code}")
 
-            return response.text
+        return response.text
 
     async def fetch_note_html(self, note_url: str) -> str:
         """获取笔记详情页 HTML"""
@@ -527,47 +697,58 @@ class XhsCollector:
             "referer": "https://www.xiaohongshu.com/"
         }
 
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(note_url, headers=headers, follow_redirects=True)
+        response = await self._send("GET", note_url, headers=headers, follow_redirects=True)
 
-            if response.status_code != 200:
-                raise Exception(f"请求笔记详情页失败: HTTP {response.status_code}")
+        if response.status_code != 200:
+            raise Exception(f"请求笔记详情页失败: HTTP {response.status_code}")
 
-            return response.text
+        return response.text
 
     async def build_note_info_from_url(self, note_url: str) -> NoteInfo:
-        """从笔记链接构造 NoteInfo"""
+        """
+        从笔记链接构造 NoteInfo
+
+        链接自带 xsec_token 或缓存命中时不再请求详情页，
+        标题、类型、作者等展示字段由后续 feed 响应补齐
+        """
         note_id = self._extract_note_id_from_url(note_url)
         xsec_token = self._extract_xsec_token_from_url(note_url)
-        html_content = None
+        cached = token_cache.get(note_id)
 
-        if not xsec_token:
-            html_content = await self.fetch_note_html(note_url)
-            xsec_token = self._extract_xsec_token_from_html(html_content, note_id)
-        else:
-            try:
-                html_content = await self.fetch_note_html(note_url)
-            except Exception:
-                html_content = None
+        if xsec_token:
+            if cached:
+                return cached.copy(update={"xsecToken": xsec_token})
+            return NoteInfo(noteId=note_id, xsecToken=xsec_token)
+
+        if cached:
+            return cached
+
+        html_content = await self.fetch_note_html(note_url)
+        xsec_token = self._extract_xsec_token_from_html(html_content, note_id)
 
         if not xsec_token:
             raise ValueError("笔记链接缺少 xsec_token，请提供完整链接")
 
         extra_info: Dict[str, str] = {}
-        if html_content:
-            try:
-                extra_info = self._extract_note_info_from_html(html_content, note_id)
-            except Exception:
-                extra_info = {}
-        return NoteInfo(noteId=note_id, xsecToken=xsec_token, **extra_info)
+        try:
+            extra_info = self._extract_note_info_from_html(html_content, note_id)
+        except Exception:
+            extra_info = {}
+
+        note_info = NoteInfo(noteId=note_id, xsecToken=xsec_token, **extra_info)
+        token_cache.put(note_info)
+        return note_info
 
     async def _ensure_note_xsec_token(self, note_info: NoteInfo) -> NoteInfo:
         """确保 NoteInfo 包含 xsec_token"""
         if note_info.xsecToken:
             return note_info
 
-        note_url = f"https://www.xiaohongshu.com/explore/{note_info.noteId}"
-        fallback_info = await self.build_note_info_from_url(note_url)
+        fallback_info = token_cache.get(note_info.noteId)
+        if not fallback_info:
+            note_url = f"https://www.xiaohongshu.com/explore/{note_info.noteId}"
+            fallback_info = await self.build_note_info_from_url(note_url)
+
         updates = {"xsecToken": fallback_info.xsecToken}
         for field in ("displayTitle", "type", "userNickname", "userId", "userAvatar", "userHomePage"):
             value = getattr(fallback_info, field, "")
@@ -575,6 +756,56 @@ class XhsCollector:
                 updates[field] = value
         return note_info.copy(update=updates)
 
+    async def fetch_creator_snapshot(self, profile_url: str) -> CreatorSnapshot:
+        """
+        获取博主主页快照
+
+        只请求一次主页 HTML，同时解析博主信息与首页笔记；
+        短时间内同一账号对同一博主的重复调用直接复用缓存；
+        缓存与调用方各持一份深拷贝，调用方修改返回值不会影响缓存
+        """
+        clean_url = profile_url.strip().split("?")[0]
+        try:
+            user_key = self._extract_user_id_from_url(clean_url)
+        except ValueError:
+            user_key = clean_url
+        cache_key = (cookie_identity(self.cookie, "xhs"), user_key)
+
+        cached = _snapshot_cache.get(cache_key)
+        if cached and cached[0] > time.monotonic():
+            return copy.deepcopy(cached[1])
+
+        html_content, clean_url = await self.fetch_homepage_html(profile_url)
+        initial_state = self._parse_initial_state(html_content)
+
+        snapshot = CreatorSnapshot(userId=user_key)
+        try:
+            snapshot.profile = self._build_user_profile(initial_state, clean_url)
+        except Exception as e:
+            snapshot.profileError = str(e)
+
+        try:
+            notes, _, cursor, has_more = self._extract_state_notes(initial_state)
+            snapshot.notes = notes
+            snapshot.cursor = cursor
+            snapshot.hasMore = has_more
+        except Exception:
+            pass
+
+        if snapshot.profile or snapshot.notes:
+            for key in [k for k, (expires_at, _) in _snapshot_cache.items() if expires_at <= time.monotonic()]:
+                _snapshot_cache.pop(key, None)
+            _snapshot_cache[cache_key] = (time.monotonic() + settings.CREATOR_SNAPSHOT_TTL, copy.deepcopy(snapshot))
+
+        return snapshot
+
+    async def collect_creator_profile(self, profile_url: str) -> NoteRecord:
+        """采集博主信息（复用主页快照）"""
+        snapshot = await self.fetch_creator_snapshot(profile_url)
+        if not snapshot.profile:
+            raise Exception(snapshot.profileError or "未找到 userPageData 数据")
+        return snapshot.profile
+
     def extract_note_list(self, html_content: str, max_notes: int = 20) -> Tuple[List[NoteInfo], str]:
         """
         从主页 HTML 中提取笔记列表
@@ -590,9 +821,22 @@ class XhsCollector:
         # 格式1: window.__INITIAL_STATE__={...}</script>
         # 格式2: window.__INITIAL_STATE__ = {...};
         initial_state = self._parse_initial_state(html_content)
+        note_list, user_home_page, _, _ = self._extract_state_notes(initial_state)
+        
+        # 限制数量
+        return note_list[:max_notes], user_home_page
+
+    def _extract_state_notes(self, initial_state: Dict[str, Any]) -> Tuple[List[NoteInfo], str, str, bool]:
+        """
+        从主页 __INITIAL_STATE__ 中提取首页笔记
         
-        # 提取笔记数据
-        notes_data = initial_state.get("user", {}).get("userPageData", {}).get("notes", [])
+        Returns:
+            (笔记列表, 用户主页链接, 下一页 cursor, 是否还有更多)
+        """
+        user_state = initial_state.get("user", {}) if isinstance(initial_state, dict) else {}
+        
+        # 提取笔记数据（userPageData.notes 或 user.notes）
+        notes_data = (user_state.get("userPageData") or {}).get("notes") or user_state.get("notes") or []
         
         if not notes_data or not isinstance(notes_data, list):
             raise Exception("未找到笔记数据")
@@ -600,7 +844,13 @@ class XhsCollector:
         first_notes_array = notes_data[0] if notes_data else []
         
         if not isinstance(first_notes_array, list) or len(first_notes_array) == 0:
-            return [], ""
+            return [], "", "", False
+        
+        # 分页信息
+        note_queries = user_state.get("noteQueries") or []
+        first_query = note_queries[0] if note_queries and isinstance(note_queries[0], dict) else {}
+        cursor = first_query.get("cursor") or ""
+        has_more = bool(first_query.get("hasMore"))
         
         # 提取用户信息
         first_note = first_notes_array[0].get("noteCard", {}) if first_notes_array else {}
@@ -614,8 +864,8 @@ class XhsCollector:
         note_list: List[NoteInfo] = []
         for note_item in first_notes_array:
             note_card = note_item.get("noteCard", {})
-            note_id = note_card.get("noteId", "")
-            xsec_token = note_card.get("xsecToken", "")
+            note_id = note_card.get("noteId", "") or note_item.get("id", "")
+            xsec_token = note_card.get("xsecToken", "") or note_item.get("xsecToken", "")
             
             if note_id and xsec_token:
                 note_list.append(NoteInfo(
@@ -626,11 +876,12 @@ class XhsCollector:
                     userNickname=user_nickname,
                     userId=user_id,
                     userAvatar=user_avatar,
-                    userHomePage=user_home_page
+                    userHomePage=user_home_page,
+                    **self._extract_list_metrics(note_card)
                 ))
         
-        # 限制数量
-        return note_list[:max_notes], user_home_page
+        token_cache.put_many(note_list)
+        return note_list, user_home_page, cursor, has_more
 
     def extract_search_notes(self, html_content: str) -> List[NoteInfo]:
         """从搜索页 HTML 中提取笔记列表"""
@@ -653,6 +904,7 @@ class XhsCollector:
             if note_info:
                 note_list.append(note_info)
 
+        token_cache.put_many(note_list)
         return note_list
 
     async def search_notes_via_html(self, keyword: str, max_notes: int = 20) -> List[NoteInfo]:
@@ -661,9 +913,20 @@ class XhsCollector:
         notes = self.extract_search_notes(html_content)
         return notes[:max_notes]
 
+    async def _search_page_via_html(self, keyword: str) -> Tuple[List[NoteInfo], bool, str]:
+        """搜索页 HTML 数据源（返回格式与 search_notes_via_api 一致）"""
+        notes = await self.search_notes_via_html(keyword, max_notes=50)
+        if not notes:
+            raise Exception("搜索页 HTML 中未找到笔记数据")
+        return notes, False, ""
+
     def extract_user_profile(self, html_content: str, profile_url: str) -> NoteRecord:
         """从主页 HTML 中提取博主信息"""
         initial_state = self._parse_initial_state(html_content)
+        return self._build_user_profile(initial_state, profile_url)
+
+    def _build_user_profile(self, initial_state: Dict[str, Any], profile_url: str) -> NoteRecord:
+        """从主页 __INITIAL_STATE__ 中构造博主信息记录"""
         user_page_data = initial_state.get("user", {}).get("userPageData")
 
         if not user_page_data:
@@ -741,21 +1004,21 @@ class XhsCollector:
         keyword: str,
         max_notes: int = 20,
         sort: str = "general",
-        note_type: int = 0
+        note_type: int = 0,
+        note_filter: Optional[NoteFilter] = None
     ) -> List[NoteInfo]:
-        """根据关键词分页获取笔记列表"""
+        """根据关键词分页获取笔记列表（筛选条件在翻页过程中执行）"""
         keyword = keyword.strip()
-        notes: List[NoteInfo] = []
+        selector = NoteSelector(note_filter, max_notes)
         seen_ids = set()
         search_id = ""
         page = 1
 
-        while len(notes) < max_notes:
-            remaining = max_notes - len(notes)
-            page_size = min(20, remaining)
+        while not selector.done:
+            page_size = 20 if note_filter else min(20, max_notes - len(seen_ids))
 
-            try:
-                page_notes, has_more, new_search_id = await self.search_notes_via_api(
+            def search_via_api(page=page, page_size=page_size, search_id=search_id):
+                return self.search_notes_via_api(
                     keyword=keyword,
                     page=page,
                     page_size=page_size,
@@ -763,10 +1026,19 @@ class XhsCollector:
                     note_type=note_type,
                     search_id=search_id
                 )
-            except Exception:
-                if page == 1:
-                    return await self.search_notes_via_html(keyword, max_notes)
-                raise
+
+            if page == 1:
+                # 首页由数据源路由选择签名 API 或搜索页 HTML（HTML 结果不支持翻页）
+                page_notes, has_more, new_search_id = await source_router.run(
+                    "xhs_search",
+                    cookie_identity(self.cookie, "xhs"),
+                    {
+                        "api": search_via_api,
+                        "html": lambda: self._search_page_via_html(keyword),
+                    }
+                )
+            else:
+                page_notes, has_more, new_search_id = await search_via_api()
 
             if not page_notes:
                 break
@@ -775,8 +1047,8 @@ class XhsCollector:
                 if note_info.noteId in seen_ids:
                     continue
                 seen_ids.add(note_info.noteId)
-                notes.append(note_info)
-                if len(notes) >= max_notes:
+                selector.offer(note_info, note_info_metrics(note_info))
+                if selector.done:
                     break
 
             if not has_more:
@@ -785,18 +1057,38 @@ class XhsCollector:
             search_id = new_search_id or search_id
             page += 1
 
-        return notes
+        return selector.results()
     
-    async def fetch_note_detail(self, note_info: NoteInfo) -> Optional[Dict[str, Any]]:
+    async def fetch_note_detail(self, note_info: NoteInfo, fallback: bool = True) -> Optional[Dict[str, Any]]:
         """
         获取笔记详情
         
+        由数据源路由在 feed API 与笔记详情页 HTML（noteDetailMap）之间选择，
+        一个数据源失败时自动尝试另一个
+        
         Args:
             note_info: 笔记信息
+            fallback: 为 False 时只请求排序最前的数据源（由外层重试时使用）
             
         Returns:
-            feed API 响应数据
+            feed API 响应数据（HTML 数据源会转换为相同结构）
         """
+        # 同一笔记的并发请求只发起一次
+        return await request_coalescer.run(
+            "xhs", "note_detail", note_info.noteId, self.identity,
+            lambda: source_router.run(
+                "xhs_note_detail",
+                self.identity,
+                {
+                    "api": lambda: self.fetch_note_detail_via_api(note_info),
+                    "html": lambda: self.fetch_note_detail_via_html(note_info),
+                },
+                fallback=fallback
+            )
+        )
+
+    async def fetch_note_detail_via_api(self, note_info: NoteInfo) -> Dict[str, Any]:
+        """通过 feed API 获取笔记详情"""
         api_url = "https://edith.xiaohongshu.com/api/sns/web/v1/feed"
         
         payload = {
@@ -829,25 +1121,64 @@ class XhsCollector:
         }
         headers.update(sign_headers)
         
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(api_url, headers=headers, json=payload)
-            
-            if response.status_code == 406:
-                raise Exception(f"签名验证失败 (406)")
-            
-            if response.status_code != 200:
-                raise Exception(f"feed 请求失败: HTTP {response.status_code}")
-            
+        response, data = await self._request("POST", api_url, headers=headers, json=payload)
+        
+        if response.status_code == 406:
+            raise Exception(f"签名验证失败 (406)")
+        
+        if response.status_code != 200:
+            raise Exception(f"feed 请求失败: HTTP {response.status_code}")
+        
+        if data is None:
             data = response.json()
-            
-            if data.get("code") == -100:
-                raise Exception("Cookie 已失效，请重新获取")
-            
-            if data.get("code") != 0:
-                raise Exception(f"feed 返回异常: {data.get('msg', data.get('code', 'unknown'))}")
-            
-            return data
+        
+        if data.get("code") == -100:
+            raise CookieInvalidError("Cookie 已失效，请重新获取")
+        
+        if data.get("code") != 0:
+            raise Exception(f"feed 返回异常: {data.get('msg', data.get('code', 'unknown'))}")
+        
+        # feed 请求成功说明 token 有效，刷新缓存
+        token_cache.put(note_info)
+        return data
     
+    async def fetch_note_detail_via_html(self, note_info: NoteInfo) -> Dict[str, Any]:
+        """通过笔记详情页 HTML 获取笔记详情，转换为 feed API 响应结构"""
+        note_url = f"https://www.xiaohongshu.com/explore/{note_info.noteId}"
+        if note_info.xsecToken:
+            note_url += f"?xsec_token={note_info.xsecToken}&xsec_source=pc_user"
+
+        html_content = await self.fetch_note_html(note_url)
+        initial_state = self._parse_initial_state(html_content)
+        note_state = initial_state.get("note") if isinstance(initial_state, dict) else {}
+        note_map = note_state.get("noteDetailMap") if isinstance(note_state, dict) else {}
+        note_entry = note_map.get(note_info.noteId) if isinstance(note_map, dict) else None
+        note_detail = (note_entry or {}).get("note") if isinstance(note_entry, dict) else None
+
+        if not isinstance(note_detail, dict) or not (note_detail.get("noteId") or note_detail.get("title") or note_detail.get("desc")):
+            raise Exception("笔记详情页中未找到笔记数据")
+
+        note_card = self._camel_to_snake_keys(note_detail)
+        interact_info = note_card.get("interact_info") or {}
+        if "share_count" not in interact_info and "shared_count" in interact_info:
+            interact_info["share_count"] = interact_info["shared_count"]
+        note_card.setdefault("note_id", note_info.noteId)
+        note_card.setdefault("xsec_token", note_info.xsecToken)
+
+        token_cache.put(note_info)
+        return {"code": 0, "data": {"items": [{"id": note_info.noteId, "note_card": note_card}]}}
+
+    def _camel_to_snake_keys(self, value: Any) -> Any:
+        """递归将字典键由 camelCase 转为 snake_case（页面数据 -> feed API 结构）"""
+        if isinstance(value, dict):
+            return {
+                re.sub(r'(?<!^)(?=[A-Z])', '_', key).lower() if isinstance(key, str) else key: self._camel_to_snake_keys(item)
+                for key, item in value.items()
+            }
+        if isinstance(value, list):
+            return [self._camel_to_snake_keys(item) for item in value]
+        return value
+
     def process_note_detail(self, feed_data: Dict[str, Any], note_info: NoteInfo) -> NoteRecord:
         """
         处理笔记详情，转换为飞书表格记录格式
@@ -943,93 +1274,230 @@ class XhsCollector:
             "发布时间": publish_time
         })
     
-    async def collect_all_notes(self, profile_url: str, max_notes: int = 20) -> Tuple[List[NoteRecord], int, int, List[str]]:
+    def process_note_info(self, note_info: NoteInfo) -> NoteRecord:
+        """
+        仅根据列表数据构造飞书表格记录（列表模式）
+
+        列表接口不返回的字段（正文、标签、图片、视频等）不会出现在 fields 中
+        """
+        note_url = f"https://www.xiaohongshu.com/explore/{note_info.noteId}"
+        if note_info.xsecToken:
+            note_url += f"?xsec_token={note_info.xsecToken}&xsec_source=pc_user"
+
+        user_home_page = note_info.userHomePage or (
+            f"https://www.xiaohongshu.com/user/profile/{note_info.userId}" if note_info.userId else ""
+        )
+
+        candidates = {
+            "笔记封面图链接": note_info.coverUrl,
+            "笔记标题": note_info.displayTitle,
+            "笔记类型": note_info.type,
+            "笔记链接": note_url,
+            "账号名称": note_info.userNickname,
+            "主页链接": user_home_page,
+            "头像链接": note_info.userAvatar,
+            "分享数": note_info.shareCount,
+            "点赞数": note_info.likedCount,
+            "收藏数": note_info.collectedCount,
+            "评论数": note_info.commentCount,
+            "发布时间": note_info.publishTime,
+        }
+        fields = {key: value for key, value in candidates.items() if value not in ("", None)}
+        return NoteRecord(fields=fields)
+
+    def _build_list_records(self, note_list: List[NoteInfo]) -> Tuple[List[NoteRecord], int, int, List[str]]:
+        """列表模式：直接由列表数据生成记录，不请求 feed"""
+        records = [self.process_note_info(note_info) for note_info in note_list]
+        return records, len(records), 0, []
+
+    async def _emit_records(
+        self,
+        result: Tuple[List[NoteRecord], int, int, List[str]],
+        on_record: Optional[RecordCallback]
+    ) -> Tuple[List[NoteRecord], int, int, List[str]]:
+        """将已生成的记录逐条交给回调"""
+        if on_record:
+            for record in result[0]:
+                await on_record(record)
+        return result
+
+    async def collect_all_notes(
+        self,
+        profile_url: str,
+        max_notes: int = 20,
+        mode: str = "detail",
+        note_filter: Optional[NoteFilter] = None,
+        on_record: Optional[RecordCallback] = None
+    ) -> Tuple[List[NoteRecord], int, int, List[str]]:
         """
         采集博主所有笔记
         
         Args:
             profile_url: 博主主页链接
             max_notes: 最大采集数量
+            mode: 采集模式（detail 逐条请求详情 / list 仅使用列表数据）
+            note_filter: 筛选条件（在列表阶段执行，只对命中的笔记请求详情）
+            on_record: 每采集到一条记录时调用（用于增量输出）
             
         Returns:
             (记录列表, 成功数量, 失败数量, 失败的笔记ID列表)
         """
-        # 1. 通过 API 获取笔记列表（推荐方式，可获取 noteId）
-        note_list = await self.fetch_notes_via_api(profile_url, max_notes)
+        # 1. 获取笔记列表：首页笔记取自主页快照，后续页通过 user_posted API 获取
+        snapshot = None
+        try:
+            snapshot = await self.fetch_creator_snapshot(profile_url)
+        except Exception as e:
+            print(f"获取主页快照失败，改用笔记列表 API: {e}")
+        note_list = await self.fetch_notes_via_api(profile_url, max_notes, note_filter, snapshot)
         
         if not note_list:
             return [], 0, 0, []
         
-        # 3. 循环采集每条笔记详情
-        records: List[NoteRecord] = []
-        failed_note_ids: List[str] = []
-        success_count = 0
-        fail_count = 0
-        
-        for index, note_info in enumerate(note_list):
-            try:
-                # 获取笔记详情
-                feed_data = await self.fetch_note_detail(note_info)
-                
-                if feed_data:
-                    # 处理数据
-                    record = self.process_note_detail(feed_data, note_info)
-                    records.append(record)
-                    success_count += 1
-                else:
-                    failed_note_ids.append(note_info.noteId)
-                    fail_count += 1
-                    
-            except Exception as e:
-                failed_note_ids.append(note_info.noteId)
-                fail_count += 1
-                print(f"采集笔记 {note_info.noteId} 失败: {e}")
-            
-            # 智能延迟（非最后一条）
-            if index < len(note_list) - 1:
-                await self._get_smart_delay(index)
+        # 2. 列表模式直接返回列表数据
+        if mode == "list":
+            return await self._emit_records(self._build_list_records(note_list), on_record)
         
-        return records, success_count, fail_count, failed_note_ids
+        # 3. 循环采集每条笔记详情
+        return await self._collect_note_details(note_list, max_notes, note_filter, on_record)
 
     async def collect_notes_by_keyword(
         self,
         keyword: str,
         max_notes: int = 20,
         sort: str = "general",
-        note_type: int = 0
+        note_type: int = 0,
+        mode: str = "detail",
+        note_filter: Optional[NoteFilter] = None,
+        on_record: Optional[RecordCallback] = None
     ) -> Tuple[List[NoteRecord], int, int, List[str]]:
         """根据关键词采集笔记详情"""
-        note_list = await self.fetch_notes_by_keyword(keyword, max_notes, sort, note_type)
+        note_list = await self.fetch_notes_by_keyword(keyword, max_notes, sort, note_type, note_filter)
 
         if not note_list:
             return [], 0, 0, []
 
+        if mode == "list":
+            return await self._emit_records(self._build_list_records(note_list), on_record)
+
+        return await self._collect_note_details(note_list, max_notes, note_filter, on_record, ensure_token=True)
+
+    async def _collect_note_details(
+        self,
+        note_list: List[NoteInfo],
+        max_notes: int,
+        note_filter: Optional[NoteFilter],
+        on_record: Optional[RecordCallback],
+        ensure_token: bool = False
+    ) -> Tuple[List[NoteRecord], int, int, List[str]]:
+        """
+        逐条请求笔记详情并生成记录
+
+        每条笔记按错误类型重试；重试后仍因临时错误失败的笔记在全部笔记处理完后再统一重试一轮，
+        Cookie 失效时终止整个任务；请求时间预算不够再采集一条笔记时停止，返回已采集的记录
+
+        Returns:
+            (记录列表, 成功数量, 失败数量, 失败的笔记ID列表)
+        """
+        selector = NoteSelector(note_filter, max_notes)
         records: List[NoteRecord] = []
         failed_note_ids: List[str] = []
-        success_count = 0
-        fail_count = 0
+        deferred: List[NoteInfo] = []
+        deadline = current_deadline()
+        started = time.monotonic()
+        processed = 0
 
-        for index, note_info in enumerate(note_list):
+        async def collect(note_info: NoteInfo, final: bool) -> None:
             try:
-                note_info = await self._ensure_note_xsec_token(note_info)
-                feed_data = await self.fetch_note_detail(note_info)
-
-                if feed_data:
-                    record = self.process_note_detail(feed_data, note_info)
-                    records.append(record)
-                    success_count += 1
-                else:
-                    failed_note_ids.append(note_info.noteId)
-                    fail_count += 1
+                if ensure_token:
+                    note_info = await self._ensure_note_xsec_token(note_info)
+                record = await self.collect_note_record(note_info, final=final)
+            except DeadlineExceeded:
+                raise
             except Exception as e:
+                if retry_engine.classify(e) == ACTION_ABORT:
+                    raise
+                if not final and retry_engine.deferrable(e):
+                    deferred.append(note_info)
+                    retry_engine.record_deferred()
+                    print(f"采集笔记 {note_info.noteId} 失败，稍后重试: {e}")
+                    return
                 failed_note_ids.append(note_info.noteId)
-                fail_count += 1
                 print(f"采集笔记 {note_info.noteId} 失败: {e}")
+                return
+
+            if final:
+                retry_engine.record_deferred(recovered=True)
+            # 列表中缺失的筛选字段在此复核
+            if not selector.matches(record_metrics(record)):
+                self.filtered_count += 1
+                print(f"笔记 {note_info.noteId} 详情不符合筛选条件，已跳过")
+                return
+            records.append(record)
+            if on_record:
+                await on_record(record)
+
+        async def collect_pass(note_infos: List[NoteInfo], final: bool) -> int:
+            """依次采集，返回处理完的笔记数（时间预算用完时提前返回）"""
+            nonlocal processed
+            for index, note_info in enumerate(note_infos):
+                # 按本次已处理笔记的平均耗时估算，剩余时间预算不够再采集一条时停止
+                if processed and not deadline.allows((time.monotonic() - started) / processed):
+                    deadline.mark_partial(f"剩余时间不足，未采集 {len(note_infos) - index} 条笔记")
+                    return index
+                try:
+                    await collect(note_info, final)
+                except DeadlineExceeded:
+                    deadline.mark_partial("请求时间预算已用完")
+                    return index
+                processed += 1
+                # 智能延迟（非最后一条）
+                if index < len(note_infos) - 1:
+                    await self._get_smart_delay(index)
+            return len(note_infos)
+
+        retry_list: List[NoteInfo] = []
+        if await collect_pass(note_list, final=False) == len(note_list) and deferred:
+            print(f"{len(deferred)} 条笔记延后重试")
+            retry_list, deferred = deferred, []
+            await self._random_delay(*settings.RETRY_DEFERRED_DELAY)
+            retry_list = retry_list[await collect_pass(retry_list, final=True):]
+        # 时间预算用完未能重试的笔记计为失败
+        failed_note_ids.extend(note_info.noteId for note_info in deferred + retry_list)
+        # 列表中缺失排序字段（如主页列表无发布时间）时，按详情中的指标重新排序
+        records = selector.rank([(record_metrics(record), record) for record in records])
+
+        return records, len(records), len(failed_note_ids), failed_note_ids
+
+    async def collect_note_record(self, note_info: NoteInfo, final: bool = False) -> NoteRecord:
+        """
+        获取单条笔记详情并生成记录
 
-            if index < len(note_list) - 1:
-                await self._get_smart_delay(index)
-
-        return records, success_count, fail_count, failed_note_ids
+        按错误类型重试：签名失败重新签名，xsec_token 失效时从笔记详情页重新获取，超时 / 5xx 退避。
+        数据源回退只在第一次尝试中进行，之后的重试只请求排序最前的数据源；
+        final 为 True（任务末尾的延后重试）时只尝试一次，单条笔记的上游请求数有固定上限
+        """
+        current = note_info
+        attempts = 0
+
+        async def refresh_token() -> None:
+            nonlocal current
+            current = await self._refresh_note_xsec_token(current)
+
+        async def fetch() -> Optional[Dict[str, Any]]:
+            nonlocal attempts
+            attempts += 1
+            return await self.fetch_note_detail(current, fallback=attempts == 1 and not final)
+
+        feed_data = await retry_engine.run(fetch, refresh_token=refresh_token, max_attempts=1 if final else None)
+        if not feed_data:
+            raise Exception("未获取到笔记详情")
+        return self.process_note_detail(feed_data, current)
+
+    async def _refresh_note_xsec_token(self, note_info: NoteInfo) -> NoteInfo:
+        """xsec_token 失效时从笔记详情页重新获取"""
+        token_cache.invalidate(note_info.noteId)
+        fresh_info = await self.build_note_info_from_url(f"https://www.xiaohongshu.com/explore/{note_info.noteId}")
+        return note_info.copy(update={"xsecToken": fresh_info.xsecToken})
 
 
 def parse_feishu_table_url(url: str) -> Tuple[str, str]:
@@ -0,0 +1,75 @@
+"""
+小红书 xsec_token 缓存模块
+按 noteId 缓存列表/搜索/详情响应中拿到的 xsec_token 与基础信息，避免重复请求笔记详情页
+"""
+import time
+from collections import OrderedDict
+from typing import Iterable, Optional, Tuple
+
+from app.core.config import settings
+from app.models.schemas import NoteInfo
+
+
+class XsecTokenCache:
+    """xsec_token 缓存（LRU + TTL）"""
+
+    def __init__(self, max_size: int = 5000, ttl: float = 3600.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, NoteInfo]]" = OrderedDict()
+
+    def get(self, note_id: str) -> Optional[NoteInfo]:
+        """获取未过期的缓存记录"""
+        entry = self._entries.get(note_id)
+        if not entry:
+            return None
+
+        expires_at, note_info = entry
+        if expires_at < time.monotonic():
+            self._entries.pop(note_id, None)
+            return None
+
+        self._entries.move_to_end(note_id)
+        return note_info
+
+    def put(self, note_info: NoteInfo) -> None:
+        """写入缓存，已有记录中的非空字段不会被空值覆盖"""
+        if not note_info.noteId or not note_info.xsecToken:
+            return
+
+        cached = self.get(note_info.noteId)
+        if cached:
+            updates = {
+                key: value
+                for key, value in note_info.dict().items()
+                if value not in ("", None)
+            }
+            note_info = cached.copy(update=updates)
+
+        self._entries[note_info.noteId] = (time.monotonic() + self.ttl, note_info)
+        self._entries.move_to_end(note_info.noteId)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def put_many(self, notes: Iterable[NoteInfo]) -> None:
+        """批量写入缓存"""
+        for note_info in notes:
+            self.put(note_info)
+
+    def invalidate(self, note_id: str) -> None:
+        """xsec_token 失效时删除缓存记录"""
+        self._entries.pop(note_id, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# 全局缓存实例（进程内共享）
+token_cache = XsecTokenCache(
+    max_size=settings.XSEC_TOKEN_CACHE_SIZE,
+    ttl=settings.XSEC_TOKEN_CACHE_TTL,
+)
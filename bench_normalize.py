@@ -0,0 +1,305 @@
+"""
+飞书写入规范化基准测试
+对比编译计划之前的逐字段解析实现（LegacyNormalizer）与当前的编译规范化计划，
+规范化 10000 条记录（20 个字段的表格）并校验两者结果一致
+
+运行方式: python bench_normalize.py
+"""
+import time
+
+from app.services.feishu_writer import FIELD_UI_TYPE_MAP, FeishuWriter, _plan_cache
+
+
+RECORD_COUNT = 10000
+ROUNDS = 3
+
+
+def _options(*names):
+    return {"options": [{"name": name} for name in names]}
+
+
+def build_field_map():
+    """模拟笔记采集表的 20 个字段"""
+    fields = [
+        ("笔记ID", 1, None),
+        ("笔记链接", 1, None),
+        ("标题", 1, None),
+        ("文案", 1, None),
+        ("笔记类型1", 3, _options("图文", "视频")),
+        ("标签", 4, _options("穿搭", "美食", "旅行", "护肤")),
+        ("点赞数", 2, None),
+        ("收藏数", 2, None),
+        ("评论数", 2, None),
+        ("分享数", 2, None),
+        ("发布时间", 5, None),
+        ("更新时间", 5, None),
+        ("博主昵称", 3, _options("博主A", "博主B")),
+        ("博主ID", 1, None),
+        ("主页链接", 1, None),
+        ("头像URL", 1, None),
+        ("笔记封面图链接", 1, None),
+        ("IP属地", 3, _options("上海", "北京", "广东")),
+        ("附件", 17, None),
+        ("互动总数", 20, None),
+    ]
+    return {
+        name: {"field_id": f"fld{index:03d}", "field_name": name, "type": field_type, "property": prop}
+        for index, (name, field_type, prop) in enumerate(fields)
+    }
+
+
+def build_records(count):
+    records = []
+    for i in range(count):
+        records.append({"fields": {
+            "笔记ID": f"65a{i:08d}",
+            "笔记链接": {"text": "链接", "link": f"https://www.xiaohongshu.com/explore/65a{i:08d}"},
+            "笔记标题": f"第 {i} 条笔记",
+            "笔记内容": "今天分享一下我的日常穿搭 #穿搭 #日常",
+            "笔记类型": "video" if i % 3 == 0 else "normal",
+            "笔记标签": ["穿搭", "日常"] if i % 2 else "美食，旅行",
+            "点赞数": "1,234" if i % 4 == 0 else 1234,
+            "收藏数": 56,
+            "评论数": "78",
+            "分享数": None,
+            "发布时间": 1700000000 + i,
+            "更新时间": str(1700000000000 + i),
+            "账号名称": "博主A" if i % 2 else "博主B",
+            "博主ID": "5f0000000000000000000001",
+            "主页链接": "https://www.xiaohongshu.com/user/profile/5f0000000000000000000001",
+            "头像链接": "https://sns-avatar.xhscdn.com/avatar/xxx.jpg",
+            "图片链接": "https://sns-webpic.xhscdn.com/xxx.jpg",
+            "IP属地": "上海",
+            "附件": "not-an-attachment",
+            "互动总数": 1368,
+        }})
+    return records
+
+
+class LegacyNormalizer:
+    """
+    编译计划之前逐条记录、逐个字段解析名称与类型的实现（原 FeishuWriter 中的代码，原样保留作为对照）
+    """
+
+    def _normalize_records(self, records, field_map):
+        normalized_records = []
+
+        for record in records:
+            fields = record.get("fields", {}) if isinstance(record, dict) else {}
+            normalized_fields = {}
+
+            for field_name, value in fields.items():
+                resolved_name = self._resolve_field_name(field_name, field_map)
+                if not resolved_name:
+                    continue
+
+                field_meta = field_map.get(resolved_name)
+                normalized_value = self._normalize_field_value(resolved_name, value, field_meta)
+                if normalized_value is not None:
+                    normalized_fields[resolved_name] = normalized_value
+
+            normalized_records.append({
+                **record,
+                "fields": normalized_fields
+            })
+
+        return normalized_records
+
+    def _normalize_field_value(self, field_name, value, field_meta):
+        if value is None:
+            return None
+
+        if not field_meta:
+            return value
+
+        field_type = self._resolve_field_type(field_meta)
+        field_property = field_meta.get("property") or {}
+        options = field_property.get("options") or []
+        option_names = {opt.get("name") for opt in options if opt.get("name")}
+
+        if field_type == 20:
+            return None
+
+        if field_type == 1:
+            if isinstance(value, list):
+                return "\n".join(self._to_text(v) for v in value if self._to_text(v))
+            return self._to_text(value)
+
+        if field_type == 2:
+            return self._to_number(value)
+
+        if field_type == 3:
+            normalized = self._to_single_select_value(field_name, value, option_names)
+            return normalized
+
+        if field_type == 4:
+            normalized = self._to_multi_select_value(field_name, value, option_names)
+            return normalized
+
+        if field_type == 5:
+            return self._to_timestamp(value)
+
+        if field_type == 17:
+            if isinstance(value, list) and all(isinstance(item, dict) for item in value):
+                return value
+            return None
+
+        return value
+
+    def _to_text(self, value):
+        if value is None:
+            return ""
+        if isinstance(value, dict):
+            for key in ("text", "name", "value", "title", "url"):
+                if key in value:
+                    return str(value.get(key, "")).strip()
+            return ""
+        return str(value).strip()
+
+    def _to_number(self, value):
+        if value is None or value == "":
+            return None
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return value
+        text = self._to_text(value).replace(",", "")
+        try:
+            number = float(text)
+            return int(number) if number.is_integer() else number
+        except ValueError:
+            return None
+
+    def _to_timestamp(self, value):
+        if value is None or value == "":
+            return None
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            value_int = int(value)
+            if value_int < 100000000000:
+                return value_int * 1000
+            return value_int
+        text = self._to_text(value)
+        if text.isdigit():
+            value_int = int(text)
+            if value_int < 100000000000:
+                return value_int * 1000
+            return value_int
+        return None
+
+    def _resolve_field_type(self, field_meta):
+        if not field_meta:
+            return None
+
+        field_type = field_meta.get("type") or field_meta.get("field_type")
+        if isinstance(field_type, str) and field_type.isdigit():
+            field_type = int(field_type)
+
+        if isinstance(field_type, int):
+            return field_type
+
+        ui_type = field_meta.get("ui_type") or field_meta.get("uiType")
+        if ui_type:
+            return FIELD_UI_TYPE_MAP.get(ui_type)
+
+        return None
+
+    def _to_single_select_value(self, field_name, value, option_names):
+        if isinstance(value, list):
+            value = value[0] if value else ""
+        normalized = self._to_text(value)
+        normalized = self._normalize_note_type(field_name, normalized, option_names)
+        if option_names and normalized not in option_names:
+            if field_name in self._allow_single_select_any_value():
+                return normalized or None
+            return None
+        return normalized or None
+
+    def _to_multi_select_value(self, field_name, value, option_names):
+        values = []
+        if isinstance(value, list):
+            values = [self._to_text(v) for v in value if self._to_text(v)]
+        elif isinstance(value, str):
+            raw = value.replace("，", ",").replace("\n", ",")
+            values = [v.strip() for v in raw.split(",") if v.strip()]
+        else:
+            values = [self._to_text(value)] if self._to_text(value) else []
+
+        if field_name in ("笔记标签", "标签"):
+            values = [self._to_text(v) for v in values if self._to_text(v)]
+
+        if option_names and field_name not in self._allow_multi_select_any_value():
+            values = [v for v in values if v in option_names]
+
+        return values or None
+
+    def _normalize_note_type(self, field_name, value, option_names):
+        if not field_name.startswith("笔记类型"):
+            return value
+
+        if value == "normal" and "图文" in option_names:
+            return "图文"
+        if value == "video" and "视频" in option_names:
+            return "视频"
+        return value
+
+    def _allow_single_select_any_value(self):
+        return {"账号名称", "博主昵称"}
+
+    def _allow_multi_select_any_value(self):
+        return {"笔记标签", "标签"}
+
+    def _resolve_field_name(self, field_name, field_map):
+        if field_name in field_map:
+            return field_name
+
+        aliases = self._field_aliases().get(field_name, [])
+        for alias in aliases:
+            if alias in field_map:
+                return alias
+        return None
+
+    def _field_aliases(self):
+        return {
+            "笔记类型": ["笔记类型", "笔记类型1"],
+            "笔记标签": ["笔记标签", "标签"],
+            "图片链接": ["图片链接", "笔记封面图链接"],
+            "笔记标题": ["笔记标题", "标题"],
+            "笔记内容": ["笔记内容", "文案", "笔记文案", "内容"],
+            "账号名称": ["账号名称", "博主昵称"],
+            "头像链接": ["头像链接", "头像URL", "头像地址"],
+            "博主昵称": ["账号名称", "博主昵称"],
+            "小红书号": ["小红书ID", "小红书号", "抖音号"],
+            "个人简介": ["简介", "个人简介"],
+            "获赞与收藏": ["赞藏总数", "获赞与收藏", "赞藏"],
+        }
+
+
+def bench(label, fn):
+    timings = []
+    result = None
+    for _ in range(ROUNDS):
+        started = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - started)
+    best = min(timings)
+    print(f"{label}: {best * 1000:.1f} ms（{RECORD_COUNT / best:,.0f} 条/秒）")
+    return result, best
+
+
+def main():
+    writer = FeishuWriter("bench_app", "bench_table", token="bench")
+    field_map = build_field_map()
+    records = build_records(RECORD_COUNT)
+
+    def compiled():
+        _plan_cache.clear()
+        return writer._normalize_records(records, field_map)
+
+    legacy = LegacyNormalizer()
+    baseline, baseline_time = bench("逐字段解析", lambda: legacy._normalize_records(records, field_map))
+    planned, planned_time = bench("编译计划", compiled)
+
+    assert baseline == planned, "两种方式的规范化结果不一致"
+    print(f"加速比: {baseline_time / planned_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()